@@ -11,8 +11,25 @@ import uuid
 from pathlib import Path
 import io
 import mimetypes
+from functools import partial
 from PIL import Image
 
+from utils.ocr_cache import file_digest, get_ocr_cache
+from utils.ocr_jobs import JOB_CANCELLED, JOB_INTERRUPTED, get_ocr_job_queue
+from utils.preview_store import MAX_PREVIEW_PAGES, get_preview_store
+from utils.ocr_utils import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_OCR_MODEL,
+    DONE,
+    FAILED,
+    MAX_CONCURRENCY,
+    RUNNING,
+    PENDING,
+    OCRRequestError,
+    ocr_document,
+    ocr_pdf_by_ranges,
+)
+
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -22,128 +39,11 @@ logger = logging.getLogger("MistralOCR")
 # Versión de la aplicación
 APP_VERSION = "1.0.0"
 
-# Configuración inicial de la página
-st.set_page_config(
-    layout="wide",
-    page_title="Mistral OCR App",
-    page_icon="🔍",
-    initial_sidebar_state="expanded",
-    menu_items={
-        "Get Help": "https://docs.mistral.ai/api/",
-        "Report a bug": "https://github.com/bladealex9848/OmniChat/issues",
-        "About": "Mistral OCR App v"
-        + APP_VERSION
-        + " - Desarrollada con Streamlit y Mistral AI API",
-    },
-)
-
-# Inicializar variables de estado de sesión para persistencia
-if "ocr_result" not in st.session_state:
-    st.session_state["ocr_result"] = []
-if "preview_src" not in st.session_state:
-    st.session_state["preview_src"] = []
-if "image_bytes" not in st.session_state:
-    st.session_state["image_bytes"] = []
-if "file_names" not in st.session_state:
-    st.session_state["file_names"] = []
-if "processing_complete" not in st.session_state:
-    st.session_state["processing_complete"] = False
-if "show_technical_details" not in st.session_state:
-    st.session_state["show_technical_details"] = False
-
-# Inyectar CSS personalizado
-st.markdown(
-    """
-<style>
-    .main-header {
-        font-size: 2.5rem;
-        color: #1E88E5;
-        margin-bottom: 1rem;
-    }
-    .sub-header {
-        font-size: 1.5rem;
-        color: #0D47A1;
-        margin-top: 2rem;
-        margin-bottom: 1rem;
-    }
-    .info-box {
-        background-color: #E3F2FD;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin-bottom: 1rem;
-    }
-    .success-box {
-        background-color: #E8F5E9;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin-bottom: 1rem;
-    }
-    .error-box {
-        background-color: #FFEBEE;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin-bottom: 1rem;
-    }
-    .stButton>button {
-        background-color: #1976D2;
-        color: white;
-        font-weight: 500;
-    }
-    .stButton>button:hover {
-        background-color: #1565C0;
-        color: white;
-    }
-    .download-button {
-        display: inline-block;
-        padding: 0.5rem 1rem;
-        background-color: #1976D2;
-        color: white;
-        text-decoration: none;
-        border-radius: 4px;
-        font-weight: 500;
-        text-align: center;
-        margin: 0.25rem 0;
-        width: 100%;
-    }
-    .download-button:hover {
-        background-color: #1565C0;
-        color: white;
-    }
-    .technical-info {
-        font-family: monospace;
-        background-color: #f5f5f5;
-        padding: 10px;
-        border-radius: 4px;
-        margin: 10px 0;
-        white-space: pre-wrap;
-    }
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 8px;
-    }
-    .stTabs [data-baseweb="tab"] {
-        background-color: #f0f2f6;
-        border-radius: 4px 4px 0px 0px;
-        padding: 10px 16px;
-        font-weight: 500;
-    }
-    .stTabs [aria-selected="true"] {
-        background-color: #1976D2 !important;
-        color: white !important;
-    }
-    /* Mejoras para visualización en dispositivos móviles */
-    @media (max-width: 768px) {
-        .stButton>button {
-            width: 100%;
-            margin: 5px 0;
-        }
-        .st-emotion-cache-16txtl3 {
-            padding: 1rem 0.5rem;
-        }
-    }
-</style>
-""",
-    unsafe_allow_html=True,
-)
+# Trabajo OCR en curso: en la sesión y en la URL (`?ocr_job=...`) para
+# recuperarlo al recargar la página
+JOB_STATE_KEY = "ocr_job_id"
+JOB_QUERY_PARAM = "ocr_job"
+JOB_POLL_INTERVAL = 1.0
 
 # ====================== FUNCIONES UTILITARIAS ======================
 
@@ -354,11 +254,34 @@ def extract_all_text_fields(data, prefix="", max_depth=5, current_depth=0):
 # ====================== FUNCIONES DE PROCESAMIENTO OCR ======================
 
 
-def process_image_with_mistral_ocr(api_key, image_data, file_name):
+class _NullStatus:
+    """Sustituto de `st.status` para el procesamiento en hilos del lote (sin widgets)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def update(self, **kwargs):
+        pass
+
+
+def ocr_status(label, show_status=True):
+    """Devuelve `st.status` o, si `show_status` es False, un contexto sin interfaz."""
+    if show_status:
+        return st.status(label, expanded=True)
+    return _NullStatus()
+
+
+def process_image_with_mistral_ocr(api_key, image_data, file_name, show_status=True):
     """
     Procesa una imagen utilizando la API OCR de Mistral.
+
+    Con `show_status=False` no se crean widgets, de modo que puede llamarse
+    desde los hilos del procesamiento por lotes.
     """
-    with st.status("Procesando imagen con Mistral OCR...", expanded=True) as status:
+    with ocr_status("Procesando imagen con Mistral OCR...", show_status) as status:
         try:
             # Generar un ID único para el trabajo
             job_id = str(uuid.uuid4())
@@ -386,57 +309,19 @@ def process_image_with_mistral_ocr(api_key, image_data, file_name):
                     image_data if not hasattr(image_data, "read") else image_data.read()
                 )
 
-            # Codificar la imagen a base64
-            encoded_image = base64.b64encode(bytes_data).decode("utf-8")
-            image_url = f"data:{mime_type};base64,{encoded_image}"
-
-            # Preparar los datos para la solicitud
-            payload = {
-                "model": "mistral-ocr-latest",
-                "document": {"type": "image_url", "image_url": image_url},
-            }
-
-            # Configurar los headers
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-            }
-
             status.update(label="Enviando imagen a la API...")
 
-            # Hacer la solicitud a la API de Mistral con timeout
-            response = requests.post(
-                "https://api.mistral.ai/v1/ocr",
-                json=payload,
-                headers=headers,
-                timeout=60,  # 60 segundos de timeout para imágenes grandes
-            )
+            # Solicitud con reintentos ante 429/5xx (60 segundos de timeout por intento);
+            # el data URI se construye sin copias intermedias y las imágenes muy
+            # grandes se suben a la API de archivos
+            result = ocr_document(api_key, bytes_data, mime_type, file_name, timeout=60)
+            status.update(label="Imagen procesada correctamente", state="complete")
+            return extract_text_from_ocr_response(result)
 
-            # Revisar si la respuesta fue exitosa
-            if response.status_code == 200:
-                result = response.json()
-                status.update(label="Imagen procesada correctamente", state="complete")
-                return extract_text_from_ocr_response(result)
-            else:
-                error_message = (
-                    f"Error en API OCR (código {response.status_code}): {response.text}"
-                )
-                logger.error(error_message)
-                status.update(label="Error al procesar la imagen", state="error")
-                return {"error": error_message}
-
-        except requests.exceptions.Timeout:
-            error_message = (
-                "Timeout al procesar la imagen. La operación tomó demasiado tiempo."
-            )
+        except OCRRequestError as e:
+            error_message = str(e)
             logger.error(error_message)
-            status.update(label="Timeout al procesar la imagen", state="error")
-            return {"error": error_message}
-
-        except requests.exceptions.ConnectionError:
-            error_message = "Error de conexión al procesar la imagen. Comprueba tu conexión a internet."
-            logger.error(error_message)
-            status.update(label="Error de conexión", state="error")
+            status.update(label="Error al procesar la imagen", state="error")
             return {"error": error_message}
 
         except Exception as e:
@@ -446,11 +331,15 @@ def process_image_with_mistral_ocr(api_key, image_data, file_name):
             return {"error": error_message}
 
 
-def process_pdf_with_mistral_ocr(api_key, pdf_data, file_name):
+def process_pdf_with_mistral_ocr(api_key, pdf_data, file_name, show_status=True, ocr_cache=None):
     """
     Procesa un PDF utilizando la API OCR de Mistral.
+
+    Con `show_status=False` no se crean widgets, de modo que puede llamarse
+    desde los hilos del procesamiento por lotes. `ocr_cache` sustituye a la
+    caché OCR compartida (por ejemplo, por los puntos de control de un trabajo).
     """
-    with st.status("Procesando PDF con Mistral OCR...", expanded=True) as status:
+    with ocr_status("Procesando PDF con Mistral OCR...", show_status) as status:
         try:
             # Generar un ID único para el trabajo
             job_id = str(uuid.uuid4())
@@ -464,58 +353,33 @@ def process_pdf_with_mistral_ocr(api_key, pdf_data, file_name):
                 # Si ya es bytes, usarlo directamente
                 bytes_data = pdf_data
 
-            # Codificar el PDF a base64
-            encoded_pdf = base64.b64encode(bytes_data).decode("utf-8")
-            pdf_url = f"data:application/pdf;base64,{encoded_pdf}"
-
-            # Preparar los datos para la solicitud
-            payload = {
-                "model": "mistral-ocr-latest",
-                "document": {"type": "document_url", "document_url": pdf_url},
-            }
-
-            # Configurar los headers
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-            }
-
             status.update(label="Enviando PDF a la API...")
 
-            # Hacer la solicitud a la API de Mistral con timeout
-            response = requests.post(
-                "https://api.mistral.ai/v1/ocr",
-                json=payload,
-                headers=headers,
-                timeout=120,  # 120 segundos de timeout para PDFs grandes
+            # Los PDF grandes se dividen en rangos de páginas que se procesan en
+            # paralelo; solo se reintentan los rangos que fallan
+            result = ocr_pdf_by_ranges(
+                api_key, bytes_data, timeout=120, cache=ocr_cache or get_ocr_cache()
             )
-
-            # Revisar si la respuesta fue exitosa
-            if response.status_code == 200:
-                result = response.json()
-                status.update(label="PDF procesado correctamente", state="complete")
-                return extract_text_from_ocr_response(result)
-            else:
-                error_message = (
-                    f"Error en API OCR (código {response.status_code}): {response.text}"
+            ranges = result.get("ranges", [])
+            if result.get("cached"):
+                status.update(label="PDF recuperado de la caché OCR", state="complete")
+            elif len(ranges) > 1:
+                total_time = max(page_range["elapsed"] for page_range in ranges)
+                status.update(
+                    label=f"PDF procesado en {len(ranges)} rangos de páginas ({total_time:.1f} s)",
+                    state="complete",
                 )
-                logger.error(error_message)
-                status.update(label="Error al procesar el PDF", state="error")
-                return {"error": error_message}
-
-        except requests.exceptions.Timeout:
-            error_message = (
-                "Timeout al procesar el PDF. La operación tomó demasiado tiempo."
-            )
-            logger.error(error_message)
-            status.update(label="Timeout al procesar el PDF", state="error")
-            return {"error": error_message}
+            else:
+                status.update(label="PDF procesado correctamente", state="complete")
+            text_result = extract_text_from_ocr_response(result)
+            text_result["ranges"] = ranges
+            return text_result
 
-        except requests.exceptions.ConnectionError:
-            error_message = "Error de conexión al procesar el PDF. Comprueba tu conexión a internet."
+        except OCRRequestError as e:
+            error_message = str(e)
             logger.error(error_message)
-            status.update(label="Error de conexión", state="error")
-            return {"error": error_message}
+            status.update(label="Error al procesar el PDF", state="error")
+            return {"error": error_message, "ranges": e.ranges}
 
         except Exception as e:
             error_message = f"Error al procesar PDF: {str(e)}"
@@ -524,9 +388,20 @@ def process_pdf_with_mistral_ocr(api_key, pdf_data, file_name):
             return {"error": error_message}
 
 
-def process_document(api_key, source, source_type, optimize_images=True):
+def process_document(
+    api_key,
+    source,
+    source_type,
+    optimize_images=True,
+    show_status=True,
+    ocr_cache=None,
+    store_preview=True,
+):
     """
     Función principal para procesar un documento (imagen o PDF).
+
+    Con `store_preview=False` el archivo no se guarda en el almacén de vistas
+    previas (procesamiento sin interfaz desde `scripts/ocr_batch.py`).
     """
     file_bytes = None
     file_type = None
@@ -546,7 +421,7 @@ def process_document(api_key, source, source_type, optimize_images=True):
                 return {
                     "success": False,
                     "result_text": f"Tipo de archivo no soportado: {file_name}",
-                    "preview_src": "",
+                    "preview": None,
                     "file_name": file_name,
                     "file_bytes": None,
                     "raw_response": None,
@@ -561,7 +436,7 @@ def process_document(api_key, source, source_type, optimize_images=True):
             return {
                 "success": False,
                 "result_text": "Tipo de fuente desconocido.",
-                "preview_src": "",
+                "preview": None,
                 "file_name": "Error",
                 "file_bytes": None,
                 "raw_response": None,
@@ -574,7 +449,7 @@ def process_document(api_key, source, source_type, optimize_images=True):
                 return {
                     "success": False,
                     "result_text": "Procesamiento de PDF desde URL no implementado aún.",
-                    "preview_src": "",
+                    "preview": None,
                     "file_name": file_name,
                     "file_bytes": None,
                     "raw_response": None,
@@ -583,16 +458,20 @@ def process_document(api_key, source, source_type, optimize_images=True):
                 try:
                     # Procesar el PDF con la API de Mistral
                     ocr_response = process_pdf_with_mistral_ocr(
-                        api_key, source, file_name
+                        api_key, source, file_name, show_status, ocr_cache
+                    )
+                    # La vista previa se sirve desde disco; la sesión solo guarda la referencia
+                    preview = (
+                        get_preview_store().put(source, file_name, "application/pdf")
+                        if store_preview
+                        else None
                     )
-                    preview_src = f"data:application/pdf;base64,{base64.b64encode(source.read()).decode('utf-8')}"
-                    source.seek(0)  # Reiniciar el cursor del archivo
                 except Exception as e:
                     logger.error(f"Error al procesar PDF: {str(e)}")
                     return {
                         "success": False,
                         "result_text": f"Error al procesar el PDF: {str(e)}",
-                        "preview_src": "",
+                        "preview": None,
                         "file_name": file_name,
                         "file_bytes": None,
                         "raw_response": None,
@@ -603,7 +482,7 @@ def process_document(api_key, source, source_type, optimize_images=True):
                 return {
                     "success": False,
                     "result_text": "Procesamiento de imagen desde URL no implementado aún.",
-                    "preview_src": "",
+                    "preview": None,
                     "file_name": file_name,
                     "file_bytes": None,
                     "raw_response": None,
@@ -614,26 +493,54 @@ def process_document(api_key, source, source_type, optimize_images=True):
                     file_bytes = source.read()
                     source.seek(0)  # Reiniciar el cursor del archivo
 
-                    # Optimizar la imagen si está habilitado
-                    if optimize_images:
-                        file_bytes, mime_type = prepare_image_for_ocr(file_bytes)
-                    else:
+                    # La caché OCR se consulta con el archivo original y las opciones
+                    # de preprocesamiento, antes de optimizar la imagen
+                    ocr_cache = ocr_cache or get_ocr_cache()
+                    digest = file_digest(file_bytes)
+                    cache_options = {"optimize_images": optimize_images}
+                    cached_pages = ocr_cache.get(
+                        digest, DEFAULT_OCR_MODEL, options=cache_options
+                    )
+
+                    if cached_pages is not None:
                         mime_type = source.type
+                        ocr_response = {
+                            "text": "\n\n".join(cached_pages),
+                            "format": "markdown",
+                        }
+                    else:
+                        # Optimizar la imagen si está habilitado
+                        if optimize_images:
+                            file_bytes, mime_type = prepare_image_for_ocr(file_bytes)
+                        else:
+                            mime_type = source.type
+
+                        # Procesar la imagen con la API de Mistral
+                        ocr_response = process_image_with_mistral_ocr(
+                            api_key, file_bytes, file_name, show_status
+                        )
+                        if ocr_response.get("format") == "markdown":
+                            ocr_cache.set(
+                                digest,
+                                DEFAULT_OCR_MODEL,
+                                [ocr_response["text"]],
+                                options=cache_options,
+                            )
 
-                    # Procesar la imagen con la API de Mistral
-                    ocr_response = process_image_with_mistral_ocr(
-                        api_key, file_bytes, file_name
+                    # Preparar la vista previa (archivo original en disco)
+                    preview = (
+                        get_preview_store().put(
+                            source, file_name, source.type or mime_type
+                        )
+                        if store_preview
+                        else None
                     )
-
-                    # Preparar la vista previa
-                    encoded_image = base64.b64encode(file_bytes).decode("utf-8")
-                    preview_src = f"data:{mime_type};base64,{encoded_image}"
                 except Exception as e:
                     logger.error(f"Error al procesar imagen: {str(e)}")
                     return {
                         "success": False,
                         "result_text": f"Error al procesar la imagen: {str(e)}",
-                        "preview_src": "",
+                        "preview": None,
                         "file_name": file_name,
                         "file_bytes": None,
                         "raw_response": None,
@@ -642,7 +549,7 @@ def process_document(api_key, source, source_type, optimize_images=True):
             return {
                 "success": False,
                 "result_text": f"Tipo de archivo no soportado para {file_name}.",
-                "preview_src": "",
+                "preview": None,
                 "file_name": file_name,
                 "file_bytes": None,
                 "raw_response": None,
@@ -669,10 +576,12 @@ def process_document(api_key, source, source_type, optimize_images=True):
         return {
             "success": success,
             "result_text": result_text,
-            "preview_src": preview_src if "preview_src" in locals() else "",
+            "preview": preview if "preview" in locals() else None,
             "file_name": file_name,
             "file_bytes": file_bytes,
             "raw_response": raw_response,
+            # Duración y estado de cada rango de páginas (PDF)
+            "ocr_ranges": ocr_response.get("ranges", []),
         }
 
     except Exception as e:
@@ -683,499 +592,789 @@ def process_document(api_key, source, source_type, optimize_images=True):
         return {
             "success": False,
             "result_text": f"Error inesperado: {error_msg}",
-            "preview_src": "",
+            "preview": None,
             "file_name": file_name if file_name else "documento",
             "file_bytes": file_bytes,
             "raw_response": None,
         }
 
 
-# ====================== INTERFAZ DE USUARIO ======================
+def process_job_file(api_key, optimize_images, handle, checkpoint):
+    """
+    Procesa un archivo de un trabajo OCR en el hilo de la cola de trabajos.
 
-# Título principal en el área de contenido
-st.markdown("<h1 class='main-header'>🔍 Mistral OCR App</h1>", unsafe_allow_html=True)
-st.markdown(
-    "<p>Extracción de texto de imágenes y documentos PDF utilizando la API de Mistral AI</p>",
-    unsafe_allow_html=True,
-)
+    El archivo se lee del almacén de vistas previas y `checkpoint` guarda cada
+    rango de páginas terminado, de modo que al reanudar no se repite.
+    """
+    preview_store = get_preview_store()
+    if not preview_store.exists(handle):
+        return {
+            "success": False,
+            "result_text": f"El archivo {handle.file_name} ya no está disponible. Vuelve a subirlo.",
+        }
+    with preview_store.open(handle) as stored_file:
+        source = io.BytesIO(stored_file.read())
+    source.name = handle.file_name
+    source.type = handle.mime_type
+    return process_document(
+        api_key,
+        source,
+        "Archivo local",
+        optimize_images,
+        show_status=False,
+        ocr_cache=checkpoint,
+        # El archivo ya está en el almacén: no volver a copiarlo ni a calcular su hash
+        store_preview=False,
+    )
 
-# Obtener la API key
-api_key = get_mistral_api_key()
 
-# ====================== BARRA LATERAL (CONFIGURACIÓN) ======================
-with st.sidebar:
+def get_job_id():
+    """Devuelve el trabajo OCR de la sesión, recuperándolo de la URL al recargar."""
+    if JOB_STATE_KEY not in st.session_state:
+        job_id = None
+        try:
+            job_id = st.query_params.get(JOB_QUERY_PARAM)
+        except Exception:
+            pass
+        st.session_state[JOB_STATE_KEY] = job_id
+    return st.session_state[JOB_STATE_KEY]
+
+
+def set_job_id(job_id):
+    """Guarda el trabajo OCR en la sesión y en la URL."""
+    st.session_state[JOB_STATE_KEY] = job_id
     try:
-        st.image("assets/logo.svg", width=150)
-    except Exception as e:
-        st.write("Mistral OCR")
-        if st.session_state.get("show_technical_details", False):
-            st.error(f"Error al cargar logo: {str(e)}")
-    st.header("Configuración")
+        if job_id:
+            st.query_params[JOB_QUERY_PARAM] = job_id
+        elif JOB_QUERY_PARAM in st.query_params:
+            del st.query_params[JOB_QUERY_PARAM]
+    except Exception:
+        pass
+
+
+def start_ocr_job(job_id, api_key, options):
+    """Inicia o reanuda un trabajo OCR en segundo plano."""
+    return get_ocr_job_queue().start(
+        job_id,
+        partial(process_job_file, api_key, options.get("optimize_images", True)),
+        max_workers=options.get("max_workers", DEFAULT_CONCURRENCY),
+    )
 
-    # UI para la API key - solo se muestra si no está en secrets o variables de entorno
-    if not api_key:
-        api_key_input = st.text_input(
-            "API key de Mistral",
-            value="",
-            type="password",
-            help="Tu API key de Mistral. Se utilizará para procesar los documentos.",
+
+def load_job_results(job):
+    """Copia a la sesión los resultados de un trabajo OCR terminado."""
+    files = job["files"]
+    st.session_state["ocr_result"] = [
+        item["result_text"] or "Error: sin resultado" for item in files
+    ]
+    st.session_state["previews"] = [item["handle"] for item in files]
+    st.session_state["file_names"] = [item["file_name"] for item in files]
+    st.session_state["ocr_ranges"] = [item["ranges"] for item in files]
+    st.session_state["processing_complete"] = True
+    st.session_state["ocr_job_loaded"] = job["id"]
+
+
+def render_job_progress(job):
+    """Barra de progreso y estado de cada archivo de un trabajo OCR."""
+    status_icons = {DONE: "✅", FAILED: "❌", RUNNING: "⏳", PENDING: "🕓"}
+    total_files = len(job["files"])
+    st.progress(
+        job["completed"] / total_files if total_files else 1.0,
+        text=f"Procesados {job['completed']}/{total_files}",
+    )
+    st.markdown(
+        "\n".join(
+            f"- {status_icons.get(item['status'], '🕓')} {item['file_name']}: "
+            f"{item['status']}"
+            + (f" ({item['elapsed']:.1f} s)" if item["elapsed"] else "")
+            for item in job["files"]
         )
+    )
 
-        if not api_key_input:
-            st.info("Por favor, introduce tu API key de Mistral para continuar.")
 
-            # Instrucciones para obtener API key
-            with st.expander("🔑 ¿Cómo obtener una API key?"):
-                st.markdown(
-                    """
-                1. Visita [mistral.ai](https://mistral.ai) y crea una cuenta
-                2. Navega a la sección de API Keys
-                3. Genera una nueva API key
-                4. Copia y pégala aquí
-
-                También puedes configurar tu API key como:
-                - Variable de entorno: `MISTRAL_API_KEY`
-                - Secreto de Streamlit: `.streamlit/secrets.toml`
-                """
-                )
-        else:
-            # Verificar la API key ingresada
-            valid, message = validate_api_key(api_key_input)
-            if valid:
-                st.success(f"✅ {message}")
-                api_key = api_key_input
-            else:
-                st.warning(f"⚠️ {message}")
-    else:
-        # Verificar silenciosamente la API key existente
-        valid, message = validate_api_key(api_key)
-        if valid:
-            st.success("✅ API key configurada correctamente")
-        else:
-            st.error(f"❌ La API key configurada no es válida: {message}")
-
-    # Método de carga
-    st.subheader("Método de carga")
-    source_type = st.radio(
-        "Selecciona el método de carga",
-        options=["Archivo local", "URL"],
-        help="Selecciona URL para procesar archivos desde internet o Archivo local para subir desde tu dispositivo.",
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_ocr_job(job_id):
+    """Consulta el estado del trabajo OCR en curso hasta que termina."""
+    job_queue = get_ocr_job_queue()
+    job = job_queue.status(job_id)
+    if job is None or not job_queue.is_active(job_id):
+        # Volver a dibujar la página completa con los resultados
+        st.rerun()
+        return
+
+    render_job_progress(job)
+    st.button(
+        "⏹️ Cancelar procesamiento",
+        on_click=job_queue.cancel,
+        args=(job_id,),
+        help="Los documentos terminados se conservan y el trabajo puede reanudarse",
     )
 
-    # Opciones avanzadas
-    st.header("⚙️ Opciones avanzadas")
 
-    # Opciones generales
-    show_technical_details = st.checkbox(
-        "Mostrar detalles técnicos",
-        value=st.session_state.get("show_technical_details", False),
-        help="Muestra información técnica detallada durante el procesamiento",
-    )
-    # Actualizar el estado de sesión
-    st.session_state["show_technical_details"] = show_technical_details
+# ====================== INTERFAZ DE USUARIO ======================
 
-    optimize_images = st.checkbox(
-        "Optimizar imágenes",
-        value=True,
-        help="Optimiza las imágenes antes de enviarlas para OCR (recomendado)",
+
+def main():
+    """Interfaz de Streamlit de la aplicación."""
+    # Configuración inicial de la página
+    st.set_page_config(
+        layout="wide",
+        page_title="Mistral OCR App",
+        page_icon="🔍",
+        initial_sidebar_state="expanded",
+        menu_items={
+            "Get Help": "https://docs.mistral.ai/api/",
+            "Report a bug": "https://github.com/bladealex9848/OmniChat/issues",
+            "About": "Mistral OCR App v"
+            + APP_VERSION
+            + " - Desarrollada con Streamlit y Mistral AI API",
+        },
     )
 
-    # Información de la aplicación
-    with st.expander("ℹ️ Acerca de Mistral OCR"):
-        st.markdown(
-            """
-        ### Características:
-        - Extracción de texto con preservación de estructura
-        - Soporte para PDF e imágenes
-        - Optimización de imágenes
-
-        ### Limitaciones:
-        - PDFs hasta 50 MB
-        - Máximo 1,000 páginas por documento
+    # Inicializar variables de estado de sesión para persistencia
+    if "ocr_result" not in st.session_state:
+        st.session_state["ocr_result"] = []
+    if "previews" not in st.session_state:
+        st.session_state["previews"] = []
+    if "file_names" not in st.session_state:
+        st.session_state["file_names"] = []
+    if "ocr_ranges" not in st.session_state:
+        st.session_state["ocr_ranges"] = []
+    if "processing_complete" not in st.session_state:
+        st.session_state["processing_complete"] = False
+    if "show_technical_details" not in st.session_state:
+        st.session_state["show_technical_details"] = False
+
+    # Inyectar CSS personalizado
+    st.markdown(
         """
-        )
+    <style>
+        .main-header {
+            font-size: 2.5rem;
+            color: #1E88E5;
+            margin-bottom: 1rem;
+        }
+        .sub-header {
+            font-size: 1.5rem;
+            color: #0D47A1;
+            margin-top: 2rem;
+            margin-bottom: 1rem;
+        }
+        .info-box {
+            background-color: #E3F2FD;
+            padding: 1rem;
+            border-radius: 0.5rem;
+            margin-bottom: 1rem;
+        }
+        .success-box {
+            background-color: #E8F5E9;
+            padding: 1rem;
+            border-radius: 0.5rem;
+            margin-bottom: 1rem;
+        }
+        .error-box {
+            background-color: #FFEBEE;
+            padding: 1rem;
+            border-radius: 0.5rem;
+            margin-bottom: 1rem;
+        }
+        .stButton>button {
+            background-color: #1976D2;
+            color: white;
+            font-weight: 500;
+        }
+        .stButton>button:hover {
+            background-color: #1565C0;
+            color: white;
+        }
+        .download-button {
+            display: inline-block;
+            padding: 0.5rem 1rem;
+            background-color: #1976D2;
+            color: white;
+            text-decoration: none;
+            border-radius: 4px;
+            font-weight: 500;
+            text-align: center;
+            margin: 0.25rem 0;
+            width: 100%;
+        }
+        .download-button:hover {
+            background-color: #1565C0;
+            color: white;
+        }
+        .technical-info {
+            font-family: monospace;
+            background-color: #f5f5f5;
+            padding: 10px;
+            border-radius: 4px;
+            margin: 10px 0;
+            white-space: pre-wrap;
+        }
+        .stTabs [data-baseweb="tab-list"] {
+            gap: 8px;
+        }
+        .stTabs [data-baseweb="tab"] {
+            background-color: #f0f2f6;
+            border-radius: 4px 4px 0px 0px;
+            padding: 10px 16px;
+            font-weight: 500;
+        }
+        .stTabs [aria-selected="true"] {
+            background-color: #1976D2 !important;
+            color: white !important;
+        }
+        /* Mejoras para visualización en dispositivos móviles */
+        @media (max-width: 768px) {
+            .stButton>button {
+                width: 100%;
+                margin: 5px 0;
+            }
+            .st-emotion-cache-16txtl3 {
+                padding: 1rem 0.5rem;
+            }
+        }
+    </style>
+    """,
+        unsafe_allow_html=True,
+    )
 
-    # Versión de la app
-    st.caption(f"Mistral OCR App v{APP_VERSION}")
+    # Título principal en el área de contenido
+    st.markdown("<h1 class='main-header'>🔍 Mistral OCR App</h1>", unsafe_allow_html=True)
+    st.markdown(
+        "<p>Extracción de texto de imágenes y documentos PDF utilizando la API de Mistral AI</p>",
+        unsafe_allow_html=True,
+    )
 
-# ====================== ÁREA PRINCIPAL ======================
+    # Obtener la API key
+    api_key = get_mistral_api_key()
 
-# Verificar si tenemos API key válida para continuar
-if not api_key:
-    st.warning("⚠️ Se requiere una API key válida para utilizar la aplicación.")
+    # ====================== BARRA LATERAL (CONFIGURACIÓN) ======================
+    with st.sidebar:
+        try:
+            st.image("assets/logo.svg", width=150)
+        except Exception as e:
+            st.write("Mistral OCR")
+            if st.session_state.get("show_technical_details", False):
+                st.error(f"Error al cargar logo: {str(e)}")
+        st.header("Configuración")
+
+        # UI para la API key - solo se muestra si no está en secrets o variables de entorno
+        if not api_key:
+            api_key_input = st.text_input(
+                "API key de Mistral",
+                value="",
+                type="password",
+                help="Tu API key de Mistral. Se utilizará para procesar los documentos.",
+            )
 
-    # Mostrar información sobre la aplicación mientras no hay API key
-    st.info(
-        "Esta aplicación permite extraer texto de documentos PDF e imágenes usando tecnología OCR avanzada."
-    )
+            if not api_key_input:
+                st.info("Por favor, introduce tu API key de Mistral para continuar.")
+
+                # Instrucciones para obtener API key
+                with st.expander("🔑 ¿Cómo obtener una API key?"):
+                    st.markdown(
+                        """
+                    1. Visita [mistral.ai](https://mistral.ai) y crea una cuenta
+                    2. Navega a la sección de API Keys
+                    3. Genera una nueva API key
+                    4. Copia y pégala aquí
+
+                    También puedes configurar tu API key como:
+                    - Variable de entorno: `MISTRAL_API_KEY`
+                    - Secreto de Streamlit: `.streamlit/secrets.toml`
+                    """
+                    )
+            else:
+                # Verificar la API key ingresada
+                valid, message = validate_api_key(api_key_input)
+                if valid:
+                    st.success(f"✅ {message}")
+                    api_key = api_key_input
+                else:
+                    st.warning(f"⚠️ {message}")
+        else:
+            # Verificar silenciosamente la API key existente
+            valid, message = validate_api_key(api_key)
+            if valid:
+                st.success("✅ API key configurada correctamente")
+            else:
+                st.error(f"❌ La API key configurada no es válida: {message}")
+
+        # Método de carga
+        st.subheader("Método de carga")
+        source_type = st.radio(
+            "Selecciona el método de carga",
+            options=["Archivo local", "URL"],
+            help="Selecciona URL para procesar archivos desde internet o Archivo local para subir desde tu dispositivo.",
+        )
 
-    with st.expander("🔍 ¿Qué puedes hacer con Mistral OCR?"):
-        st.markdown(
-            """
-        - **Digitalizar documentos** escaneados o fotografiados
-        - **Extraer texto** de facturas, recibos, contratos, etc.
-        - **Preservar el formato** del documento original
-        - **Procesar documentos** en lote
-        - **Descargar resultados** en diferentes formatos
-        """
+        # Opciones avanzadas
+        st.header("⚙️ Opciones avanzadas")
+
+        # Opciones generales
+        show_technical_details = st.checkbox(
+            "Mostrar detalles técnicos",
+            value=st.session_state.get("show_technical_details", False),
+            help="Muestra información técnica detallada durante el procesamiento",
         )
+        # Actualizar el estado de sesión
+        st.session_state["show_technical_details"] = show_technical_details
 
-    # Detener la ejecución hasta que tengamos una API key
-    st.stop()
+        optimize_images = st.checkbox(
+            "Optimizar imágenes",
+            value=True,
+            help="Optimiza las imágenes antes de enviarlas para OCR (recomendado)",
+        )
 
-# Interfaz para cargar documentos
-st.header("1️⃣ Cargar documentos")
+        max_concurrent_requests = st.slider(
+            "Solicitudes simultáneas",
+            min_value=1,
+            max_value=MAX_CONCURRENCY,
+            value=DEFAULT_CONCURRENCY,
+            help="Número de documentos que se envían a la API a la vez. Redúcelo si tu plan de Mistral tiene un límite bajo de solicitudes.",
+        )
 
-input_url = ""
-uploaded_files = []
+        # Información de la aplicación
+        with st.expander("ℹ️ Acerca de Mistral OCR"):
+            st.markdown(
+                """
+            ### Características:
+            - Extracción de texto con preservación de estructura
+            - Soporte para PDF e imágenes
+            - Optimización de imágenes
+
+            ### Limitaciones:
+            - PDFs hasta 50 MB
+            - Máximo 1,000 páginas por documento
+            """
+            )
 
-if source_type == "URL":
-    input_url = st.text_area(
-        "Introduce URLs (una por línea)",
-        help="Introduce las URLs de los documentos a procesar",
-    )
-    st.info(
-        "⚠️ El procesamiento desde URL está en desarrollo. Por favor, usa la carga de archivos locales."
-    )
+        # Versión de la app
+        st.caption(f"Mistral OCR App v{APP_VERSION}")
 
-    # Desactivar temporalmente el procesamiento desde URL
-    st.warning("El procesamiento desde URL no está disponible en esta versión.")
-    has_input = False
-else:
-    acceptable_types = ["pdf", "jpg", "jpeg", "png"]
-    uploaded_files = st.file_uploader(
-        "Sube archivos",
-        type=acceptable_types,
-        accept_multiple_files=True,
-        help=f"Formatos aceptados: {', '.join(acceptable_types)} (el tipo de archivo se detectará automáticamente)",
-    )
-    has_input = bool(uploaded_files)
+    # ====================== ÁREA PRINCIPAL ======================
 
-# Botón de procesamiento
-st.header("2️⃣ Procesar")
+    # Verificar si tenemos API key válida para continuar
+    if not api_key:
+        st.warning("⚠️ Se requiere una API key válida para utilizar la aplicación.")
 
-process_button = st.button(
-    "📄 Procesar documentos",
-    help="Inicia el procesamiento OCR",
-    use_container_width=True,
-    disabled=not api_key or not has_input,
-)
+        # Mostrar información sobre la aplicación mientras no hay API key
+        st.info(
+            "Esta aplicación permite extraer texto de documentos PDF e imágenes usando tecnología OCR avanzada."
+        )
 
-# ====================== LÓGICA DE PROCESAMIENTO ======================
+        with st.expander("🔍 ¿Qué puedes hacer con Mistral OCR?"):
+            st.markdown(
+                """
+            - **Digitalizar documentos** escaneados o fotografiados
+            - **Extraer texto** de facturas, recibos, contratos, etc.
+            - **Preservar el formato** del documento original
+            - **Procesar documentos** en lote
+            - **Descargar resultados** en diferentes formatos
+            """
+            )
 
-if process_button:
-    # Preparar fuentes
-    try:
-        sources = uploaded_files  # Por ahora solo archivos locales
+        # Detener la ejecución hasta que tengamos una API key
+        st.stop()
 
-        if not sources:
-            st.error("No se encontraron fuentes válidas para procesar.")
-            st.stop()
+    # Interfaz para cargar documentos
+    st.header("1️⃣ Cargar documentos")
 
-        # Reiniciar estados
-        st.session_state["ocr_result"] = []
-        st.session_state["preview_src"] = []
-        st.session_state["image_bytes"] = []
-        st.session_state["file_names"] = []
-        st.session_state["processing_complete"] = False
+    uploaded_files = []
 
-        total_files = len(sources)
-        st.info(f"Procesando {total_files} documento(s)...")
+    if source_type == "URL":
+        # El procesamiento desde URL aún no está disponible: las URLs no se usan
+        st.text_area(
+            "Introduce URLs (una por línea)",
+            help="Introduce las URLs de los documentos a procesar",
+        )
+        st.info(
+            "⚠️ El procesamiento desde URL está en desarrollo. Por favor, usa la carga de archivos locales."
+        )
 
-        # Configurar barra de progreso
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        # Desactivar temporalmente el procesamiento desde URL
+        st.warning("El procesamiento desde URL no está disponible en esta versión.")
+        has_input = False
+    else:
+        acceptable_types = ["pdf", "jpg", "jpeg", "png"]
+        uploaded_files = st.file_uploader(
+            "Sube archivos",
+            type=acceptable_types,
+            accept_multiple_files=True,
+            help=f"Formatos aceptados: {', '.join(acceptable_types)} (el tipo de archivo se detectará automáticamente)",
+        )
+        has_input = bool(uploaded_files)
 
-        # Procesar documentos de forma secuencial con mejor información de progreso
-        results = []
+    # Botón de procesamiento
+    st.header("2️⃣ Procesar")
 
-        for idx, source in enumerate(sources):
-            # Actualizar progreso
-            progress_value = idx / total_files
-            progress_bar.progress(
-                progress_value, text=f"Procesando {idx+1}/{total_files}"
-            )
+    process_button = st.button(
+        "📄 Procesar documentos",
+        help="Inicia el procesamiento OCR",
+        use_container_width=True,
+        disabled=not api_key or not has_input,
+    )
 
-            # Nombre de fuente para mostrar
-            source_name = source.name
-            status_text.text(f"Procesando archivo: {source_name}")
+    # ====================== LÓGICA DE PROCESAMIENTO ======================
 
-            # Procesar documento
-            result = process_document(
-                api_key,
-                source,
-                source_type,
-                optimize_images,
-            )
+    if process_button:
+        # Preparar fuentes
+        try:
+            sources = uploaded_files  # Por ahora solo archivos locales
+
+            if not sources:
+                st.error("No se encontraron fuentes válidas para procesar.")
+                st.stop()
+
+            # Reiniciar estados
+            st.session_state["ocr_result"] = []
+            st.session_state["previews"] = []
+            st.session_state["file_names"] = []
+            st.session_state["ocr_ranges"] = []
+            st.session_state["processing_complete"] = False
+
+            # Los archivos se guardan en disco y el lote se procesa en segundo plano:
+            # sobrevive a reruns y desconexiones y puede reanudarse si se interrumpe.
+            # La cola se obtiene antes de guardar los archivos para que el almacén
+            # ya no elimine las entradas de trabajos interrumpidos
+            job_queue = get_ocr_job_queue()
+            preview_store = get_preview_store()
+            handles = [
+                preview_store.put(
+                    source,
+                    source.name,
+                    source.type or mimetypes.guess_type(source.name)[0],
+                )
+                for source in sources
+            ]
+            job_options = {
+                "optimize_images": optimize_images,
+                "max_workers": max_concurrent_requests,
+            }
+            job_id = job_queue.create_job(handles, job_options)
+            start_ocr_job(job_id, api_key, job_options)
+            set_job_id(job_id)
+            logger.info(f"Trabajo OCR {job_id} iniciado con {len(handles)} documento(s)")
 
-            results.append(result)
+        except Exception as e:
+            st.error(f"Error al preparar documentos para procesamiento: {str(e)}")
+            if st.session_state["show_technical_details"]:
+                with st.expander("Detalles técnicos del error"):
+                    st.code(traceback.format_exc())
+
+    # Estado del trabajo OCR de la sesión (en curso, interrumpido o terminado)
+    job_id = get_job_id()
+    if job_id:
+        job = get_ocr_job_queue().status(job_id)
+        if job is None:
+            set_job_id(None)
+        elif get_ocr_job_queue().is_active(job_id):
+            st.info(f"Procesando {len(job['files'])} documento(s)...")
+            show_ocr_job(job_id)
+        elif job["status"] in (JOB_INTERRUPTED, JOB_CANCELLED):
+            total_files = len(job["files"])
+            if job["status"] == JOB_CANCELLED:
+                st.warning(
+                    f"⏹️ Procesamiento cancelado. {job['completed']} de {total_files} documento(s) terminados."
+                )
+            else:
+                st.warning(
+                    f"⚠️ El procesamiento se interrumpió. {job['completed']} de {total_files} documento(s) terminados."
+                )
+            render_job_progress(job)
+            if st.button(
+                "▶️ Reanudar procesamiento",
+                help="Continúa con los documentos y rangos de páginas pendientes",
+                disabled=not api_key,
+            ):
+                start_ocr_job(job_id, api_key, job["options"])
+                st.rerun()
+        else:
+            if st.session_state.get("ocr_job_loaded") != job_id:
+                load_job_results(job)
+                total_files = len(job["files"])
+                success_count = sum(1 for item in job["files"] if item["success"])
+                if success_count == total_files:
+                    st.success(
+                        f"✅ ¡Procesamiento completado con éxito! Se procesaron {total_files} documento(s)."
+                    )
+                else:
+                    st.warning(
+                        f"⚠️ Procesamiento completado con {total_files - success_count} error(es). Se procesaron {success_count} de {total_files} documento(s) correctamente."
+                    )
 
-            # Actualizar listas de resultados
-            st.session_state["ocr_result"].append(result["result_text"])
-            st.session_state["preview_src"].append(result["preview_src"])
-            st.session_state["file_names"].append(result["file_name"])
-            if result["file_bytes"] is not None:
-                st.session_state["image_bytes"].append(result["file_bytes"])
+            # Los documentos con error pueden reintentarse; los correctos se conservan
+            failed_count = sum(1 for item in job["files"] if item["status"] == FAILED)
+            if failed_count and st.button(
+                f"🔁 Reintentar {failed_count} documento(s) con error",
+                help="Vuelve a procesar solo los documentos que fallaron",
+                disabled=not api_key,
+            ):
+                st.session_state["processing_complete"] = False
+                st.session_state.pop("ocr_job_loaded", None)
+                start_ocr_job(job_id, api_key, job["options"])
+                st.rerun()
 
-        # Marcar procesamiento como completado
-        st.session_state["processing_complete"] = True
+    # ====================== VISUALIZACIÓN DE RESULTADOS ======================
 
-        # Actualizar progreso final
-        progress_bar.progress(1.0, text="¡Procesamiento completado!")
+    # Mostrar resultados si están disponibles
+    if st.session_state.get("processing_complete") and st.session_state.get("ocr_result"):
+        st.header("3️⃣ Resultados")
 
-        # Mostrar resumen
-        success_count = sum(1 for r in results if r["success"])
-        if success_count == total_files:
-            st.success(
-                f"✅ ¡Procesamiento completado con éxito! Se procesaron {total_files} documento(s)."
-            )
-        else:
-            st.warning(
-                f"⚠️ Procesamiento completado con {total_files - success_count} error(es). Se procesaron {success_count} de {total_files} documento(s) correctamente."
-            )
+        try:
+            if len(st.session_state["file_names"]) > 0:
+                # Usar tabs para múltiples documentos
+                if len(st.session_state["file_names"]) > 1:
+                    tabs = st.tabs(
+                        [
+                            f"Doc {idx+1}: {name}"
+                            for idx, name in enumerate(st.session_state["file_names"])
+                        ]
+                    )
+                else:
+                    # Para un solo documento, crear un contenedor sin tabs
+                    tabs = [st.container()]
 
-    except Exception as e:
-        st.error(f"Error al preparar documentos para procesamiento: {str(e)}")
-        if st.session_state["show_technical_details"]:
-            with st.expander("Detalles técnicos del error"):
-                st.code(traceback.format_exc())
+                for idx, tab in enumerate(tabs):
+                    with tab:
+                        # Dividir el espacio para previsualización y texto
+                        col1, col2 = st.columns([1, 1])
 
-# ====================== VISUALIZACIÓN DE RESULTADOS ======================
+                        with col1:
+                            st.subheader("Vista previa del documento")
 
-# Mostrar resultados si están disponibles
-if st.session_state.get("processing_complete") and st.session_state.get("ocr_result"):
-    st.header("3️⃣ Resultados")
+                            # Las vistas previas se generan bajo demanda desde el almacén en disco
+                            preview_store = get_preview_store()
+                            previews = st.session_state.get("previews", [])
+                            preview = previews[idx] if idx < len(previews) else None
 
-    try:
-        if len(st.session_state["file_names"]) > 0:
-            # Usar tabs para múltiples documentos
-            if len(st.session_state["file_names"]) > 1:
-                tabs = st.tabs(
-                    [
-                        f"Doc {idx+1}: {name}"
-                        for idx, name in enumerate(st.session_state["file_names"])
-                    ]
-                )
-            else:
-                # Para un solo documento, crear un contenedor sin tabs
-                tabs = [st.container()]
-
-            for idx, tab in enumerate(tabs):
-                with tab:
-                    # Dividir el espacio para previsualización y texto
-                    col1, col2 = st.columns([1, 1])
-
-                    with col1:
-                        st.subheader("Vista previa del documento")
-
-                        if (
-                            idx < len(st.session_state["preview_src"])
-                            and st.session_state["preview_src"][idx]
-                        ):
-                            file_name = st.session_state["file_names"][idx]
-
-                            if "pdf" in file_name.lower():
-                                # Solución para PDFs en Streamlit Cloud
-                                pdf_display_html = f"""
-                                <div style="border: 1px solid #ddd; border-radius: 5px; padding: 20px; text-align: center;">
-                                    <p style="margin-bottom: 15px;">Vista previa directa no disponible</p>
-                                    <a href="{st.session_state["preview_src"][idx]}"
-                                       target="_blank"
-                                       style="display: inline-block; padding: 10px 20px;
-                                              background-color: #1976D2; color: white;
-                                              text-decoration: none; border-radius: 4px;
-                                              font-weight: 500;">
-                                        Abrir PDF en nueva pestaña
-                                    </a>
-                                </div>
-                                """
-                                st.markdown(pdf_display_html, unsafe_allow_html=True)
-                            else:
-                                # Para imágenes
+                            if preview is not None and preview_store.exists(preview):
+                                file_name = st.session_state["file_names"][idx]
                                 try:
-                                    if idx < len(
-                                        st.session_state.get("image_bytes", [])
-                                    ):
-                                        st.image(
-                                            st.session_state["image_bytes"][idx],
-                                            caption=f"Imagen original: {file_name}",
-                                            use_container_width=True,
-                                        )
-                                    elif st.session_state["preview_src"][idx]:
-                                        st.image(
-                                            st.session_state["preview_src"][idx],
-                                            caption=f"Imagen original: {file_name}",
-                                            use_container_width=True,
-                                        )
+                                    if preview.is_pdf:
+                                        page_count = preview_store.page_count(preview)
+                                        thumbnail = preview_store.thumbnail(preview)
+                                        if thumbnail:
+                                            st.image(
+                                                thumbnail,
+                                                caption=f"Página 1 de {page_count}: {file_name}",
+                                                use_container_width=True,
+                                            )
+                                        else:
+                                            st.info(
+                                                "Vista previa no disponible para este PDF."
+                                            )
+
+                                        if page_count > 1 and st.toggle(
+                                            "Mostrar más páginas",
+                                            key=f"preview_pages_{idx}",
+                                        ):
+                                            for page_index in range(
+                                                1, min(page_count, MAX_PREVIEW_PAGES)
+                                            ):
+                                                page_image = preview_store.page_image(
+                                                    preview, page_index
+                                                )
+                                                if page_image:
+                                                    st.image(
+                                                        page_image,
+                                                        caption=f"Página {page_index + 1}",
+                                                        use_container_width=True,
+                                                    )
                                     else:
-                                        st.info(
-                                            "Vista previa no disponible para este documento."
-                                        )
+                                        thumbnail = preview_store.thumbnail(preview)
+                                        if thumbnail:
+                                            st.image(
+                                                thumbnail,
+                                                caption=f"Imagen original: {file_name}",
+                                                use_container_width=True,
+                                            )
+                                        else:
+                                            st.info(
+                                                "Vista previa no disponible para este documento."
+                                            )
                                 except Exception as e:
-                                    st.error(f"Error al mostrar imagen: {str(e)}")
-                                    st.info(
-                                        "Vista previa no disponible debido a un error."
-                                    )
-                        else:
-                            st.info("Vista previa no disponible para este documento.")
+                                    st.error(f"Error al mostrar la vista previa: {str(e)}")
+                                    st.info("Vista previa no disponible debido a un error.")
+                            else:
+                                st.info("Vista previa no disponible para este documento.")
 
-                    with col2:
-                        st.subheader(f"Texto extraído")
+                        with col2:
+                            st.subheader(f"Texto extraído")
 
-                        if idx < len(st.session_state["ocr_result"]):
-                            result_text = st.session_state["ocr_result"][idx]
+                            if idx < len(st.session_state["ocr_result"]):
+                                result_text = st.session_state["ocr_result"][idx]
 
-                            if not result_text.startswith("Error:"):
-                                # Añadir contador de caracteres
-                                char_count = len(result_text)
-                                word_count = len(result_text.split())
-                                st.caption(
-                                    f"{word_count} palabras | {char_count} caracteres"
-                                )
+                                if not result_text.startswith("Error:"):
+                                    # Añadir contador de caracteres
+                                    char_count = len(result_text)
+                                    word_count = len(result_text.split())
+                                    st.caption(
+                                        f"{word_count} palabras | {char_count} caracteres"
+                                    )
 
-                            # Texto área con resultado
-                            st.text_area(
-                                label="",
-                                value=result_text,
-                                height=400,
-                                key=f"text_area_{idx}",
-                            )
+                                # Tiempos por rango de páginas de los PDF divididos
+                                ocr_ranges = st.session_state.get("ocr_ranges", [])
+                                if (
+                                    st.session_state["show_technical_details"]
+                                    and idx < len(ocr_ranges)
+                                    and len(ocr_ranges[idx]) > 1
+                                ):
+                                    with st.expander("⏱️ Tiempos por rango de páginas"):
+                                        st.dataframe(
+                                            ocr_ranges[idx],
+                                            hide_index=True,
+                                            use_container_width=True,
+                                        )
 
-                            # Opciones de descarga para resultados exitosos
-                            if not result_text.startswith("Error"):
-                                st.subheader("Descargar resultados")
+                                # Texto área con resultado
+                                st.text_area(
+                                    label="",
+                                    value=result_text,
+                                    height=400,
+                                    key=f"text_area_{idx}",
+                                )
 
-                                try:
-                                    # Nombre base para archivos de descarga
-                                    base_filename = st.session_state["file_names"][
-                                        idx
-                                    ].split(".")[0]
-
-                                    # Opciones de descarga con mejor UI
-                                    download_col1, download_col2, download_col3 = (
-                                        st.columns(3)
-                                    )
+                                # Opciones de descarga para resultados exitosos
+                                if not result_text.startswith("Error"):
+                                    st.subheader("Descargar resultados")
 
-                                    with download_col1:
-                                        json_data = json.dumps(
-                                            {"ocr_result": result_text},
-                                            ensure_ascii=False,
-                                            indent=2,
-                                        )
-                                        st.markdown(
-                                            create_download_link(
-                                                json_data,
-                                                "application/json",
-                                                f"{base_filename}.json",
-                                            ),
-                                            unsafe_allow_html=True,
-                                        )
+                                    try:
+                                        # Nombre base para archivos de descarga
+                                        base_filename = st.session_state["file_names"][
+                                            idx
+                                        ].split(".")[0]
 
-                                    with download_col2:
-                                        st.markdown(
-                                            create_download_link(
-                                                result_text,
-                                                "text/plain",
-                                                f"{base_filename}.txt",
-                                            ),
-                                            unsafe_allow_html=True,
+                                        # Opciones de descarga con mejor UI
+                                        download_col1, download_col2, download_col3 = (
+                                            st.columns(3)
                                         )
 
-                                    with download_col3:
-                                        st.markdown(
-                                            create_download_link(
-                                                result_text,
-                                                "text/markdown",
-                                                f"{base_filename}.md",
-                                            ),
-                                            unsafe_allow_html=True,
+                                        with download_col1:
+                                            json_data = json.dumps(
+                                                {"ocr_result": result_text},
+                                                ensure_ascii=False,
+                                                indent=2,
+                                            )
+                                            st.markdown(
+                                                create_download_link(
+                                                    json_data,
+                                                    "application/json",
+                                                    f"{base_filename}.json",
+                                                ),
+                                                unsafe_allow_html=True,
+                                            )
+
+                                        with download_col2:
+                                            st.markdown(
+                                                create_download_link(
+                                                    result_text,
+                                                    "text/plain",
+                                                    f"{base_filename}.txt",
+                                                ),
+                                                unsafe_allow_html=True,
+                                            )
+
+                                        with download_col3:
+                                            st.markdown(
+                                                create_download_link(
+                                                    result_text,
+                                                    "text/markdown",
+                                                    f"{base_filename}.md",
+                                                ),
+                                                unsafe_allow_html=True,
+                                            )
+                                    except Exception as e:
+                                        st.error(
+                                            f"Error al crear enlaces de descarga: {str(e)}"
                                         )
-                                except Exception as e:
-                                    st.error(
-                                        f"Error al crear enlaces de descarga: {str(e)}"
-                                    )
-                        else:
-                            st.error(
-                                "No hay resultados disponibles para este documento."
-                            )
-
-    except Exception as e:
-        st.error(f"Error al mostrar resultados: {str(e)}")
-        if st.session_state["show_technical_details"]:
-            with st.expander("Detalles técnicos del error"):
-                st.code(traceback.format_exc())
-
-# ====================== PANTALLA INICIAL ======================
-# Si no hay procesamiento completado, mostrar información de bienvenida
-if not st.session_state.get("processing_complete"):
-    # Crear columnas para organizar el contenido
-    col1, col2 = st.columns([2, 1])
-
-    with col1:
-        st.markdown(
-            """
-        ## Bienvenido a Mistral OCR
+                            else:
+                                st.error(
+                                    "No hay resultados disponibles para este documento."
+                                )
 
-        Esta aplicación te permite extraer texto de documentos PDF e imágenes utilizando
-        la tecnología OCR avanzada de Mistral AI.
+        except Exception as e:
+            st.error(f"Error al mostrar resultados: {str(e)}")
+            if st.session_state["show_technical_details"]:
+                with st.expander("Detalles técnicos del error"):
+                    st.code(traceback.format_exc())
+
+    # ====================== PANTALLA INICIAL ======================
+    # Si no hay procesamiento completado, mostrar información de bienvenida
+    if not st.session_state.get("processing_complete"):
+        # Crear columnas para organizar el contenido
+        col1, col2 = st.columns([2, 1])
+
+        with col1:
+            st.markdown(
+                """
+            ## Bienvenido a Mistral OCR
 
-        ### Características principales:
-        - Extracción de texto con preservación de formato
-        - Soporte para documentos escaneados
-        - Procesamiento de imágenes optimizado
-        - Múltiples formatos de descarga
-        """
-        )
+            Esta aplicación te permite extraer texto de documentos PDF e imágenes utilizando
+            la tecnología OCR avanzada de Mistral AI.
 
-    with col2:
-        # Imagen ilustrativa
-        try:
-            st.image(
-                "https://images.unsplash.com/photo-1568667256549-094345857637?w=500",
-                caption="OCR y extracción de texto",
-                use_container_width=True,
+            ### Características principales:
+            - Extracción de texto con preservación de formato
+            - Soporte para documentos escaneados
+            - Procesamiento de imágenes optimizado
+            - Múltiples formatos de descarga
+            """
             )
-        except Exception:
-            # Si no se puede cargar la imagen, mostrar un mensaje alternativo
-            st.info("Mistral OCR - Digitaliza tus documentos")
 
-# Información adicional
-st.markdown("---")
-with st.expander("🔧 Solución de problemas"):
-    st.markdown(
-        """
-    Si encuentras problemas al usar esta aplicación, intenta lo siguiente:
+        with col2:
+            # Imagen ilustrativa
+            try:
+                st.image(
+                    "https://images.unsplash.com/photo-1568667256549-094345857637?w=500",
+                    caption="OCR y extracción de texto",
+                    use_container_width=True,
+                )
+            except Exception:
+                # Si no se puede cargar la imagen, mostrar un mensaje alternativo
+                st.info("Mistral OCR - Digitaliza tus documentos")
 
-    1. **Error al procesar imágenes**:
-       - Asegúrate de que la imagen tenga buen contraste y resolución
-       - Activa la opción "Optimizar imágenes" en las opciones avanzadas
+    # Información adicional
+    st.markdown("---")
+    with st.expander("🔧 Solución de problemas"):
+        st.markdown(
+            """
+        Si encuentras problemas al usar esta aplicación, intenta lo siguiente:
 
-    2. **Error 404 (Not Found)**:
-       - Verifica que tengas acceso a la API de OCR en tu plan de Mistral
+        1. **Error al procesar imágenes**:
+           - Asegúrate de que la imagen tenga buen contraste y resolución
+           - Activa la opción "Optimizar imágenes" en las opciones avanzadas
 
-    3. **Error de API key**:
-       - Verifica que tu API key de Mistral sea válida y esté correctamente introducida
-       - Asegúrate de que la API key tenga permisos suficientes
+        2. **Error 404 (Not Found)**:
+           - Verifica que tengas acceso a la API de OCR en tu plan de Mistral
 
-    4. **Error de formato**:
-       - Asegúrate de que tus archivos sean compatibles (PDF, JPG, PNG)
-       - Verifica que los archivos no estén corruptos
+        3. **Error de API key**:
+           - Verifica que tu API key de Mistral sea válida y esté correctamente introducida
+           - Asegúrate de que la API key tenga permisos suficientes
 
-    5. **Error de tamaño**:
-       - Los archivos no deben exceder 50 MB
-       - Intenta dividir documentos grandes
+        4. **Error de formato**:
+           - Asegúrate de que tus archivos sean compatibles (PDF, JPG, PNG)
+           - Verifica que los archivos no estén corruptos
 
-    Para más información, consulta la [documentación oficial de Mistral AI](https://docs.mistral.ai).
-    """
+        5. **Error de tamaño**:
+           - Los archivos no deben exceder 50 MB
+           - Intenta dividir documentos grandes
+
+        Para más información, consulta la [documentación oficial de Mistral AI](https://docs.mistral.ai).
+        """
+        )
+
+    # Versión y créditos
+    st.markdown("---")
+    st.markdown(
+        f"""
+    <div style="text-align: center; color: #666;">
+        <p>Mistral OCR App v{APP_VERSION} | Desarrollada con Streamlit, Mistral AI API y procesamiento avanzado de imágenes</p>
+    </div>
+    """,
+        unsafe_allow_html=True,
     )
 
-# Versión y créditos
-st.markdown("---")
-st.markdown(
-    f"""
-<div style="text-align: center; color: #666;">
-    <p>Mistral OCR App v{APP_VERSION} | Desarrollada con Streamlit, Mistral AI API y procesamiento avanzado de imágenes</p>
-</div>
-""",
-    unsafe_allow_html=True,
-)
+
+if __name__ == "__main__":
+    main()
@@ -12,14 +12,8 @@ from langchain.chains import ConversationChain
 # Configurar la página directamente
 st.set_page_config(page_title="Chatbot", page_icon="💬", layout="wide", initial_sidebar_state="expanded")
 
-# Inicializar mensajes si no existen
-if "basic_chat_messages" not in st.session_state:
-    st.session_state["basic_chat_messages"] = [
-        {
-            "role": "assistant",
-            "content": "Hola, soy un asistente virtual. ¿En qué puedo ayudarte hoy?",
-        }
-    ]
+# Inicializar mensajes (saludo y últimos mensajes guardados) si no existen
+utils.init_chat_messages("basic_chat_messages")
 
 class BasicChatbot:
 
@@ -38,7 +32,7 @@ class BasicChatbot:
 
         # Primero configurar el LLM en la barra lateral
         st.sidebar.markdown("### 🤖 Selecciona el modelo")
-        self.llm = utils.configure_llm(key_suffix="_sidebar")
+        self.llm = utils.configure_llm(key_suffix="_sidebar", semantic_cache=True)
 
         # Luego mostrar instrucciones específicas para el chatbot básico
         with st.sidebar.expander("💬 Instrucciones de uso", expanded=True):
@@ -70,15 +64,14 @@ class BasicChatbot:
         chain = self.setup_chain()
 
         # 2. Mostrar mensajes del historial (saludo inicial y conversación)
-        for msg in st.session_state["basic_chat_messages"]:
-            with st.chat_message(msg["role"]):
-                st.write(msg["content"])
+        # Solo se dibujan los últimos mensajes; los anteriores se cargan bajo demanda
+        utils.render_chat_messages("basic_chat_messages")
 
         # 3. Campo de entrada para nuevas preguntas (al final)
         user_query = st.chat_input(placeholder="¡Hazme una pregunta!")
         if user_query:
             # Añadir mensaje del usuario al historial
-            st.session_state["basic_chat_messages"].append({"role": "user", "content": user_query})
+            utils.append_chat_message("basic_chat_messages", "user", user_query)
 
             # Mostrar mensaje del usuario (se mostrará en la próxima ejecución)
             with st.chat_message("user"):
@@ -91,9 +84,7 @@ class BasicChatbot:
                 response = result["response"]
 
                 # Añadir respuesta al historial
-                st.session_state["basic_chat_messages"].append(
-                    {"role": "assistant", "content": response}
-                )
+                utils.append_chat_message("basic_chat_messages", "assistant", response)
 
 
 if __name__ == "__main__":
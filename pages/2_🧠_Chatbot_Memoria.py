@@ -17,16 +17,10 @@ import utils
 from streaming import StreamHandler
 
 from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
+from utils.token_memory import TokenBudgetMemory
 
-# Inicializar mensajes si no existen
-if "memory_chat_messages" not in st.session_state:
-    st.session_state["memory_chat_messages"] = [
-        {
-            "role": "assistant",
-            "content": "Hola, soy un asistente virtual. ¿En qué puedo ayudarte hoy?",
-        }
-    ]
+# Inicializar mensajes (saludo y últimos mensajes guardados) si no existen
+utils.init_chat_messages("memory_chat_messages")
 
 class ContextChatbot:
 
@@ -34,10 +28,21 @@ class ContextChatbot:
         utils.sync_st_session()
         self.llm = None
 
-    @st.cache_resource
-    def setup_chain(_self):
-        memory = ConversationBufferMemory()
-        chain = ConversationChain(llm=_self.llm, memory=memory, verbose=True)
+    def create_memory(self):
+        # Historial acotado: turnos recientes literales y resumen de los antiguos
+        memory = TokenBudgetMemory(llm=self.llm)
+        # Si la memoria se descartó por inactividad, reconstruirla desde el historial visible
+        messages = st.session_state["memory_chat_messages"]
+        for question, answer in zip(messages, messages[1:]):
+            if question["role"] == "user" and answer["role"] == "assistant":
+                memory.save_context({"input": question["content"]}, {"response": answer["content"]})
+        return memory
+
+    def setup_chain(self):
+        # La memoria es propia de cada sesión; el LLM es un cliente compartido del pool
+        memory = utils.get_session_resources().get_or_create("memory_chat_memory", self.create_memory)
+        memory.llm = self.llm
+        chain = ConversationChain(llm=self.llm, memory=memory, verbose=True)
         return chain
 
     def main(self):
@@ -49,7 +54,7 @@ class ContextChatbot:
 
         # Primero configurar el LLM en la barra lateral
         st.sidebar.markdown("### 🤖 Selecciona el modelo")
-        self.llm = utils.configure_llm(key_suffix="_sidebar")
+        self.llm = utils.configure_llm(key_suffix="_sidebar", semantic_cache=True)
 
         # Luego mostrar instrucciones específicas para el chatbot con memoria
         with st.sidebar.expander("🧠 Instrucciones de uso", expanded=True):
@@ -81,15 +86,14 @@ class ContextChatbot:
         chain = self.setup_chain()
 
         # 2. Mostrar mensajes del historial (saludo inicial y conversación)
-        for msg in st.session_state["memory_chat_messages"]:
-            with st.chat_message(msg["role"]):
-                st.write(msg["content"])
+        # Solo se dibujan los últimos mensajes; los anteriores se cargan bajo demanda
+        utils.render_chat_messages("memory_chat_messages")
 
         # 3. Campo de entrada para nuevas preguntas (al final)
         user_query = st.chat_input(placeholder="¡Hazme una pregunta!")
         if user_query:
             # Añadir mensaje del usuario al historial
-            st.session_state["memory_chat_messages"].append({"role": "user", "content": user_query})
+            utils.append_chat_message("memory_chat_messages", "user", user_query)
 
             # Mostrar mensaje del usuario (se mostrará en la próxima ejecución)
             with st.chat_message("user"):
@@ -102,9 +106,7 @@ class ContextChatbot:
                 response = result["response"]
 
                 # Añadir respuesta al historial
-                st.session_state["memory_chat_messages"].append(
-                    {"role": "assistant", "content": response}
-                )
+                utils.append_chat_message("memory_chat_messages", "assistant", response)
 
 
 if __name__ == "__main__":
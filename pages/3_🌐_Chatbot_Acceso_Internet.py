@@ -16,7 +16,6 @@ st.set_page_config(
 import utils
 from langchain import hub
 from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
 from langchain.agents import AgentExecutor, create_react_agent
 from langchain_core.tools import Tool
 
@@ -27,6 +26,13 @@ from search_services import perform_web_search, format_search_results
 from custom_callbacks import CustomStreamlitCallbackHandler
 
 
+# Instrucciones fijas del prompt de respaldo (búsqueda directa + LLM)
+FALLBACK_INSTRUCTIONS = """Basándote en la información de búsqueda y el contexto de la conversación, responde a la pregunta del final.
+Proporciona una respuesta clara, concisa y bien estructurada. Si la información no es suficiente, indícalo.
+Asegúrate de mantener la coherencia con las respuestas anteriores y el contexto de la conversación.
+No menciones que estás basando tu respuesta en resultados de búsqueda. Responde como si tuvieras el conocimiento directamente."""
+
+
 class InternetChatbot:
     def __init__(self):
         utils.sync_st_session()
@@ -57,14 +63,24 @@ class InternetChatbot:
         prompt = hub.pull("hwchase17/react-chat")
 
         # Setup LLM and Agent
-        memory = ConversationBufferMemory(memory_key="chat_history")
         agent = create_react_agent(self.llm, tools, prompt)
 
-        # Configurar el agente para que sea verbose (mostrar la cadena de pensamiento)
+        # Configurar el agente para que sea verbose (mostrar la cadena de pensamiento).
+        # Sin memoria propia: el historial llega ya formateado en "chat_history"
+        # (una memoria vacía lo sobrescribiría en cada invocación)
         agent_executor = AgentExecutor(
-            agent=agent, tools=tools, memory=memory, verbose=True
+            agent=agent, tools=tools, verbose=True
+        )
+        return agent_executor
+
+    def get_conversation_context(self):
+        """Devuelve el contexto de conversación de la sesión, actualizado con los mensajes nuevos."""
+        context = utils.get_session_resources().get_or_create(
+            "internet_chat_context", utils.ConversationContext
         )
-        return agent_executor, memory
+        # Todos los mensajes salvo la pregunta actual, que se envía aparte
+        context.sync(st.session_state.messages[:-1])
+        return context
 
     @utils.enable_chat_history
     def main(self):
@@ -82,7 +98,8 @@ class InternetChatbot:
 
         # Primero configurar el LLM en la barra lateral
         st.sidebar.markdown("### 🤖 Selecciona el modelo")
-        self.llm = utils.configure_llm(key_suffix="_sidebar")
+        # Sin caché de respuestas: las preguntas sobre actualidad cambian de respuesta
+        self.llm = utils.configure_llm(key_suffix="_sidebar", response_cache=False)
 
         # Luego mostrar instrucciones específicas para el chatbot con acceso a internet
         with st.sidebar.expander("🌐 Instrucciones de uso", expanded=True):
@@ -147,7 +164,7 @@ class InternetChatbot:
 
         # Configurar el agente con manejo de errores
         try:
-            agent_executor, memory = self.setup_agent()
+            agent_executor = self.setup_agent()
         except Exception as e:
             st.error(f"Error al configurar el agente: {str(e)}")
             st.info("Intenta recargar la página o verifica tu conexión a internet.")
@@ -176,22 +193,10 @@ class InternetChatbot:
                     thought_chain = []
 
                     try:
-                        # Preparar el historial de chat para el contexto
-                        chat_history = []
-
-                        # Convertir los mensajes de la sesión en formato para el agente
-                        # Omitir el primer mensaje (saludo) para evitar confusión
-                        for i in range(1, len(st.session_state.messages)):
-                            msg = st.session_state.messages[i]
-                            # Solo incluir el contenido principal, no las cadenas de pensamiento
-                            content = msg["content"]
-                            if "---" in content:
-                                content = content.split("---")[0].strip()
-
-                            if msg["role"] == "user":
-                                chat_history.append({"type": "human", "content": content})
-                            else:
-                                chat_history.append({"type": "ai", "content": content})
+                        # Preparar el historial de chat para el contexto. Solo se procesan
+                        # los mensajes nuevos y el texto conserva el mismo prefijo entre turnos
+                        context = self.get_conversation_context()
+                        chat_history = context.as_messages()
 
                         # Registrar el historial en la cadena de pensamiento
                         if chat_history:
@@ -199,11 +204,11 @@ class InternetChatbot:
                             for msg in chat_history:
                                 thought_chain.append(f"**{msg['type']}**: {msg['content']}")
 
-                        # Intentar obtener respuesta usando el agente con el historial completo
+                        # Intentar obtener respuesta usando el agente con el historial acotado
                         result = agent_executor.invoke(
                             {
                                 "input": user_query,
-                                "chat_history": chat_history,
+                                "chat_history": context.as_text(),
                             }
                         )
                         response = result["output"]
@@ -279,29 +284,19 @@ class InternetChatbot:
                             thought_chain.append("Procesando resultados con LLM...")
 
                             # Preparar el contexto de la conversación para el prompt
-                            conversation_context = ""
-                            if len(st.session_state.messages) > 2:  # Si hay más mensajes además del saludo y la pregunta actual
-                                conversation_context = "CONTEXTO DE LA CONVERSACIÓN ANTERIOR:\n"
-                                # Tomar los últimos 4 mensajes o menos si no hay tantos
-                                start_idx = max(1, len(st.session_state.messages) - 4)  # Omitir el saludo inicial
-                                for i in range(start_idx, len(st.session_state.messages)):
-                                    msg = st.session_state.messages[i]
-                                    # Solo incluir el contenido principal, no las cadenas de pensamiento
-                                    content = msg["content"]
-                                    if "---" in content:
-                                        content = content.split("---")[0].strip()
-                                    role = "Usuario" if msg["role"] == "user" else "Asistente"
-                                    conversation_context += f"{role}: {content}\n"
-                                conversation_context += "\n"
+                            conversation_context = self.get_conversation_context().as_text()
+                            if conversation_context:
+                                conversation_context = f"CONTEXTO DE LA CONVERSACIÓN ANTERIOR:\n{conversation_context}\n\n"
 
-                            prompt_template = f"""Basándote en la siguiente información de búsqueda y el contexto de la conversación, responde a la pregunta: '{user_query}'
+                            # Las partes fijas (instrucciones e historial) van primero y lo que
+                            # cambia en cada turno (resultados y pregunta) al final, para que el
+                            # prefijo del prompt se repita entre turnos
+                            prompt_template = f"""{FALLBACK_INSTRUCTIONS}
 
-                            {conversation_context}RESULTADOS DE BÚSQUEDA:
-                            {raw_search_results}
+{conversation_context}RESULTADOS DE BÚSQUEDA:
+{raw_search_results}
 
-                            Proporciona una respuesta clara, concisa y bien estructurada. Si la información no es suficiente, indícalo.
-                            Asegúrate de mantener la coherencia con las respuestas anteriores y el contexto de la conversación.
-                            No menciones que estás basando tu respuesta en resultados de búsqueda. Responde como si tuvieras el conocimiento directamente."""
+PREGUNTA: {user_query}"""
 
                             # Guardar el prompt en la cadena de pensamiento
                             thought_chain.append("Prompt para el LLM:")
@@ -333,7 +328,7 @@ class InternetChatbot:
                     full_response += f"\n{thought}"
 
                 # Añadir la respuesta completa al historial de mensajes
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
+                utils.append_chat_message("messages", "assistant", full_response)
 
                 # No necesitamos mostrar la respuesta aquí, ya que el decorador enable_chat_history
                 # se encargará de mostrar todos los mensajes con sus cadenas de pensamiento
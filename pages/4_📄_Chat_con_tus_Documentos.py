@@ -5,7 +5,7 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import utils
 import streamlit as st
-from streaming import StreamHandler
+from streaming import CONDENSE_QUESTION_TAG, StreamHandler
 
 # Importaciones de LangChain
 try:
@@ -39,14 +39,8 @@ except ImportError:
 # Configuración de la página (debe ser la primera llamada a Streamlit)
 st.set_page_config(page_title="ChatPDF", page_icon="📄")
 
-# Inicializar mensajes si no existen
-if "doc_chat_messages" not in st.session_state:
-    st.session_state["doc_chat_messages"] = [
-        {
-            "role": "assistant",
-            "content": "Hola, soy un asistente virtual. ¿En qué puedo ayudarte hoy?",
-        }
-    ]
+# Inicializar mensajes (saludo y últimos mensajes guardados) si no existen
+utils.init_chat_messages("doc_chat_messages")
 
 class CustomDataChatbot:
 
@@ -65,8 +59,13 @@ class CustomDataChatbot:
             f.write(file.getvalue())
         return file_path
 
+    @staticmethod
+    def files_fingerprint(uploaded_files):
+        """Identifica el conjunto de archivos cargados para reutilizar su índice."""
+        return tuple((file.name, file.size) for file in uploaded_files)
+
     @st.spinner("Analizando documentos...")
-    def setup_qa_chain(self, uploaded_files):
+    def build_retriever(self, uploaded_files):
         # Cargar documentos
         docs = []
         for file in uploaded_files:
@@ -102,9 +101,9 @@ class CustomDataChatbot:
             # Crear una función para procesar con OCR sin importar el módulo completo
             try:
                 # Importar solo las funciones necesarias sin importar el módulo completo
-                import base64
-                import requests
                 from langchain_core.documents import Document
+                from utils.ocr_cache import get_ocr_cache
+                from utils.ocr_utils import OCRRequestError, ocr_pdf_by_ranges
 
                 # Función para obtener la API key de Mistral
                 def get_mistral_api_key_local():
@@ -132,55 +131,27 @@ class CustomDataChatbot:
                             # Si ya es bytes, usarlo directamente
                             bytes_data = pdf_data
 
-                        progress_bar.progress(25, text="Preparando documento...")
-
-                        # Codificar el PDF a base64
-                        encoded_pdf = base64.b64encode(bytes_data).decode("utf-8")
-                        pdf_url = f"data:application/pdf;base64,{encoded_pdf}"
-
-                        # Preparar los datos para la solicitud
-                        payload = {
-                            "model": "mistral-ocr-latest",
-                            "document": {"type": "document_url", "document_url": pdf_url},
-                        }
+                        progress_bar.progress(25, text="Enviando PDF a la API...")
 
-                        # Configurar los headers
-                        headers = {
-                            "Content-Type": "application/json",
-                            "Authorization": f"Bearer {api_key}",
-                        }
-
-                        progress_bar.progress(50, text="Enviando PDF a la API...")
+                        # Caché OCR compartida con las páginas de OCR y división por
+                        # rangos de páginas en los PDF grandes
+                        try:
+                            result = ocr_pdf_by_ranges(
+                                api_key, bytes_data, timeout=120, cache=get_ocr_cache()
+                            )
+                        except OCRRequestError as e:
+                            progress_bar.progress(100, text="Error al procesar el PDF")
+                            return {"error": str(e)}
 
-                        # Hacer la solicitud a la API de Mistral con timeout
-                        response = requests.post(
-                            "https://api.mistral.ai/v1/ocr",
-                            json=payload,
-                            headers=headers,
-                            timeout=120,  # 120 segundos de timeout para PDFs grandes
-                        )
+                        label = "PDF recuperado de la caché OCR" if result.get("cached") else "PDF procesado correctamente"
+                        progress_bar.progress(100, text=label)
 
-                        progress_bar.progress(75, text="Procesando respuesta...")
-
-                        # Revisar si la respuesta fue exitosa
-                        if response.status_code == 200:
-                            result = response.json()
-                            progress_bar.progress(100, text="PDF procesado correctamente")
-
-                            # Extraer texto del resultado
-                            if "pages" in result and isinstance(result["pages"], list):
-                                pages = result["pages"]
-                                if pages and "markdown" in pages[0]:
-                                    text = "\n\n".join(page.get("markdown", "") for page in pages if "markdown" in page)
-                                    return {"text": text}
-                            elif "text" in result:
-                                return {"text": result["text"]}
-                            else:
-                                return {"error": "No se pudo extraer texto del resultado OCR"}
-                        else:
-                            error_message = f"Error en API OCR (código {response.status_code}): {response.text}"
-                            progress_bar.progress(100, text="Error al procesar el PDF")
-                            return {"error": error_message}
+                        # Extraer texto del resultado
+                        pages = result["pages"]
+                        if pages and "markdown" in pages[0]:
+                            text = "\n\n".join(page.get("markdown", "") for page in pages if "markdown" in page)
+                            return {"text": text}
+                        return {"error": "No se pudo extraer texto del resultado OCR"}
                     except Exception as e:
                         error_message = f"Error al procesar PDF: {str(e)}"
                         progress_bar.progress(100, text=f"Error: {str(e)}")
@@ -269,18 +240,32 @@ class CustomDataChatbot:
                 st.stop()
 
         # Definir recuperador
-        retriever = vectordb.as_retriever(
+        return vectordb.as_retriever(
             search_type="mmr", search_kwargs={"k": 2, "fetch_k": 4}
         )
 
+    def setup_qa_chain(self, uploaded_files):
+        # Reutilizar el índice y la memoria mientras no cambien los archivos, para
+        # que cada pregunta solo espere al modelo y no a re-indexar los PDFs
+        fingerprint = self.files_fingerprint(uploaded_files)
+        resources = utils.get_session_resources()
+        retriever = resources.get_or_create(
+            "doc_chat_retriever", lambda: self.build_retriever(uploaded_files), key=fingerprint
+        )
         # Configurar memoria para conversación contextual
-        memory = ConversationBufferMemory(
-            memory_key="chat_history", output_key="answer", return_messages=True
+        memory = resources.get_or_create(
+            "doc_chat_memory",
+            lambda: ConversationBufferMemory(
+                memory_key="chat_history", output_key="answer", return_messages=True
+            ),
+            key=fingerprint,
         )
 
-        # Configurar LLM y cadena de QA
+        # Configurar LLM y cadena de QA. La reformulación de la pregunta se etiqueta
+        # para que StreamHandler no la muestre junto a la respuesta
         qa_chain = ConversationalRetrievalChain.from_llm(
             llm=self.llm,
+            condense_question_llm=self.llm.with_config(tags=[CONDENSE_QUESTION_TAG]),
             retriever=retriever,
             memory=memory,
             return_source_documents=True,
@@ -346,9 +331,8 @@ class CustomDataChatbot:
             st.stop()
 
         # 2. Mostrar mensajes del historial (saludo inicial y conversación)
-        for msg in st.session_state["doc_chat_messages"]:
-            with st.chat_message(msg["role"]):
-                st.write(msg["content"])
+        # Solo se dibujan los últimos mensajes; los anteriores se cargan bajo demanda
+        utils.render_chat_messages("doc_chat_messages")
 
         # 3. Campo de entrada para nuevas preguntas (al final)
         user_query = st.chat_input(
@@ -358,7 +342,7 @@ class CustomDataChatbot:
         if uploaded_files and user_query:
             try:
                 # Añadir mensaje del usuario al historial
-                st.session_state["doc_chat_messages"].append({"role": "user", "content": user_query})
+                utils.append_chat_message("doc_chat_messages", "user", user_query)
 
                 # Mostrar mensaje del usuario (se mostrará en la próxima ejecución)
                 with st.chat_message("user"):
@@ -377,30 +361,24 @@ class CustomDataChatbot:
 
                     status_text.text("Procesando tu pregunta...")
 
-                    # Generar respuesta
+                    # Generar respuesta mostrando los tokens a medida que llegan
                     with st.chat_message("assistant"):
-                        # Procesar la consulta en un contenedor oculto
-                        with st.container():
-                            # Crear un elemento vacío que no se mostrará al usuario
-                            hidden_element = st.empty()
-                            # Usar el StreamHandler con el elemento oculto
-                            st_cb = StreamHandler(hidden_element)
-                            # Invocar la cadena de QA
-                            result = qa_chain.invoke(
-                                {"question": user_query}, {"callbacks": [st_cb]}
-                            )
-                            # Obtener la respuesta
-                            response = result["answer"]
-                            # Limpiar el elemento oculto
-                            hidden_element.empty()
+                        answer_element = st.empty()
+                        st_cb = StreamHandler(answer_element, ignore_tags=[CONDENSE_QUESTION_TAG])
+                        # Invocar la cadena de QA
+                        result = qa_chain.invoke(
+                            {"question": user_query}, {"callbacks": [st_cb]}
+                        )
+                        # Obtener la respuesta
+                        response = result["answer"]
+                        status_text.empty()
 
-                        # Mostrar la respuesta una sola vez
-                        st.write(response)
+                        # Solo se vuelve a pintar si el streaming no mostró la respuesta completa
+                        if st_cb.text.strip() != response.strip():
+                            answer_element.markdown(response)
 
                         # Añadir respuesta al historial
-                        st.session_state["doc_chat_messages"].append(
-                            {"role": "assistant", "content": response}
-                        )
+                        utils.append_chat_message("doc_chat_messages", "assistant", response)
 
                         # Para mostrar referencias en un popover (no en expander)
                         st.markdown("**Fuentes de información:**")
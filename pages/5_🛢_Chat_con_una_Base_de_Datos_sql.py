@@ -7,32 +7,34 @@ import utils
 import sqlite3
 import streamlit as st
 from pathlib import Path
-from sqlalchemy import create_engine
 from urllib.parse import quote_plus
 import pymysql
 
 from langchain_community.agent_toolkits import create_sql_agent
-from langchain_community.callbacks import StreamlitCallbackHandler
-from langchain_community.utilities.sql_database import SQLDatabase
+from utils.background_runner import ConcurrencyLimitError, ProgressCallbackHandler, get_background_runner
+from utils.embedding_utils import get_embeddings
+from utils.schema_digest import EMBEDDING_MIN_TABLES
+from utils.sql_utils import StatementCancelScope, get_sql_database, get_sql_registry, statement_cancel_scope
+
+# Ejecución del agente en curso y aviso pendiente de mostrar
+RUN_STATE_KEY = "sql_agent_run_id"
+NOTICE_STATE_KEY = "sql_agent_notice"
+# Intervalo de actualización del progreso del agente (segundos)
+PROGRESS_POLL_INTERVAL = 0.5
 
 # Configuración de la página
 st.set_page_config(page_title="ChatSQL", page_icon="🛢")
 
-# Inicializar mensajes si no existen
-if "sql_chat_messages" not in st.session_state:
-    st.session_state["sql_chat_messages"] = [
-        {
-            "role": "assistant",
-            "content": "Hola, soy un asistente virtual. ¿En qué puedo ayudarte hoy?",
-        }
-    ]
+# Inicializar mensajes (saludo y últimos mensajes guardados) si no existen
+utils.init_chat_messages("sql_chat_messages")
 
 class SqlChatbot:
 
     def __init__(self):
         utils.sync_st_session()
         try:
-            self.llm = utils.configure_llm()
+            # Sin caché de respuestas: los datos de la base de datos pueden cambiar
+            self.llm = utils.configure_llm(response_cache=False)
         except Exception as e:
             st.error(f"Error al configurar el modelo de lenguaje: {str(e)}")
             st.stop()
@@ -43,16 +45,16 @@ class SqlChatbot:
                 db_filepath = (
                     Path(__file__).parent.parent / "assets/Chinook.db"
                 ).absolute()
-                db_uri = f"sqlite:////{db_filepath}"
+                db_uri = f"sqlite:///{db_filepath}"
                 creator = lambda: sqlite3.connect(
-                    f"file:{db_filepath}?mode=ro", uri=True
+                    f"file:{db_filepath}?mode=ro", uri=True, check_same_thread=False
                 )
-                db = SQLDatabase(create_engine("sqlite:///", creator=creator))
+                # El engine y el esquema se reutilizan entre reruns y sesiones
+                db = get_sql_database(db_uri, creator=creator, fingerprint_extra="ro")
             elif isinstance(connection_info, dict):
                 # Construir la URI a partir de los datos del formulario
                 db_uri = f"mysql+pymysql://{connection_info['user']}:{quote_plus(connection_info['password'])}@{connection_info['host']}:{connection_info['port']}/{connection_info['database']}"
-                engine = create_engine(db_uri)
-                db = SQLDatabase(engine)
+                db = get_sql_database(db_uri)
             else:
                 # Parsear la URI de conexión manualmente
                 parts = connection_info.split("://")
@@ -69,25 +71,48 @@ class SqlChatbot:
                 # Reconstruir la URI con la contraseña codificada y usar pymysql
                 encoded_uri = f"mysql+pymysql://{user}:{encoded_password}@{host_db}"
 
-                # Crear el engine con la URI codificada
-                engine = create_engine(encoded_uri)
-                db = SQLDatabase(engine)
+                # Obtener (o crear) el engine con la URI codificada
+                db = get_sql_database(encoded_uri)
 
             with st.sidebar.expander("Tablas de la base de datos", expanded=True):
                 st.info("\n- " + "\n- ".join(db.get_usable_table_names()))
+                if st.button("🔄 Recargar esquema", help="Vuelve a leer las tablas si la base de datos ha cambiado"):
+                    # Solo el esquema y los resultados en caché: el engine lo comparten otras sesiones
+                    get_sql_registry().invalidate(db.fingerprint)
+                    st.rerun()
             return db
         except Exception as e:
             st.error(f"Error al configurar la base de datos: {str(e)}")
             return None
 
-    def setup_sql_agent(self, db):
+    def schema_digest(self, db, question):
+        """Resumen compacto de las tablas relevantes para la pregunta."""
+        digest = db.get_schema_digest()
+        embeddings = None
+        if len(digest.tables) >= EMBEDDING_MIN_TABLES:
+            # En esquemas anchos los embeddings encuentran tablas que no coinciden por nombre
+            try:
+                embeddings = get_embeddings()
+            except Exception:
+                embeddings = None
+        return digest.digest_for(question, embeddings=embeddings)
+
+    def setup_sql_agent(self, db, question):
         try:
+            # El agente parte del esquema relevante en lugar de listar todas las tablas
+            schema_hint = (
+                "Estas son las tablas más relevantes para la pregunta "
+                "(columna tipo, PK = clave primaria, →Tabla = clave foránea):\n"
+                f"{self.schema_digest(db, question)}\n"
+                "Consultaré con sql_db_schema solo las tablas que necesite antes de escribir la consulta."
+            )
             agent = create_sql_agent(
                 llm=self.llm,
                 db=db,
                 top_k=10,
                 verbose=True,
                 agent_type="openai-tools",
+                suffix=schema_hint,
                 handle_parsing_errors=True,
                 handle_sql_errors=True,
             )
@@ -178,40 +203,109 @@ class SqlChatbot:
         if db is None:
             st.stop()
 
-        agent = self.setup_sql_agent(db)
-        if agent is None:
-            st.stop()
-
         # 2. Mostrar mensajes del historial (saludo inicial y conversación)
-        for msg in st.session_state["sql_chat_messages"]:
-            with st.chat_message(msg["role"]):
-                st.write(msg["content"])
+        # Solo se dibujan los últimos mensajes; los anteriores se cargan bajo demanda
+        utils.render_chat_messages("sql_chat_messages")
+
+        # Aviso de la última ejecución (cancelada o con error)
+        notice = st.session_state.pop(NOTICE_STATE_KEY, None)
+        if notice:
+            level, text = notice
+            getattr(st, level)(text)
 
         # 3. Campo de entrada para nuevas preguntas (al final)
-        user_query = st.chat_input(placeholder="¡Hazme una pregunta!")
+        running = get_active_run() is not None
+        user_query = st.chat_input(placeholder="¡Hazme una pregunta!", disabled=running)
 
         if user_query:
             # Añadir mensaje del usuario al historial
-            st.session_state["sql_chat_messages"].append({"role": "user", "content": user_query})
+            utils.append_chat_message("sql_chat_messages", "user", user_query)
 
             # Mostrar mensaje del usuario (se mostrará en la próxima ejecución)
             with st.chat_message("user"):
                 st.write(user_query)
 
-            # Generar respuesta
-            with st.chat_message("assistant"):
-                st_cb = StreamlitCallbackHandler(st.container())
-                try:
-                    result = agent.invoke({"input": user_query}, {"callbacks": [st_cb]})
-                    response = result["output"]
-
-                    # Añadir respuesta al historial
-                    st.session_state["sql_chat_messages"].append(
-                        {"role": "assistant", "content": response}
-                    )
-                    st.write(response)
-                except Exception as e:
-                    st.error(f"Error al procesar la consulta: {str(e)}")
+            agent = self.setup_sql_agent(db, user_query)
+            if agent is None:
+                st.stop()
+
+            self.start_agent_run(agent, user_query)
+
+        # 4. Progreso de la ejecución en curso (se actualiza sin bloquear la página)
+        if RUN_STATE_KEY in st.session_state:
+            show_agent_run()
+
+    @staticmethod
+    def start_agent_run(agent, user_query):
+        """Ejecuta el agente en segundo plano; la sentencia SQL en curso se cancela con la ejecución."""
+        def task(run):
+            scope = StatementCancelScope()
+            run.on_cancel(scope.cancel)
+            with statement_cancel_scope(scope):
+                result = agent.invoke({"input": user_query}, {"callbacks": [ProgressCallbackHandler(run)]})
+            return result["output"]
+
+        try:
+            run = get_background_runner().submit(task, name="sql_agent")
+        except ConcurrencyLimitError as e:
+            st.warning(str(e))
+            return
+        st.session_state[RUN_STATE_KEY] = run.id
+
+
+def get_active_run():
+    """Devuelve la ejecución del agente de esta sesión, si existe."""
+    run_id = st.session_state.get(RUN_STATE_KEY)
+    return get_background_runner().get(run_id) if run_id else None
+
+
+def cancel_agent_run():
+    run_id = st.session_state.get(RUN_STATE_KEY)
+    if run_id:
+        get_background_runner().cancel(run_id)
+
+
+def render_progress(run):
+    """Dibuja los pasos del agente (herramientas usadas y sus resultados)."""
+    for step in run.progress():
+        if step["kind"] == "action":
+            st.markdown(f"🛠️ **{step['tool']}**")
+            if step["tool"] == "sql_db_query":
+                st.code(step["input"], language="sql")
+            elif step["input"]:
+                st.caption(step["input"])
+        elif step["kind"] == "observation":
+            st.text(step["output"])
+        elif step["kind"] == "error":
+            st.error(step["error"])
+
+
+@st.fragment(run_every=PROGRESS_POLL_INTERVAL)
+def show_agent_run():
+    """Muestra el progreso del agente y recoge el resultado cuando termina."""
+    run = get_active_run()
+    if run is None:
+        st.session_state.pop(RUN_STATE_KEY, None)
+        return
+
+    if not run.done:
+        with st.chat_message("assistant"):
+            label = "Cancelando..." if run.cancelled else f"Consultando la base de datos... ({run.elapsed:.0f} s)"
+            with st.status(label, expanded=True):
+                render_progress(run)
+            st.button("⏹️ Cancelar consulta", on_click=cancel_agent_run, disabled=run.cancelled)
+        return
+
+    st.session_state.pop(RUN_STATE_KEY, None)
+    if run.status == "done":
+        # Añadir respuesta al historial
+        utils.append_chat_message("sql_chat_messages", "assistant", run.result)
+    elif run.status == "cancelled":
+        st.session_state[NOTICE_STATE_KEY] = ("warning", "Consulta cancelada.")
+    else:
+        st.session_state[NOTICE_STATE_KEY] = ("error", f"Error al procesar la consulta: {str(run.error)}")
+    # Volver a dibujar la página completa con la respuesta en el historial
+    st.rerun()
 
 
 if __name__ == "__main__":
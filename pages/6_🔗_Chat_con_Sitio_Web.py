@@ -13,7 +13,7 @@ import requests
 import traceback
 import validators
 import streamlit as st
-from streaming import StreamHandler
+from streaming import CONDENSE_QUESTION_TAG, StreamHandler
 from bs4 import BeautifulSoup
 
 # Importar funciones de búsqueda
@@ -44,14 +44,8 @@ except ImportError:
 # Configuración de la página (debe ser la primera llamada a Streamlit)
 st.set_page_config(page_title="ChatWebsite", page_icon="🔗")
 
-# Inicializar mensajes si no existen
-if "website_chat_messages" not in st.session_state:
-    st.session_state["website_chat_messages"] = [
-        {
-            "role": "assistant",
-            "content": "Hola, soy un asistente virtual. ¿En qué puedo ayudarte hoy?",
-        }
-    ]
+# Inicializar mensajes (saludo y últimos mensajes guardados) si no existen
+utils.init_chat_messages("website_chat_messages")
 
 class ChatbotWeb:
 
@@ -160,15 +154,33 @@ class ChatbotWeb:
 
         return formatted_text
 
-    def setup_qa_chain(self, vectordb):
-        retriever = vectordb.as_retriever(
+    def setup_retriever(self, websites):
+        with st.spinner("Procesando sitios web..."):
+            vectordb = self.setup_vectordb(websites)
+        return vectordb.as_retriever(
             search_type="mmr", search_kwargs={"k": 2, "fetch_k": 4}
         )
-        memory = ConversationBufferMemory(
-            memory_key="chat_history", output_key="answer", return_messages=True
+
+    def setup_qa_chain(self, websites):
+        # Reutilizar el índice y la memoria mientras no cambien los sitios, para que
+        # cada pregunta no vuelva a descargar y a indexar las páginas
+        index_key = tuple(sorted(websites))
+        resources = utils.get_session_resources()
+        retriever = resources.get_or_create(
+            "website_retriever", lambda: self.setup_retriever(websites), key=index_key
+        )
+        memory = resources.get_or_create(
+            "website_memory",
+            lambda: ConversationBufferMemory(
+                memory_key="chat_history", output_key="answer", return_messages=True
+            ),
+            key=index_key,
         )
+
+        # La reformulación de la pregunta se etiqueta para que no se muestre en el chat
         qa_chain = ConversationalRetrievalChain.from_llm(
             llm=self.llm,
+            condense_question_llm=self.llm.with_config(tags=[CONDENSE_QUESTION_TAG]),
             retriever=retriever,
             memory=memory,
             return_source_documents=True,
@@ -176,6 +188,12 @@ class ChatbotWeb:
         )
         return qa_chain
 
+    @staticmethod
+    def render_final_answer(answer_element, st_cb, response):
+        """Pinta la respuesta solo si el streaming no la mostró completa (p. ej. si el modelo no emitió tokens)."""
+        if st_cb.text.strip() != response.strip():
+            answer_element.markdown(response)
+
     def main(self):
         # 1. Título y subtítulo (siempre visible en la parte superior)
         st.title("Chatea con Sitios Web y Búsqueda")
@@ -255,16 +273,13 @@ class ChatbotWeb:
         # Preparar el sistema de QA si hay sitios web
         qa_chain = None
         if websites:
-            with st.spinner("Procesando sitios web..."):
-                vectordb = self.setup_vectordb(websites)
-                qa_chain = self.setup_qa_chain(vectordb)
+            qa_chain = self.setup_qa_chain(websites)
         elif self.use_search:
             st.info("Modo de búsqueda en internet activado. No se han añadido sitios web.")
 
         # 2. Mostrar mensajes del historial (saludo inicial y conversación)
-        for msg in st.session_state["website_chat_messages"]:
-            with st.chat_message(msg["role"]):
-                st.write(msg["content"])
+        # Solo se dibujan los últimos mensajes; los anteriores se cargan bajo demanda
+        utils.render_chat_messages("website_chat_messages")
 
         # 3. Campo de entrada para nuevas preguntas (al final)
         placeholder = "¡Hazme una pregunta!" if self.use_search else "¡Hazme una pregunta sobre los sitios web!"
@@ -272,7 +287,7 @@ class ChatbotWeb:
 
         if user_query:
             # Añadir mensaje del usuario al historial
-            st.session_state["website_chat_messages"].append({"role": "user", "content": user_query})
+            utils.append_chat_message("website_chat_messages", "user", user_query)
 
             # Mostrar mensaje del usuario (se mostrará en la próxima ejecución)
             with st.chat_message("user"):
@@ -304,24 +319,14 @@ class ChatbotWeb:
                         Responde de manera concisa y clara, citando las fuentes cuando sea relevante.
                         """
 
-                        # Procesar la consulta en un contenedor oculto
-                        with st.container():
-                            # Crear un elemento vacío que no se mostrará al usuario
-                            hidden_element = st.empty()
-                            # Usar el StreamHandler con el elemento oculto
-                            st_cb = StreamHandler(hidden_element)
-                            # Invocar el LLM
-                            response = self.llm.invoke(prompt, streaming=True, callbacks=[st_cb])
-                            # Limpiar el elemento oculto
-                            hidden_element.empty()
-
-                        # Mostrar la respuesta una sola vez
-                        st.write(response)
+                        # Mostrar los tokens a medida que llegan
+                        answer_element = st.empty()
+                        st_cb = StreamHandler(answer_element)
+                        response = self.llm.invoke(prompt, config={"callbacks": [st_cb]}).content
+                        self.render_final_answer(answer_element, st_cb, response)
 
                         # Añadir respuesta al historial
-                        st.session_state["website_chat_messages"].append(
-                            {"role": "assistant", "content": response}
-                        )
+                        utils.append_chat_message("website_chat_messages", "assistant", response)
 
                         # Mostrar fuentes de información en popovers
                         st.markdown("**Fuentes de información:**")
@@ -335,34 +340,23 @@ class ChatbotWeb:
                         # Si no hay resultados de búsqueda
                         response = "Lo siento, no pude encontrar información relevante para tu pregunta. Por favor, intenta reformular tu consulta o añade sitios web específicos para obtener mejores resultados."
                         st.write(response)
-                        st.session_state["website_chat_messages"].append(
-                            {"role": "assistant", "content": response}
-                        )
+                        utils.append_chat_message("website_chat_messages", "assistant", response)
 
                 # Modo de sitios web (usando qa_chain)
                 elif websites and qa_chain is not None:
-                    # Procesar la consulta en un contenedor oculto
-                    with st.container():
-                        # Crear un elemento vacío que no se mostrará al usuario
-                        hidden_element = st.empty()
-                        # Usar el StreamHandler con el elemento oculto
-                        st_cb = StreamHandler(hidden_element)
-                        # Invocar la cadena de QA
-                        result = qa_chain.invoke(
-                            {"question": user_query}, {"callbacks": [st_cb]}
-                        )
-                        # Obtener la respuesta
-                        response = result["answer"]
-                        # Limpiar el elemento oculto
-                        hidden_element.empty()
-
-                    # Mostrar la respuesta una sola vez
-                    st.write(response)
+                    # Mostrar los tokens a medida que llegan
+                    answer_element = st.empty()
+                    st_cb = StreamHandler(answer_element, ignore_tags=[CONDENSE_QUESTION_TAG])
+                    # Invocar la cadena de QA
+                    result = qa_chain.invoke(
+                        {"question": user_query}, {"callbacks": [st_cb]}
+                    )
+                    # Obtener la respuesta
+                    response = result["answer"]
+                    self.render_final_answer(answer_element, st_cb, response)
 
                     # Añadir respuesta al historial
-                    st.session_state["website_chat_messages"].append(
-                        {"role": "assistant", "content": response}
-                    )
+                    utils.append_chat_message("website_chat_messages", "assistant", response)
 
                     # Mostrar referencias a sitios web en popovers
                     st.markdown("**Fuentes de sitios web:**")
@@ -374,20 +368,16 @@ class ChatbotWeb:
 
                 # Modo híbrido: sitios web + búsqueda
                 elif self.use_search and websites and qa_chain is not None:
-                    # Primero intentar con los sitios web
-                    with st.container():
-                        # Crear un elemento vacío que no se mostrará al usuario
-                        hidden_element = st.empty()
-                        # Usar el StreamHandler con el elemento oculto
-                        st_cb = StreamHandler(hidden_element)
-                        # Invocar la cadena de QA
-                        result = qa_chain.invoke(
-                            {"question": user_query}, {"callbacks": [st_cb]}
-                        )
-                        # Obtener la respuesta
-                        response = result["answer"]
-                        # Limpiar el elemento oculto
-                        hidden_element.empty()
+                    # Primero intentar con los sitios web, mostrando los tokens a medida que llegan
+                    answer_element = st.empty()
+                    st_cb = StreamHandler(answer_element, ignore_tags=[CONDENSE_QUESTION_TAG])
+                    # Invocar la cadena de QA
+                    result = qa_chain.invoke(
+                        {"question": user_query}, {"callbacks": [st_cb]}
+                    )
+                    # Obtener la respuesta
+                    response = result["answer"]
+                    self.render_final_answer(answer_element, st_cb, response)
 
                     # Si la respuesta es vaga o indica falta de información, complementar con búsqueda web
                     if "no tengo suficiente información" in response.lower() or "no puedo responder" in response.lower():
@@ -409,10 +399,10 @@ class ChatbotWeb:
                             Proporciona una respuesta mejorada y más completa.
                             """
 
-                            # Procesar en un contenedor oculto
-                            with st.container():
-                                improved_response = self.llm.invoke(prompt)
-                                response = improved_response
+                            # La respuesta mejorada sustituye a la inicial en el mismo elemento
+                            st_cb = StreamHandler(answer_element)
+                            response = self.llm.invoke(prompt, config={"callbacks": [st_cb]}).content
+                            self.render_final_answer(answer_element, st_cb, response)
 
                             # Mostrar fuentes de búsqueda web
                             st.markdown("**Fuentes adicionales de internet:**")
@@ -423,13 +413,8 @@ class ChatbotWeb:
                                     st.markdown(f"**Extracto:** {result['snippet']}")
                                     st.markdown(f"**URL:** [{result['link']}]({result['link']})")
 
-                    # Mostrar la respuesta una sola vez
-                    st.write(response)
-
                     # Añadir respuesta al historial
-                    st.session_state["website_chat_messages"].append(
-                        {"role": "assistant", "content": response}
-                    )
+                    utils.append_chat_message("website_chat_messages", "assistant", response)
 
                     # Mostrar referencias a sitios web
                     st.markdown("**Fuentes de sitios web:**")
@@ -4,7 +4,6 @@ import base64
 import json
 import time
 import logging
-from io import BytesIO
 from typing import Dict, List, Any, Optional, Tuple
 
 # Añadir el directorio raíz al path para poder importar utils
@@ -12,7 +11,18 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import utils
 import streamlit as st
 from streaming import StreamHandler
-from PIL import Image
+from utils.image_utils import (
+    DEFAULT_IMAGE_TOKEN_BUDGET,
+    DEFAULT_MAX_SIZE,
+    DEFAULT_TARGET_BYTES,
+    DEFAULT_TILE_OVERLAP,
+    DEFAULT_TILE_SIZE,
+    ProcessedImage,
+    ProcessedImageCache,
+    get_processed_image_cache,
+    prepare_image,
+    tile_image,
+)
 
 # Configurar logging
 logging.basicConfig(
@@ -24,21 +34,15 @@ logger = logging.getLogger(__name__)
 # Configuración de la página (debe ser la primera llamada a Streamlit)
 st.set_page_config(page_title="ChatMultimodal", page_icon="🖼️")
 
-# Inicializar mensajes si no existen
-if "multimodal_chat_messages" not in st.session_state:
-    st.session_state["multimodal_chat_messages"] = [
-        {
-            "role": "assistant",
-            "content": "Hola, soy un asistente virtual. ¿En qué puedo ayudarte hoy?",
-        }
-    ]
+# Inicializar mensajes (saludo y últimos mensajes guardados) si no existen
+utils.init_chat_messages("multimodal_chat_messages")
 
 class MultimodalChatbot:
     def __init__(self):
         utils.sync_st_session()
         self.llm = None
-        self.image_data = None
-        self.image_base64 = None
+        # Imágenes a enviar al modelo (una, o vista general + fragmentos en modo mosaico)
+        self.images = []
 
     def encode_image(self, image_file):
         """Codifica una imagen a base64 para enviarla a la API."""
@@ -57,70 +61,61 @@ class MultimodalChatbot:
             st.error(f"Error al codificar la imagen: {str(e)}")
             return None
 
-    def resize_image(self, image_file, max_size=(1024, 1024)):
-        """Redimensiona una imagen si es demasiado grande."""
-        if image_file is None:
-            return None
+    def process_image(self, image_file, max_size=DEFAULT_MAX_SIZE, tiled=False):
+        """
+        Procesa una imagen para su uso con modelos multimodales.
 
-        try:
-            # Abrir la imagen con PIL
-            image = Image.open(BytesIO(image_file.getvalue()))
-
-            # Convertir a RGB si es RGBA (para evitar errores al guardar como JPEG)
-            if image.mode == 'RGBA':
-                image = image.convert('RGB')
-
-            # Verificar si la imagen necesita ser redimensionada
-            if image.width > max_size[0] or image.height > max_size[1]:
-                # Calcular la relación de aspecto
-                aspect_ratio = image.width / image.height
-
-                # Determinar nuevas dimensiones manteniendo la relación de aspecto
-                if image.width > image.height:
-                    new_width = max_size[0]
-                    new_height = int(new_width / aspect_ratio)
-                else:
-                    new_height = max_size[1]
-                    new_width = int(new_height * aspect_ratio)
-
-                # Redimensionar la imagen
-                image = image.resize((new_width, new_height), Image.LANCZOS)
-
-            # Convertir la imagen a bytes (siempre en formato JPEG para compatibilidad)
-            buffer = BytesIO()
-            image.save(buffer, format="JPEG", quality=95)
-            buffer.seek(0)
-
-            return buffer.getvalue()
-        except Exception as e:
-            st.error(f"Error al redimensionar la imagen: {str(e)}")
-            return image_file.getvalue()
-
-    def process_image(self, image_file):
-        """Procesa una imagen para su uso con modelos multimodales."""
+        Devuelve la lista de imágenes a enviar: la imagen reducida o, en modo
+        mosaico, una vista general seguida de los fragmentos con contenido.
+        """
         if image_file is None:
-            return None, None
+            return []
 
+        image_bytes = image_file.getvalue()
         try:
-            # Redimensionar la imagen si es necesario
-            image_data = self.resize_image(image_file)
-
-            # Codificar a base64
-            base64_image = base64.b64encode(image_data).decode("utf-8")
+            # La misma imagen (mismo contenido y opciones) se procesa una sola vez
+            cache = get_processed_image_cache()
+            if tiled:
+                key = ProcessedImageCache.make_key(
+                    image_bytes, "tiles", DEFAULT_TILE_SIZE, DEFAULT_TILE_OVERLAP, DEFAULT_IMAGE_TOKEN_BUDGET
+                )
+                return cache.get_or_create(key, lambda: tile_image(image_bytes)).tiles
 
-            return image_data, base64_image
+            key = ProcessedImageCache.make_key(image_bytes, max_size, DEFAULT_TARGET_BYTES)
+            # Decodificación reducida (JPEG en modo borrador) y formato/calidad según el tamaño objetivo
+            return [cache.get_or_create(key, lambda: prepare_image(image_bytes, max_size))]
         except Exception as e:
-            st.error(f"Error al procesar la imagen: {str(e)}")
-            return None, None
-
-    def get_multimodal_response(self, prompt, image_base64=None):
+            st.error(f"Error al redimensionar la imagen: {str(e)}")
+            # Enviar la imagen original si no se pudo procesar
+            mime_type = getattr(image_file, "type", None) or "image/jpeg"
+            return [ProcessedImage(image_bytes, base64.b64encode(image_bytes).decode("utf-8"), mime_type)]
+
+    @staticmethod
+    def build_user_content(prompt, images):
+        """Contenido del mensaje del usuario: pregunta e imágenes en una sola solicitud."""
+        content = [{"type": "text", "text": prompt}]
+        if len(images) > 1:
+            content.append({
+                "type": "text",
+                "text": (
+                    f"La imagen se envía como una vista general seguida de {len(images) - 1} fragmentos "
+                    "ampliados que se solapan ligeramente. Usa los fragmentos para leer los detalles "
+                    "y el texto pequeño, y la vista general para la disposición del conjunto."
+                ),
+            })
+        for image in images:
+            label = getattr(image, "label", None)
+            if len(images) > 1 and label:
+                content.append({"type": "text", "text": f"[{label}]"})
+            content.append({"type": "image_url", "image_url": {"url": image.data_url}})
+        return content
+
+    def get_multimodal_response(self, prompt, images=None):
         """Obtiene una respuesta del modelo multimodal."""
         try:
             # Verificar si tenemos una imagen
-            if image_base64:
+            if images:
                 # Usar OpenRouter para modelos multimodales
-                import openai
-
                 # Obtener API key y modelo de OpenRouter (solo modelos multimodales)
                 api_key = None
                 model_id = None
@@ -134,36 +129,43 @@ class MultimodalChatbot:
                     st.error("No se encontró la clave API de OpenRouter en secrets.toml")
                     return "Lo siento, no se pudo configurar el modelo multimodal. Por favor, verifica tu clave API de OpenRouter."
 
-                # Usar un modelo multimodal por defecto
-                model_id = "meta-llama/llama-4-maverick:free"
+                # Ordenar los modelos multimodales gratuitos por latencia observada
+                router = utils.get_model_router()
+                ranked_models = router.rank(
+                    utils.get_openrouter_free_models(), multimodal=True
+                ) or ["meta-llama/llama-4-maverick:free"]
 
-                # Crear cliente de OpenAI pero con la base_url de OpenRouter
-                client = openai.OpenAI(
+                # Reutilizar el cliente de OpenAI con la base_url de OpenRouter (conexiones en caliente)
+                client = utils.get_openai_client(
                     api_key=api_key,
-                    base_url="https://openrouter.ai/api/v1",
-                    default_headers={
-                        "HTTP-Referer": "https://github.com/bladealex9848/OmniChat",
-                        "X-Title": "OmniChat",
-                    },
+                    base_url=utils.OPENROUTER_BASE_URL,
+                    default_headers=utils.OPENROUTER_HEADERS,
+                    provider=utils.OPENROUTER_PROVIDER,
                 )
 
                 # Preparar los mensajes para la API
                 messages = [
                     {"role": "system", "content": "Eres un asistente útil que puede analizar imágenes y responder preguntas sobre ellas."},
-                    {"role": "user", "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
-                    ]}
+                    {"role": "user", "content": self.build_user_content(prompt, images)}
                 ]
 
-                # Realizar la solicitud a la API
-                response = client.chat.completions.create(
-                    model=model_id,
-                    messages=messages,
-                    stream=True
-                )
-
-                return response
+                # Realizar la solicitud al modelo más rápido; si falla, pasar al siguiente
+                last_error = None
+                for model_id in ranked_models[:3]:
+                    started_at = time.monotonic()
+                    try:
+                        response = client.chat.completions.create(
+                            model=model_id,
+                            messages=messages,
+                            stream=True
+                        )
+                    except Exception as e:
+                        router.record_failure(model_id, e)
+                        last_error = e
+                        continue
+                    return router.track_openai_stream(model_id, response, started_at)
+
+                raise last_error
             else:
                 # Si no hay imagen, usar el LLM normal
                 return self.llm.invoke(prompt, streaming=True)
@@ -207,6 +209,11 @@ class MultimodalChatbot:
             type=["jpg", "jpeg", "png"],
             help="Sube una imagen para que el modelo la analice",
         )
+        tiled = st.sidebar.toggle(
+            "🔍 Modo mosaico",
+            help="Divide las imágenes grandes (documentos, capturas) en fragmentos ampliados "
+                 "para que el modelo lea el texto pequeño a la primera",
+        )
 
         # Mostrar información del autor en la barra lateral (al final)
         try:
@@ -221,9 +228,11 @@ class MultimodalChatbot:
             st.sidebar.image(uploaded_file, caption="Imagen cargada", use_container_width=True)
 
             # Procesar la imagen
-            self.image_data, self.image_base64 = self.process_image(uploaded_file)
+            self.images = self.process_image(uploaded_file, tiled=tiled)
+            if len(self.images) > 1:
+                st.sidebar.caption(f"Modo mosaico: vista general + {len(self.images) - 1} fragmentos")
 
-            if self.image_base64 is None:
+            if not self.images:
                 st.error("No se pudo procesar la imagen. Por favor, intenta con otra imagen.")
                 st.stop()
         else:
@@ -231,18 +240,17 @@ class MultimodalChatbot:
             st.stop()
 
         # 2. Mostrar mensajes del historial (saludo inicial y conversación)
-        for msg in st.session_state["multimodal_chat_messages"]:
-            with st.chat_message(msg["role"]):
-                st.write(msg["content"])
+        # Solo se dibujan los últimos mensajes; los anteriores se cargan bajo demanda
+        utils.render_chat_messages("multimodal_chat_messages")
 
         # 3. Campo de entrada para nuevas preguntas (al final)
         user_query = st.chat_input(
             placeholder="¡Hazme una pregunta sobre la imagen!"
         )
 
-        if user_query and self.image_base64:
+        if user_query and self.images:
             # Añadir mensaje del usuario al historial
-            st.session_state["multimodal_chat_messages"].append({"role": "user", "content": user_query})
+            utils.append_chat_message("multimodal_chat_messages", "user", user_query)
 
             # Mostrar mensaje del usuario (se mostrará en la próxima ejecución)
             with st.chat_message("user"):
@@ -265,18 +273,27 @@ class MultimodalChatbot:
                     # Usar el StreamHandler con el elemento oculto
                     st_cb = StreamHandler(hidden_element)
                     # Invocar el modelo multimodal
-                    response_stream = self.get_multimodal_response(user_query, self.image_base64)
+                    response_stream = self.get_multimodal_response(
+                        user_query, self.images
+                    )
 
                     # Procesar la respuesta según si es streaming o no
-                    if hasattr(response_stream, "__iter__"):
+                    if not isinstance(response_stream, str) and hasattr(response_stream, "__iter__"):
                         # Es un objeto de streaming
                         response_text = ""
-                        for chunk in response_stream:
-                            if hasattr(chunk, "choices") and len(chunk.choices) > 0:
-                                content = chunk.choices[0].delta.content
-                                if content:
-                                    response_text += content
-                                    hidden_element.markdown(response_text)
+                        try:
+                            for chunk in response_stream:
+                                if hasattr(chunk, "choices") and len(chunk.choices) > 0:
+                                    content = chunk.choices[0].delta.content
+                                    if content:
+                                        response_text += content
+                                        hidden_element.markdown(response_text)
+                        except Exception as e:
+                            # Conexión cortada o error del proveedor a mitad del stream;
+                            # track_openai_stream ya registró el fallo en el enrutador
+                            logger.error(f"Error al obtener respuesta multimodal: {str(e)}")
+                            st.error(f"Error al obtener respuesta multimodal: {str(e)}")
+                            response_text = f"Lo siento, ocurrió un error al procesar tu solicitud: {str(e)}"
                     else:
                         # No es streaming, es una respuesta directa
                         response_text = response_stream
@@ -289,9 +306,7 @@ class MultimodalChatbot:
                 st.write(response_text)
 
                 # Añadir respuesta al historial
-                st.session_state["multimodal_chat_messages"].append(
-                    {"role": "assistant", "content": response_text}
-                )
+                utils.append_chat_message("multimodal_chat_messages", "assistant", response_text)
 
             # Limpiar el contenedor de procesamiento
             processing_container.empty()
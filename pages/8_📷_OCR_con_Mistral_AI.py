@@ -10,10 +10,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import utils
 import streamlit as st
 from streaming import StreamHandler
+from utils.ocr_cache import file_digest, get_ocr_cache
+from utils.ocr_utils import OCRRequestError, ocr_pdf_by_ranges
 
 # Configuración de la página (debe ser la primera llamada a Streamlit)
 st.set_page_config(page_title="OCR con Mistral AI", page_icon="📷")
 
+# Modelo multimodal gratuito de OpenRouter usado para el OCR de imágenes
+IMAGE_OCR_MODEL = "meta-llama/llama-4-maverick:free"
+
 # Inicializar mensajes - usando un enfoque más seguro
 # Colocamos esto en una función para garantizar que se ejecute correctamente
 def initialize_session_state():
@@ -125,7 +130,6 @@ class MistralOCRApp:
 
     def process_image_with_mistral(self, image, prompt="Eres un asistente especializado en OCR. Extrae TODO el texto visible en esta imagen. Incluye absolutamente todo el texto que puedas ver, sin importar el tamaño o la posición. No omitas ningún detalle. Si no hay texto visible, indícalo claramente."):
         """Procesa una imagen con OpenRouter para OCR usando modelos multimodales gratuitos"""
-        import openai
         import json
         from io import BytesIO
 
@@ -134,23 +138,22 @@ class MistralOCRApp:
 
         # Usar la API key de OpenRouter de la instancia
         if not self.openrouter_api_key:
-            st.error("No se encontró la clave API de OpenRouter")
-            return "Lo siento, no se pudo configurar el modelo multimodal. Por favor, proporciona una clave API de OpenRouter."
+            # None (no un mensaje) para que el error no se guarde en la caché OCR
+            st.error("No se encontró la clave API de OpenRouter. Por favor, proporciona una clave API de OpenRouter.")
+            return None
 
         # Usar un modelo multimodal gratuito de OpenRouter
-        model_id = "meta-llama/llama-4-maverick:free"
+        model_id = IMAGE_OCR_MODEL
 
         try:
             st.info("Enviando imagen a OpenRouter para OCR...")
 
-            # Crear cliente de OpenAI pero con la base_url de OpenRouter
-            client = openai.OpenAI(
+            # Reutilizar el cliente de OpenAI con la base_url de OpenRouter
+            client = utils.get_openai_client(
                 api_key=self.openrouter_api_key,
-                base_url="https://openrouter.ai/api/v1",
-                default_headers={
-                    "HTTP-Referer": "https://github.com/bladealex9848/OmniChat",
-                    "X-Title": "OmniChat",
-                },
+                base_url=utils.OPENROUTER_BASE_URL,
+                default_headers=utils.OPENROUTER_HEADERS,
+                provider=utils.OPENROUTER_PROVIDER,
             )
 
             # Preparar los mensajes para la API
@@ -179,7 +182,7 @@ class MistralOCRApp:
             # Si no se pudo extraer el contenido de la forma esperada
             st.warning("La respuesta de OpenRouter no tiene el formato esperado")
             st.write(f"Respuesta recibida: {response}")
-            return str(response)
+            return None
         except Exception as e:
             st.error(f"Error al procesar la imagen con OpenRouter: {str(e)}")
             return None
@@ -346,9 +349,21 @@ class MistralOCRApp:
                         # Usar prompt personalizado o predeterminado
                         default_prompt = "Eres un asistente especializado en OCR. Extrae TODO el texto visible en esta imagen. Incluye absolutamente todo el texto que puedas ver, sin importar el tamaño o la posición. No omitas ningún detalle. Si no hay texto visible, indícalo claramente."
                         custom_prompt = prompt if prompt else default_prompt
+
+                        # Caché OCR compartida: el modelo y el prompt forman parte de la clave
+                        with open(file_path, "rb") as f:
+                            digest = file_digest(f.read())
+                        ocr_cache = get_ocr_cache()
+                        cache_options = {"prompt": custom_prompt}
+                        cached_pages = ocr_cache.get(digest, IMAGE_OCR_MODEL, options=cache_options)
+                        if cached_pages is not None:
+                            status.update(label="Imagen recuperada de la caché OCR", state="complete")
+                            return cached_pages[0]
+
                         result = self.process_image_with_mistral(image, custom_prompt)
 
                         if result:
+                            ocr_cache.set(digest, IMAGE_OCR_MODEL, [result], options=cache_options)
                             status.update(label="Imagen procesada correctamente", state="complete")
                             return result
                         else:
@@ -373,54 +388,30 @@ class MistralOCRApp:
                         # Usar prompt personalizado o predeterminado
                         custom_prompt = prompt if prompt else "Extrae todo el texto visible en este documento."
 
-                        # Usar la API de Mistral para OCR
-                        import base64
-                        import requests
-                        import json
-
-                        # Codificar PDF en base64
-                        encoded_pdf = base64.b64encode(pdf_bytes).decode("utf-8")
-                        pdf_url = f"data:application/pdf;base64,{encoded_pdf}"
-
-                        # Preparar payload para la API
-                        payload = {
-                            "model": "mistral-ocr-latest",
-                            "document": {"type": "document_url", "document_url": pdf_url},
-                        }
-
-                        # Configurar headers
-                        headers = {
-                            "Content-Type": "application/json",
-                            "Authorization": f"Bearer {self.mistral_api_key}",
-                        }
-
-                        # Hacer la solicitud a la API
-                        response = requests.post(
-                            "https://api.mistral.ai/v1/ocr",
-                            json=payload,
-                            headers=headers,
-                            timeout=90,  # Timeout ampliado para PDFs grandes
-                        )
-
-                        # Verificar respuesta
-                        if response.status_code == 200:
-                            result = response.json()
-
-                            # Extraer texto del resultado
-                            if "pages" in result and isinstance(result["pages"], list):
-                                pages = result["pages"]
-                                if pages and "markdown" in pages[0]:
-                                    text = "\n\n".join(page.get("markdown", "") for page in pages if "markdown" in page)
-                                    status.update(label="PDF procesado correctamente", state="complete")
-                                    return text
-
-                            # Si no se pudo extraer texto estructurado
-                            status.update(label="No se pudo extraer texto estructurado del PDF", state="error")
-                            return None
-                        else:
-                            error_message = f"Error en API OCR (código {response.status_code}): {response.text[:200]}"
-                            status.update(label=error_message, state="error")
+                        # Usar la API de Mistral para OCR (con caché compartida y
+                        # división por rangos de páginas en los PDF grandes)
+                        try:
+                            result = ocr_pdf_by_ranges(
+                                self.mistral_api_key,
+                                pdf_bytes,
+                                timeout=90,  # Timeout ampliado para PDFs grandes
+                                cache=get_ocr_cache(),
+                            )
+                        except OCRRequestError as e:
+                            status.update(label=str(e)[:200], state="error")
                             return None
+
+                        # Extraer texto del resultado
+                        pages = result["pages"]
+                        if pages and "markdown" in pages[0]:
+                            text = "\n\n".join(page.get("markdown", "") for page in pages if "markdown" in page)
+                            label = "PDF recuperado de la caché OCR" if result.get("cached") else "PDF procesado correctamente"
+                            status.update(label=label, state="complete")
+                            return text
+
+                        # Si no se pudo extraer texto estructurado
+                        status.update(label="No se pudo extraer texto estructurado del PDF", state="error")
+                        return None
                     except Exception as e:
                         status.update(label=f"Error al procesar PDF: {str(e)}", state="error")
                         st.error(f"Error detallado: {str(e)}")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del tiempo de rerun frente a la longitud del historial de chat.
+
+Ejecuta una página mínima con `streamlit.testing.v1.AppTest` y mide cuánto
+tarda un rerun al dibujar historiales de distinta longitud con:
+
+- el bucle anterior (una burbuja `st.chat_message` por mensaje),
+- `render_chat_messages` con todo el historial cargado (burbujas solo para los
+  últimos mensajes y bloque agrupado para el resto),
+- `render_chat_messages` con la ventana por defecto (últimos 20 mensajes).
+
+Uso:
+    python scripts/benchmark_chat_history.py [--lengths 10 50 100 300 1000] [--reruns 5]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_TEMPLATE = """
+import sys
+sys.path.insert(0, {root!r})
+import streamlit as st
+from utils.chat_utils import render_chat_messages, render_message
+
+if {legacy!r}:
+    for msg in st.session_state["bench_messages"]:
+        render_message(msg)
+else:
+    render_chat_messages("bench_messages")
+"""
+
+
+def build_messages(count):
+    """Genera una conversación con respuestas de longitud realista."""
+    messages = [{"role": "assistant", "content": "Hola, soy un asistente virtual.", "greeting": True}]
+    for i in range(count):
+        if i % 2 == 0:
+            messages.append({"role": "user", "content": f"Pregunta número {i}: ¿puedes explicarlo con un ejemplo?"})
+        else:
+            paragraph = "Esta es una respuesta de ejemplo con **formato** y una lista:\n\n- punto uno\n- punto dos\n\n"
+            messages.append({"role": "assistant", "content": paragraph * 3})
+    return messages
+
+
+def measure(length, legacy, full_history, reruns):
+    from streamlit.testing.v1 import AppTest
+
+    # AppTest avisa de la falta de ScriptRunContext al preparar el estado fuera del script
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    at = AppTest.from_string(APP_TEMPLATE.format(root=ROOT_DIR, legacy=legacy), default_timeout=60)
+    at.session_state["bench_messages"] = build_messages(length)
+    if full_history:
+        # Simula que el usuario ha cargado todo el historial con "Cargar mensajes anteriores"
+        at.session_state["bench_messages_visible"] = length
+    at.run()
+
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), len(at.chat_message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 100, 300, 1000],
+                        help="Longitudes de historial a medir")
+    parser.add_argument("--reruns", type=int, default=5, help="Reruns medidos por caso (se usa la mediana)")
+    args = parser.parse_args()
+
+    variants = [
+        ("Una burbuja por mensaje (anterior)", True, True),
+        ("Historial cargado + bloque agrupado", False, True),
+        ("Ventana por defecto (20)", False, False),
+    ]
+
+    print(f"{'Mensajes':>9} {'Variante':38} {'burbujas':>9} {'rerun (ms)':>11}")
+    for length in args.lengths:
+        for name, legacy, full_history in variants:
+            seconds, bubbles = measure(length, legacy, full_history, args.reruns)
+            print(f"{length:>9} {name:38} {bubbles:>9} {seconds * 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la preparación de imágenes del chat multimodal.
+
+Compara, para fotos JPEG sintéticas de distintos megapíxeles:
+
+- Anterior: decodificar a resolución completa, `resize` LANCZOS a 1024 px y JPEG calidad 95.
+- `prepare_image`: decodificación JPEG en modo borrador, `thumbnail` con
+  `reducing_gap` y formato/calidad según el tamaño objetivo.
+
+Cada caso se ejecuta en un proceso nuevo para medir el pico de memoria (RSS)
+de la decodificación y el redimensionado; se informa del tiempo y del pico por
+megapíxel.
+
+Uso:
+    python scripts/benchmark_image_prep.py [--megapixels 2 12 24 40] [--repeat 3]
+"""
+
+import argparse
+import importlib
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from io import BytesIO
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def build_jpeg(megapixels):
+    """Genera una foto sintética (degradado + ruido) de `megapixels` en proporción 4:3."""
+    import numpy as np
+    from PIL import Image
+
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue(), width * height / 1_000_000
+
+
+def legacy_prepare(data, max_size=(1024, 1024)):
+    """Proceso anterior de la página multimodal."""
+    from PIL import Image
+
+    image = Image.open(BytesIO(data))
+    if image.mode == "RGBA":
+        image = image.convert("RGB")
+    if image.width > max_size[0] or image.height > max_size[1]:
+        aspect_ratio = image.width / image.height
+        if image.width > image.height:
+            new_size = (max_size[0], int(max_size[0] / aspect_ratio))
+        else:
+            new_size = (int(max_size[1] * aspect_ratio), max_size[1])
+        image = image.resize(new_size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def fast_prepare(data):
+    from utils.image_utils import prepare_image
+
+    return prepare_image(data).data
+
+
+def _reset_peak_rss():
+    """Reinicia el pico de RSS del proceso (Linux); si no es posible se mide desde el inicio."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _worker(variant, data, repeat, queue):
+    # Importar antes de medir para que el coste de importación quede en la base del RSS
+    # y no se cuente en el pico
+    importlib.import_module("PIL.Image")
+    importlib.import_module("utils.image_utils")
+
+    func = legacy_prepare if variant == "legacy" else fast_prepare
+    timings = []
+    peaks = []
+    output = b""
+    for _ in range(repeat):
+        _reset_peak_rss()
+        baseline = _peak_rss_kb()
+        start = time.perf_counter()
+        output = func(data)
+        timings.append(time.perf_counter() - start)
+        peaks.append((_peak_rss_kb() - baseline) / 1024)
+    queue.put((statistics.median(timings), max(peaks), len(output)))
+
+
+def measure(variant, data, repeat):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_worker, args=(variant, data, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[2, 12, 24, 40],
+                        help="Tamaños de imagen a medir")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por caso (se usa la mediana)")
+    args = parser.parse_args()
+
+    variants = [("Anterior (completa + LANCZOS, q95)", "legacy"), ("prepare_image (borrador + thumbnail)", "fast")]
+    print(f"{'MP':>5} {'Variante':38} {'ms':>8} {'ms/MP':>7} {'pico MB':>8} {'MB/MP':>6} {'salida KB':>10}")
+    for megapixels in args.megapixels:
+        data, actual_mp = build_jpeg(megapixels)
+        for name, variant in variants:
+            seconds, peak_mb, output_size = measure(variant, data, args.repeat)
+            print(f"{actual_mp:>5.1f} {name:38} {seconds * 1000:>8.1f} {seconds * 1000 / actual_mp:>7.1f} "
+                  f"{peak_mb:>8.1f} {peak_mb / actual_mp:>6.2f} {output_size / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de memoria al enviar un PDF grande a la API OCR.
+
+Compara, para un PDF sintético (contenido aleatorio) ya cargado en memoria
+como un archivo subido:
+
+- Anterior: `base64.b64encode(...).decode()` + f-string del data URI +
+  `requests.post(json=payload)`.
+- Cuerpo sin copias: `build_ocr_body` (base64 por bloques en un único
+  `bytearray`) enviado con `post_ocr(body=...)`.
+- Subida en streaming: `ocr_document` con la subida multipart a la API de
+  archivos y la solicitud OCR con la URL firmada.
+
+Las solicitudes van a un servidor local que imita la API de Mistral (lee y
+descarta el cuerpo). Cada caso se ejecuta en un proceso nuevo y se informa del
+pico de memoria (RSS) por encima del archivo ya cargado y del tiempo total.
+
+Uso:
+    python scripts/benchmark_ocr_upload.py [--size-mb 50]
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+class FakeMistralHandler(BaseHTTPRequestHandler):
+    """Imita los endpoints de OCR y de archivos: lee el cuerpo por bloques y lo descarta."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _discard_body(self):
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self._discard_body()
+        if self.path.startswith("/v1/files"):
+            self._reply({"id": "file-benchmark"})
+        else:
+            self._reply({"pages": [{"index": 0, "markdown": "ok"}]})
+
+    def do_GET(self):
+        self._reply({"url": "https://example.com/signed/file-benchmark"})
+
+    def do_DELETE(self):
+        self._reply({"deleted": True})
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(port_queue):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMistralHandler)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def _reset_peak_rss():
+    """Reinicia el pico de RSS del proceso (Linux); si no es posible se mide desde el inicio."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def legacy_send(api_key, uploaded_file, base_url):
+    """Proceso anterior de `process_pdf_with_mistral_ocr`."""
+    import base64
+
+    import requests
+
+    bytes_data = uploaded_file.read()
+    uploaded_file.seek(0)
+    encoded_pdf = base64.b64encode(bytes_data).decode("utf-8")
+    pdf_url = f"data:application/pdf;base64,{encoded_pdf}"
+    payload = {"model": "mistral-ocr-latest", "document": {"type": "document_url", "document_url": pdf_url}}
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+    response = requests.post(f"{base_url}/v1/ocr", json=payload, headers=headers, timeout=120)
+    return response.json()
+
+
+def body_send(api_key, uploaded_file, base_url):
+    from utils.ocr_utils import build_ocr_body, post_ocr
+
+    with uploaded_file.getbuffer() as view:
+        body = build_ocr_body(view, "application/pdf")
+    return post_ocr(api_key, body=body)
+
+
+def upload_send(api_key, uploaded_file, base_url):
+    from utils.ocr_utils import ocr_document
+
+    with uploaded_file.getbuffer() as view:
+        return ocr_document(api_key, view, "application/pdf", "benchmark.pdf", upload_min_bytes=0)
+
+
+VARIANTS = {"legacy": legacy_send, "body": body_send, "upload": upload_send}
+
+
+def _worker(variant, size_mb, base_url, queue):
+    from io import BytesIO
+
+    # Importar antes de medir para que el coste de importación quede en la base del RSS
+    # y no se cuente en el pico
+    importlib.import_module("requests")
+    from utils import ocr_utils
+
+    ocr_utils.MISTRAL_OCR_URL = f"{base_url}/v1/ocr"
+    ocr_utils.MISTRAL_FILES_URL = f"{base_url}/v1/files"
+
+    # Archivo subido tal como lo entrega Streamlit (BytesIO en memoria)
+    uploaded_file = BytesIO(b"%PDF-1.7\n" + os.urandom(size_mb * 1024 * 1024))
+    _reset_peak_rss()
+    baseline = _peak_rss_kb()
+    start = time.perf_counter()
+    VARIANTS[variant]("benchmark-key", uploaded_file, base_url)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, (_peak_rss_kb() - baseline) / 1024))
+
+
+def measure(variant, size_mb, base_url):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_worker, args=(variant, size_mb, base_url, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=50, help="Tamaño del PDF sintético en MB")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    server = context.Process(target=_serve, args=(port_queue,), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{port_queue.get()}"
+
+    variants = [
+        ("Anterior (b64encode + f-string + json=)", "legacy"),
+        ("build_ocr_body + post_ocr(body=)", "body"),
+        ("Subida multipart en streaming", "upload"),
+    ]
+    print(f"PDF de {args.size_mb} MB")
+    print(f"{'Variante':42} {'s':>6} {'pico MB':>8} {'pico / archivo':>15}")
+    try:
+        for name, variant in variants:
+            seconds, peak_mb = measure(variant, args.size_mb, base_url)
+            print(f"{name:42} {seconds:>6.2f} {peak_mb:>8.1f} {peak_mb / args.size_mb:>14.2f}x")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de tokens y latencia del esquema que recibe el agente SQL.
+
+Compara, para una serie de preguntas con sus tablas esperadas:
+
+- Esquema completo: `SQLDatabase.get_table_info()` de todas las tablas
+  (CREATE TABLE + 3 filas de ejemplo), lo que ocuparía incrustar el esquema en el prompt.
+- Flujo por defecto del agente: listado de todas las tablas (`sql_db_list_tables`)
+  más `get_table_info` de las tablas esperadas (`sql_db_schema`).
+- Resumen compacto: `SchemaDigest.digest_for(pregunta)` con las tablas relevantes.
+
+Se ejecuta sobre assets/Chinook.db y sobre una base de datos SQLite sintética de
+1.000 tablas. Para el resumen se indica además la cobertura: fracción de las
+tablas esperadas incluidas en el texto.
+
+Uso:
+    python scripts/benchmark_schema_digest.py [--tables 1000] [--embeddings]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from langchain_community.utilities.sql_database import SQLDatabase  # noqa: E402
+
+from utils.schema_digest import SchemaDigest  # noqa: E402
+from utils.token_utils import count_tokens  # noqa: E402
+
+CHINOOK_QUESTIONS = [
+    ("¿Cuáles son las 5 canciones más vendidas?", ["Track", "InvoiceLine"]),
+    ("Total de ventas por país", ["Invoice"]),
+    ("Muestra todos los clientes de USA", ["Customer"]),
+    ("Which employees support the most customers?", ["Employee", "Customer"]),
+    ("How many tracks are there per genre?", ["Track", "Genre"]),
+    ("¿Qué artistas tienen más álbumes?", ["Artist", "Album"]),
+]
+
+AREAS = [
+    "sales", "billing", "inventory", "shipping", "hr", "payroll", "crm", "marketing", "support", "finance",
+    "procurement", "warehouse", "logistics", "analytics", "catalog", "pricing", "audit", "legal", "it", "security",
+    "training", "events", "travel", "fleet", "energy", "quality", "research", "manufacturing", "retail", "ecommerce",
+    "loyalty", "subscription", "partner", "vendor", "asset", "facility", "project", "risk", "tax", "treasury",
+]
+ENTITIES = [
+    "customer", "order", "invoice", "payment", "product", "employee", "contract", "ticket", "campaign", "supplier",
+    "shipment", "account", "budget", "report", "device", "location", "schedule", "request", "document", "policy",
+    "item", "transaction", "review", "refund", "plan",
+]
+EXTRA_COLUMNS = [
+    "description TEXT", "priority INTEGER", "region TEXT", "currency TEXT", "quantity INTEGER", "discount REAL",
+    "owner_email TEXT", "notes TEXT", "updated_at TEXT", "category TEXT", "score REAL", "is_active INTEGER",
+]
+
+
+def build_synthetic_db(path, table_count, seed=7):
+    """Crea una base de datos SQLite con `table_count` tablas y 3 filas por tabla."""
+    rng = random.Random(seed)
+    names = [f"{area}_{entity}" for area in AREAS for entity in ENTITIES]
+    names = names[:table_count]
+    conn = sqlite3.connect(path)
+    for index, name in enumerate(names):
+        columns = ["id INTEGER PRIMARY KEY", "name TEXT", "status TEXT", "amount REAL", "created_at TEXT"]
+        columns += rng.sample(EXTRA_COLUMNS, rng.randint(3, 6))
+        ddl = ", ".join(columns)
+        if index:
+            parent = names[rng.randrange(index)]
+            ddl += f", {parent}_id INTEGER REFERENCES {parent}(id)"
+        conn.execute(f"CREATE TABLE {name} ({ddl})")
+        for row in range(3):
+            conn.execute(
+                f"INSERT INTO {name} (name, status, amount, created_at) VALUES (?, ?, ?, ?)",
+                (f"{name} {row}", rng.choice(["open", "closed"]), rng.random() * 1000, "2024-01-01"),
+            )
+    conn.commit()
+    conn.close()
+
+    questions = []
+    for name in rng.sample(names, 6):
+        area, entity = name.split("_", 1)
+        questions.append((f"What is the total amount of {area} {entity} records by status?", [name]))
+    return questions
+
+
+def median_ms(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def benchmark(label, db_path, questions, embeddings, repeat):
+    uri = f"sqlite:///{db_path}"
+    print(f"\n== {label} ==")
+
+    # Cada variante usa su propio SQLDatabase para no compartir metadatos reflejados
+    start = time.perf_counter()
+    full_db = SQLDatabase.from_uri(uri)
+    full_info = full_db.get_table_info()
+    full_ms = (time.perf_counter() - start) * 1000
+    full_tokens = count_tokens(full_info)
+
+    lazy_db = SQLDatabase.from_uri(uri, lazy_table_reflection=True)
+    table_names = lazy_db.get_usable_table_names()
+
+    start = time.perf_counter()
+    digest = SchemaDigest.from_engine(lazy_db._engine, table_names)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"Tablas: {len(table_names)} | resumen construido en {build_ms:.0f} ms "
+          f"({digest.stats()['digest_tokens']} tokens para todas las tablas)")
+
+    rows = []
+    for question, expected in questions:
+        default_ms, default_text = median_ms(
+            lambda: ", ".join(lazy_db.get_usable_table_names()) + "\n\n" + lazy_db.get_table_info(expected), repeat
+        )
+        digest_ms, digest_text = median_ms(lambda: digest.digest_for(question, embeddings=embeddings), repeat)
+        covered = sum(1 for table in expected if f"{table}(" in digest_text) / len(expected)
+        rows.append((question, count_tokens(default_text), default_ms, count_tokens(digest_text), digest_ms, covered))
+
+    print(f"Esquema completo: {full_tokens} tokens, {full_ms:.0f} ms (reflexión + filas de ejemplo)")
+    print(f"{'Pregunta':55} {'defecto tok':>11} {'ms':>7} {'resumen tok':>11} {'ms':>7} {'cobertura':>9}")
+    for question, default_tokens, default_ms, digest_tokens, digest_ms, covered in rows:
+        print(f"{question[:55]:55} {default_tokens:>11} {default_ms:>7.1f} {digest_tokens:>11} "
+              f"{digest_ms:>7.1f} {covered:>9.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=1000, help="Tablas de la base de datos sintética (máx. 1000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por pregunta (se usa la mediana)")
+    parser.add_argument("--embeddings", action="store_true",
+                        help="Complementar la búsqueda léxica con embeddings (descarga el modelo)")
+    args = parser.parse_args()
+
+    embeddings = None
+    if args.embeddings:
+        from utils.embedding_utils import get_embeddings
+        embeddings = get_embeddings()
+
+    benchmark("Chinook.db", os.path.join(ROOT_DIR, "assets", "Chinook.db"), CHINOOK_QUESTIONS, embeddings, args.repeat)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "synthetic.db")
+        questions = build_synthetic_db(path, min(args.tables, len(AREAS) * len(ENTITIES)))
+        benchmark(f"SQLite sintética ({args.tables} tablas)", path, questions, embeddings, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
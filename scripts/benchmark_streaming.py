@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del renderizado en streaming de StreamHandler.
+
+Simula respuestas de 4.000 tokens y compara el renderizado token a token
+(comportamiento anterior) con el renderizado agrupado por tiempo/tamaño y con
+párrafos fijados. Mide el tiempo de CPU del servidor y los bytes que se
+enviarían al navegador (texto de cada llamada a `markdown`).
+
+Uso:
+    python scripts/benchmark_streaming.py [--tokens 4000] [--token-delay 0.002]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from streaming import StreamHandler
+
+
+class RecordingElement:
+    """Elemento falso de Streamlit que contabiliza llamadas y bytes enviados."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def markdown(self, text):
+        self.stats["calls"] += 1
+        self.stats["bytes"] += len(text.encode("utf-8"))
+
+    def container(self):
+        return self
+
+    def empty(self):
+        return RecordingElement(self.stats)
+
+
+class LegacyStreamHandler:
+    """Comportamiento anterior: re-renderiza el mensaje completo en cada token."""
+
+    def __init__(self, container):
+        self.container = container
+        self.text = ""
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.text += token
+        self.container.markdown(self.text)
+
+    def on_llm_end(self, response, **kwargs):
+        pass
+
+
+def generate_tokens(count, seed=42):
+    """Genera tokens con párrafos, listas y un bloque de código, como una respuesta real."""
+    rng = random.Random(seed)
+    words = ["datos", "modelo", "respuesta", "consulta", "tabla", "imagen", "texto",
+             "usuario", "sistema", "análisis", "resultado", "proceso", "el", "la", "de"]
+    tokens = []
+    for i in range(count):
+        if i % 120 == 119:
+            tokens.append("\n\n")
+        elif i % 400 == 200:
+            tokens.append("\n\n```python\nprint('hola')\n```\n\n")
+        elif i % 60 == 30:
+            tokens.append("\n- ")
+        else:
+            tokens.append(" " + rng.choice(words))
+    return tokens
+
+
+def run(handler_factory, tokens, token_delay):
+    stats = {"calls": 0, "bytes": 0}
+    handler = handler_factory(RecordingElement(stats))
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for token in tokens:
+        handler.on_llm_new_token(token)
+        if token_delay:
+            time.sleep(token_delay)
+    handler.on_llm_end(None)
+    stats["cpu_seconds"] = time.process_time() - cpu_start
+    stats["wall_seconds"] = time.perf_counter() - wall_start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=4000, help="Tokens por respuesta")
+    parser.add_argument("--token-delay", type=float, default=0.002,
+                        help="Segundos entre tokens (simula la velocidad del modelo)")
+    args = parser.parse_args()
+
+    tokens = generate_tokens(args.tokens)
+    variants = [
+        ("Token a token (anterior)", LegacyStreamHandler),
+        ("Agrupado, sin fijar párrafos", lambda c: StreamHandler(c, freeze_blocks=False)),
+        ("Agrupado + párrafos fijados", StreamHandler),
+    ]
+
+    print(f"Respuesta simulada: {args.tokens} tokens, {args.token_delay * 1000:.1f} ms entre tokens\n")
+    print(f"{'Variante':32} {'llamadas':>9} {'KB enviados':>12} {'CPU (s)':>9} {'pared (s)':>10}")
+    for name, factory in variants:
+        stats = run(factory, tokens, args.token_delay)
+        print(
+            f"{name:32} {stats['calls']:>9} {stats['bytes'] / 1024:>12.1f} "
+            f"{stats['cpu_seconds']:>9.3f} {stats['wall_seconds']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
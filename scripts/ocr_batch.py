@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OCR por lotes desde la línea de comandos, sin Streamlit.
+
+Procesa archivos PDF e imágenes (o directorios completos) con las mismas
+funciones que `mistral_ocr_app.py` (`process_document`,
+`process_pdf_with_mistral_ocr`, `process_image_with_mistral_ocr`): los
+documentos se procesan en paralelo, los PDF grandes se dividen en rangos de
+páginas y los resultados se guardan en la caché OCR compartida.
+
+Los resultados se escriben a medida que terminan en `resultados.jsonl` (un
+objeto por documento) y/o en un archivo markdown por documento. Si el lote se
+interrumpe, al volver a ejecutarlo se omiten los documentos que ya figuran como
+correctos en el JSONL (con `--format markdown`, los que ya tienen su markdown).
+
+Uso:
+    MISTRAL_API_KEY=... python scripts/ocr_batch.py documentos/ [--recursive]
+        [--output-dir ocr_resultados] [--format both] [--workers 8]
+        [--no-optimize-images] [--no-cache] [--force]
+"""
+
+import argparse
+import io
+import json
+import logging
+import mimetypes
+import os
+import sys
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from mistral_ocr_app import process_document  # noqa: E402
+from utils.ocr_utils import DONE, FAILED, MAX_CONCURRENCY, OCRBatchExecutor  # noqa: E402
+
+logger = logging.getLogger("MistralOCR.batch")
+
+SUPPORTED_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png")
+JSONL_FILE_NAME = "resultados.jsonl"
+
+
+class NoOCRCache:
+    """Caché vacía para `--no-cache`: nunca acierta y no guarda nada."""
+
+    def get(self, *args, **kwargs):
+        return None
+
+    def set(self, *args, **kwargs):
+        pass
+
+
+def find_documents(paths, recursive=False):
+    """Devuelve los archivos soportados de `paths` (archivos o directorios), ordenados."""
+    documents = []
+    for path in paths:
+        if os.path.isfile(path):
+            documents.append(path)
+            continue
+        if not os.path.isdir(path):
+            logger.warning(f"No existe: {path}")
+            continue
+        if recursive:
+            for directory, _, file_names in os.walk(path):
+                documents.extend(os.path.join(directory, name) for name in file_names)
+        else:
+            documents.extend(
+                entry.path for entry in os.scandir(path) if entry.is_file()
+            )
+    return sorted(
+        os.path.abspath(document)
+        for document in set(documents)
+        if document.lower().endswith(SUPPORTED_EXTENSIONS)
+    )
+
+
+def load_completed(jsonl_path):
+    """Rutas ya procesadas correctamente según un JSONL de una ejecución anterior."""
+    completed = set()
+    if not os.path.exists(jsonl_path):
+        return completed
+    with open(jsonl_path, encoding="utf-8") as jsonl_file:
+        for line in jsonl_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("success"):
+                completed.add(record.get("path"))
+    return completed
+
+
+def open_document(path):
+    """Carga un archivo como lo entrega `st.file_uploader` (`BytesIO` con `name` y `type`)."""
+    with open(path, "rb") as document_file:
+        source = io.BytesIO(document_file.read())
+    source.name = os.path.basename(path)
+    source.type = mimetypes.guess_type(path)[0]
+    return source
+
+
+def markdown_path(output_dir, path, common_root):
+    """
+    Ruta del markdown de un documento, conservando la estructura de directorios.
+
+    Se mantiene la extensión original (`a.pdf.md`, `a.png.md`) para que los
+    documentos con el mismo nombre y distinto tipo no se sobrescriban.
+    """
+    relative = os.path.relpath(path, common_root)
+    return os.path.join(output_dir, "markdown", relative + ".md")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Archivos o directorios a procesar")
+    parser.add_argument("--recursive", "-r", action="store_true", help="Recorrer los subdirectorios")
+    parser.add_argument("--output-dir", "-o", default="ocr_resultados", help="Directorio de salida")
+    parser.add_argument(
+        "--format", choices=["jsonl", "markdown", "both"], default="both", help="Formato de salida"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=MAX_CONCURRENCY,
+        help=f"Documentos simultáneos (máximo {MAX_CONCURRENCY}; los PDF grandes se dividen además en rangos)",
+    )
+    parser.add_argument("--api-key", default=os.environ.get("MISTRAL_API_KEY"),
+                        help="API key de Mistral (por defecto, MISTRAL_API_KEY)")
+    parser.add_argument("--no-optimize-images", action="store_true", help="Enviar las imágenes sin optimizar")
+    parser.add_argument("--no-cache", action="store_true", help="No leer ni escribir la caché OCR")
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Reprocesar los documentos ya completados (según el JSONL o, con --format markdown, "
+             "según los markdown ya escritos)",
+    )
+    args = parser.parse_args()
+
+    if not args.api_key:
+        parser.error("Se requiere una API key de Mistral (--api-key o MISTRAL_API_KEY)")
+
+    documents = find_documents(args.paths, args.recursive)
+    if not documents:
+        print("No se encontraron documentos PDF o imágenes.")
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jsonl_path = os.path.join(args.output_dir, JSONL_FILE_NAME)
+    write_jsonl = args.format in ("jsonl", "both")
+    write_markdown = args.format in ("markdown", "both")
+
+    common_root = os.path.commonpath([os.path.dirname(document) for document in documents])
+    if not args.force:
+        if write_jsonl:
+            completed = load_completed(jsonl_path)
+        else:
+            # Sin JSONL, un documento está completado si ya tiene su markdown
+            completed = {
+                document for document in documents
+                if os.path.exists(markdown_path(args.output_dir, document, common_root))
+            }
+        skipped = sum(1 for document in documents if document in completed)
+        documents = [document for document in documents if document not in completed]
+        if skipped:
+            print(f"Se omiten {skipped} documento(s) ya procesados (usa --force para repetirlos)")
+        if not documents:
+            print("No hay documentos pendientes.")
+            return 0
+
+    ocr_cache = NoOCRCache() if args.no_cache else None
+    write_lock = threading.Lock()
+
+    def process(path):
+        # Se ejecuta en un hilo del lote; el resultado se escribe en cuanto termina
+        started = time.monotonic()
+        result = process_document(
+            args.api_key,
+            open_document(path),
+            "Archivo local",
+            not args.no_optimize_images,
+            show_status=False,
+            ocr_cache=ocr_cache,
+            store_preview=False,
+        )
+        record = {
+            "path": path,
+            "file_name": result["file_name"],
+            "success": result["success"],
+            "text": result["result_text"],
+            "ranges": result.get("ocr_ranges", []),
+            "elapsed": round(time.monotonic() - started, 3),
+        }
+        with write_lock:
+            if write_markdown and result["success"]:
+                output_path = markdown_path(args.output_dir, path, common_root)
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                with open(output_path, "w", encoding="utf-8") as markdown_file:
+                    markdown_file.write(result["result_text"])
+            if write_jsonl:
+                with open(jsonl_path, "a", encoding="utf-8") as jsonl_file:
+                    jsonl_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    total = len(documents)
+    progress = {"finished": 0}
+
+    def show_progress(states):
+        finished = sum(1 for state in states if state["status"] in (DONE, FAILED))
+        if finished != progress["finished"]:
+            progress["finished"] = finished
+            print(f"Procesados {finished}/{total}", flush=True)
+
+    print(f"Procesando {total} documento(s) con {min(args.workers, MAX_CONCURRENCY)} en paralelo")
+    start = time.perf_counter()
+    results = OCRBatchExecutor(max_workers=args.workers).run(
+        documents,
+        process,
+        on_update=show_progress,
+        is_failure=lambda record: not record["success"],
+    )
+    elapsed = time.perf_counter() - start
+
+    failures = []
+    for path, record in zip(documents, results):
+        if isinstance(record, Exception):
+            failures.append((path, str(record)))
+        elif not record["success"]:
+            failures.append((path, record["text"]))
+    for path, error in failures:
+        print(f"❌ {path}: {error}")
+    print(f"{total - len(failures)}/{total} documento(s) correctos en {elapsed:.1f} s. Resultados en {args.output_dir}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,124 @@
-from langchain_core.callbacks import BaseCallbackHandler
+import time
+
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+except ImportError:
+    # Para pruebas y benchmarks sin LangChain
+    BaseCallbackHandler = object
+
+
+# Etiqueta para las ejecuciones del LLM cuyo texto no debe mostrarse al usuario
+# (p. ej. la reformulación de la pregunta en ConversationalRetrievalChain)
+CONDENSE_QUESTION_TAG = "omnichat_condense_question"
+
+
+def _split_completed_blocks(text):
+    """
+    Separa el texto en (bloques markdown completos, resto en curso).
+
+    Un bloque está completo cuando termina en una línea en blanco fuera de un
+    bloque de código. Los bloques completos ya no cambian y pueden enviarse una
+    sola vez; solo el resto debe volver a renderizarse.
+    """
+    cut = 0
+    search_from = 0
+    while True:
+        idx = text.find("\n\n", search_from)
+        if idx == -1:
+            break
+        # No cortar dentro de un bloque de código ``` abierto
+        if text.count("```", 0, idx) % 2 == 0:
+            cut = idx + 2
+        search_from = idx + 2
+    return text[:cut], text[cut:]
+
 
 class StreamHandler(BaseCallbackHandler):
-    
-    def __init__(self, container, initial_text=""):
+    """
+    Muestra los tokens del LLM a medida que llegan, agrupándolos para no
+    re-renderizar el mensaje completo en cada token.
+
+    Los tokens se acumulan y se envían como mucho cada `min_interval` segundos o
+    cuando hay `min_chars` caracteres pendientes. Los párrafos ya terminados se
+    fijan en su propio elemento y solo se vuelve a enviar el párrafo en curso,
+    de modo que el tráfico total crece de forma lineal con la respuesta.
+
+    Args:
+        container: Contenedor de Streamlit (normalmente `st.empty()`)
+        initial_text (str): Texto inicial
+        min_interval (float): Segundos mínimos entre renderizados
+        min_chars (int): Caracteres pendientes que fuerzan un renderizado
+        freeze_blocks (bool): Si se fijan los párrafos terminados en elementos propios
+        ignore_tags (iterable): Etiquetas de ejecuciones cuyos tokens no se muestran
+    """
+
+    def __init__(self, container, initial_text="", min_interval=0.08, min_chars=80, freeze_blocks=True,
+                 ignore_tags=()):
         self.container = container
+        self.ignore_tags = set(ignore_tags)
+        self.initial_text = initial_text
         self.text = initial_text
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+        self.freeze_blocks = freeze_blocks and hasattr(container, "container")
+        self._frozen_len = 0
+        self._rendered_len = len(initial_text)
+        self._last_render = 0.0
+        self._root = None
+        self._tail = None
+
+    def _tail_element(self):
+        """Devuelve el elemento donde se muestra el párrafo en curso."""
+        if not self.freeze_blocks:
+            return self.container
+        if self._root is None:
+            self._root = self.container.container()
+            self._tail = self._root.empty()
+        return self._tail
+
+    def _render(self):
+        if self.freeze_blocks:
+            completed, _ = _split_completed_blocks(self.text[self._frozen_len:])
+            if completed.strip():
+                # Fijar los bloques terminados en el elemento actual y abrir uno nuevo
+                self._tail_element().markdown(completed)
+                self._frozen_len += len(completed)
+                self._tail = self._root.empty()
+            pending = self.text[self._frozen_len:]
+            if pending:
+                self._tail_element().markdown(pending)
+        else:
+            self.container.markdown(self.text)
+        self._rendered_len = len(self.text)
+        self._last_render = time.monotonic()
+
+    def flush(self):
+        """Renderiza cualquier token pendiente."""
+        if len(self.text) != self._rendered_len:
+            self._render()
+
+    def _is_ignored(self, kwargs):
+        return bool(self.ignore_tags) and bool(self.ignore_tags.intersection(kwargs.get("tags") or ()))
 
     def on_llm_new_token(self, token: str, **kwargs):
+        if self._is_ignored(kwargs):
+            return
         self.text += token
-        self.container.markdown(self.text)
\ No newline at end of file
+        pending = len(self.text) - self._rendered_len
+        if pending >= self.min_chars or time.monotonic() - self._last_render >= self.min_interval:
+            self._render()
+
+    def on_llm_end(self, response, **kwargs):
+        if self._is_ignored(kwargs):
+            return
+        # Las respuestas servidas desde la caché no emiten tokens: mostrarlas completas
+        if self.text == self.initial_text:
+            try:
+                cached_text = response.generations[0][0].text
+            except (AttributeError, IndexError):
+                cached_text = ""
+            self.text += cached_text or ""
+        self.flush()
+
+    def on_llm_error(self, error, **kwargs):
+        self.flush()
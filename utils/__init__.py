@@ -6,8 +6,27 @@ import sys
 import importlib.util
 
 # Importar funciones comunes
-from .chat_utils import enable_chat_history, display_msg, sync_st_session
+from .chat_utils import (
+    enable_chat_history,
+    display_msg,
+    sync_st_session,
+    get_conversation_id,
+    init_chat_messages,
+    append_chat_message,
+    clear_chat_messages,
+    render_chat_messages,
+)
 from .page_utils import setup_page
+from .llm_pool import (
+    get_client_pool,
+    get_openai_client,
+    OPENROUTER_BASE_URL,
+    OPENROUTER_HEADERS,
+    OPENROUTER_PROVIDER,
+)
+from .model_router import get_model_router
+from .session_resources import get_session_resources
+from .conversation_context import ConversationContext
 
 # Detectar si estamos en Streamlit Cloud
 is_streamlit_cloud = os.environ.get('IS_STREAMLIT_CLOUD') == 'true'
@@ -20,6 +39,7 @@ try:
             configure_llm,
             configure_openrouter_client,
             get_mistral_api_key,
+            get_openrouter_free_models,
         )
     else:
         # Versión local
@@ -27,6 +47,7 @@ try:
             configure_llm,
             configure_openrouter_client,
             get_mistral_api_key,
+            get_openrouter_free_models,
         )
 except ImportError:
     # Si no existe llm_utils_cloud.py, usar llm_utils.py
@@ -34,6 +55,7 @@ except ImportError:
         configure_llm,
         configure_openrouter_client,
         get_mistral_api_key,
+        get_openrouter_free_models,
     )
 
 # Intentar importar módulos que pueden causar problemas
@@ -0,0 +1,284 @@
+"""
+Ejecución en segundo plano de tareas largas (agentes) con progreso y cancelación.
+
+Mientras un agente trabaja, el script de Streamlit de ese usuario no debe quedar
+bloqueado: la tarea se ejecuta en un pool de hilos compartido por el proceso y
+la interfaz solo consulta periódicamente su estado y su progreso. La
+cancelación es cooperativa: el manejador de callbacks interrumpe el agente en
+el siguiente evento (token, llamada al LLM o a una herramienta) y las tareas
+pueden registrar funciones que cancelan el trabajo en curso (p. ej. la sentencia
+SQL que se está ejecutando). El número de ejecuciones simultáneas está limitado
+por sesión y en total.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+except ImportError:
+    # Para pruebas sin LangChain
+    BaseCallbackHandler = object
+
+from .session_resources import get_current_session_id
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RUNS_PER_SESSION = 1
+# Tiempo que se conservan las ejecuciones terminadas para que la interfaz recoja el resultado
+FINISHED_RUN_TTL = 10 * 60
+# Caracteres máximos de cada entrada de progreso
+MAX_PROGRESS_TEXT = 500
+
+FINAL_STATUSES = ("done", "error", "cancelled")
+
+
+class RunCancelledError(Exception):
+    """La ejecución fue cancelada por el usuario."""
+
+
+class ConcurrencyLimitError(RuntimeError):
+    """Se alcanzó el máximo de ejecuciones simultáneas de la sesión."""
+
+
+class BackgroundRun:
+    """
+    Estado de una ejecución en segundo plano.
+
+    Args:
+        run_id (str): Identificador de la ejecución
+        session_id (str): Sesión de Streamlit que la inició
+        name (str): Nombre descriptivo de la tarea
+    """
+
+    def __init__(self, run_id: str, session_id: str, name: str = ""):
+        self.id = run_id
+        self.session_id = session_id
+        self.name = name
+        # pending, running, done, error o cancelled
+        self.status = "pending"
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._progress: List[Dict[str, Any]] = []
+        self._cancel_event = threading.Event()
+        self._cancel_callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    @property
+    def cancelled(self) -> bool:
+        """Indica si se solicitó la cancelación."""
+        return self._cancel_event.is_set()
+
+    @property
+    def elapsed(self) -> float:
+        """Segundos transcurridos desde el inicio (o hasta el final)."""
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def report(self, kind: str, **data: Any) -> None:
+        """Añade una entrada de progreso (thread-safe)."""
+        entry = {"kind": kind, "elapsed": self.elapsed}
+        entry.update({key: str(value)[:MAX_PROGRESS_TEXT] for key, value in data.items()})
+        with self._lock:
+            self._progress.append(entry)
+
+    def progress(self) -> List[Dict[str, Any]]:
+        """Devuelve una copia de las entradas de progreso."""
+        with self._lock:
+            return list(self._progress)
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """
+        Registra una función que se llama al cancelar (desde el hilo que cancela).
+
+        Si la ejecución ya estaba cancelada, la función se llama de inmediato.
+        """
+        with self._lock:
+            if not self.cancelled:
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self) -> None:
+        """Solicita la cancelación y ejecuta las funciones registradas."""
+        with self._lock:
+            if self.cancelled or self.done:
+                return
+            self._cancel_event.set()
+            callbacks = list(self._cancel_callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Error al cancelar la ejecución {self.id}: {str(e)}")
+
+    def check_cancelled(self) -> None:
+        """Lanza `RunCancelledError` si se solicitó la cancelación."""
+        if self.cancelled:
+            raise RunCancelledError("Ejecución cancelada por el usuario")
+
+    def _finish(self, status: str, result: Any = None, error: Optional[BaseException] = None) -> None:
+        self.result = result
+        self.error = error
+        self.finished_at = time.monotonic()
+        self.status = status
+
+
+class ProgressCallbackHandler(BaseCallbackHandler):
+    """
+    Registra el progreso de un agente en un `BackgroundRun` y aplica la cancelación.
+
+    `raise_error` hace que `RunCancelledError` se propague y detenga el agente
+    en lugar de quedar registrado como un error del callback.
+    """
+
+    raise_error = True
+
+    def __init__(self, run: BackgroundRun):
+        self.run = run
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.run.check_cancelled()
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.run.check_cancelled()
+
+    def on_agent_action(self, action, **kwargs):
+        self.run.check_cancelled()
+        tool_input = action.tool_input
+        if isinstance(tool_input, dict) and len(tool_input) == 1:
+            tool_input = next(iter(tool_input.values()))
+        self.run.report("action", tool=action.tool, input=tool_input)
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.run.check_cancelled()
+
+    def on_tool_end(self, output, **kwargs):
+        self.run.check_cancelled()
+        self.run.report("observation", output=getattr(output, "content", output))
+
+    def on_tool_error(self, error, **kwargs):
+        self.run.report("error", error=error)
+
+
+class BackgroundRunner:
+    """
+    Pool de hilos para ejecuciones en segundo plano con límite por sesión.
+
+    Args:
+        max_workers (int): Ejecuciones simultáneas en todo el proceso
+        max_runs_per_session (int): Ejecuciones simultáneas por sesión
+        finished_ttl (int): Segundos que se conserva una ejecución terminada
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_runs_per_session: int = DEFAULT_MAX_RUNS_PER_SESSION,
+                 finished_ttl: int = FINISHED_RUN_TTL):
+        self.max_runs_per_session = max_runs_per_session
+        self.finished_ttl = finished_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background-run")
+        self._runs: Dict[str, BackgroundRun] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, task: Callable[[BackgroundRun], Any], name: str = "",
+               session_id: Optional[str] = None) -> BackgroundRun:
+        """
+        Inicia una tarea en segundo plano.
+
+        Args:
+            task (callable): Función que recibe el `BackgroundRun` y devuelve el resultado
+            name (str): Nombre descriptivo de la tarea
+            session_id (str, optional): Sesión; por defecto, la sesión de Streamlit en curso
+
+        Returns:
+            BackgroundRun: Ejecución iniciada
+
+        Raises:
+            ConcurrencyLimitError: Si la sesión ya tiene el máximo de ejecuciones activas
+        """
+        session_id = session_id or get_current_session_id()
+        with self._lock:
+            self._prune()
+            active = sum(1 for run in self._runs.values() if run.session_id == session_id and not run.done)
+            if active >= self.max_runs_per_session:
+                raise ConcurrencyLimitError(
+                    f"Ya hay {active} consulta(s) en curso. Espera a que termine o cancélala."
+                )
+            run = BackgroundRun(uuid.uuid4().hex, session_id, name)
+            self._runs[run.id] = run
+        self._executor.submit(self._execute, run, task)
+        return run
+
+    @staticmethod
+    def _execute(run: BackgroundRun, task: Callable[[BackgroundRun], Any]) -> None:
+        if run.cancelled:
+            run._finish("cancelled")
+            return
+        run.status = "running"
+        try:
+            result = task(run)
+        except RunCancelledError:
+            run._finish("cancelled")
+        except Exception as e:
+            # Los errores provocados por la cancelación (p. ej. la sentencia interrumpida) no son fallos
+            if run.cancelled:
+                run._finish("cancelled")
+            else:
+                logger.error(f"Error en la ejecución en segundo plano {run.name}: {str(e)}")
+                run._finish("error", error=e)
+        else:
+            run._finish("cancelled" if run.cancelled else "done", result=result)
+
+    def get(self, run_id: str) -> Optional[BackgroundRun]:
+        """Devuelve la ejecución o None si no existe (o ya se descartó)."""
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def cancel(self, run_id: str) -> bool:
+        """Solicita la cancelación de una ejecución. Devuelve False si no existe."""
+        run = self.get(run_id)
+        if run is None:
+            return False
+        run.cancel()
+        return True
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        expired = [
+            run_id for run_id, run in self._runs.items()
+            if run.done and now - run.finished_at > self.finished_ttl
+        ]
+        for run_id in expired:
+            del self._runs[run_id]
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve el número de ejecuciones activas y conservadas."""
+        with self._lock:
+            return {
+                "active": sum(1 for run in self._runs.values() if not run.done),
+                "runs": len(self._runs),
+            }
+
+
+_runner: Optional[BackgroundRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_background_runner() -> BackgroundRunner:
+    """Devuelve el ejecutor en segundo plano compartido por el proceso."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = BackgroundRunner()
+    return _runner
@@ -2,6 +2,9 @@
 Utilidades para el manejo de chat en Streamlit.
 """
 
+import logging
+import uuid
+
 try:
     import streamlit as st
 except ImportError:
@@ -21,6 +24,264 @@ except ImportError:
 
     st = StMock()
 
+from .conversation_store import get_conversation_store
+from .session_resources import get_session_resources
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GREETING = "Hola, soy un asistente virtual. ¿En qué puedo ayudarte hoy?"
+# Mensajes que se muestran (y se cargan del almacén) por cada página del historial
+HISTORY_PAGE_SIZE = 20
+# Mensajes más recientes que se dibujan como burbujas de chat; los anteriores se
+# agrupan en un único bloque estático
+LIVE_MESSAGES = 6
+
+_ROLE_LABELS = {"user": "👤 **Tú**", "assistant": "🤖 **Asistente**"}
+
+
+def get_conversation_id():
+    """
+    Devuelve el identificador de la conversación persistente del usuario.
+
+    Se guarda en la URL (`?chat=...`) para que la conversación se recupere al
+    recargar la página.
+    """
+    if "conversation_id" not in st.session_state:
+        conversation_id = None
+        try:
+            conversation_id = st.query_params.get("chat")
+        except Exception:
+            pass
+        st.session_state["conversation_id"] = conversation_id or uuid.uuid4().hex
+
+    conversation_id = st.session_state["conversation_id"]
+    try:
+        if st.query_params.get("chat") != conversation_id:
+            st.query_params["chat"] = conversation_id
+    except Exception:
+        pass
+    return conversation_id
+
+
+def init_chat_messages(state_key, greeting=DEFAULT_GREETING):
+    """
+    Inicializa la lista de mensajes de una página con el saludo y los últimos
+    mensajes guardados en el almacén de conversaciones.
+
+    Args:
+        state_key (str): Clave de `st.session_state` (y página en el almacén)
+        greeting (str): Mensaje de bienvenida del asistente
+
+    Returns:
+        list: Mensajes cargados
+    """
+    if state_key not in st.session_state:
+        messages = [{"role": "assistant", "content": greeting, "greeting": True}]
+        store = get_conversation_store()
+        if store is not None:
+            try:
+                messages.extend(store.fetch(get_conversation_id(), state_key, HISTORY_PAGE_SIZE))
+            except Exception as e:
+                logger.warning(f"No se pudo cargar el historial de {state_key}: {str(e)}")
+        st.session_state[state_key] = messages
+    return st.session_state[state_key]
+
+
+def append_chat_message(state_key, role, content):
+    """
+    Añade un mensaje a la conversación de la página y lo guarda en el almacén.
+
+    Args:
+        state_key (str): Clave de `st.session_state` (y página en el almacén)
+        role (str): "user" o "assistant"
+        content (str): Contenido del mensaje
+
+    Returns:
+        dict: Mensaje añadido
+    """
+    message = {"role": role, "content": content}
+    store = get_conversation_store()
+    if store is not None:
+        try:
+            message["id"] = store.append(get_conversation_id(), state_key, role, content)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el mensaje en {state_key}: {str(e)}")
+    init_chat_messages(state_key).append(message)
+    return message
+
+
+def clear_chat_messages(state_key):
+    """
+    Vacía la conversación de una página, también en el almacén.
+
+    Sin borrar las filas guardadas, `init_chat_messages` volvería a cargarlas en
+    el siguiente rerun. Las demás páginas de la conversación no se tocan.
+
+    Args:
+        state_key (str): Clave de `st.session_state` (y página en el almacén)
+    """
+    store = get_conversation_store()
+    if store is not None:
+        try:
+            store.delete_conversation(get_conversation_id(), state_key)
+        except Exception as e:
+            logger.warning(f"No se pudo borrar el historial de {state_key}: {str(e)}")
+    for key in (state_key, f"{state_key}_visible", f"{state_key}_collapsed"):
+        st.session_state.pop(key, None)
+
+
+def _split_greeting(messages):
+    """Separa el saludo inicial del resto de mensajes."""
+    if messages and messages[0].get("greeting"):
+        return messages[0], messages[1:]
+    return None, messages
+
+
+def _has_older_messages(state_key, visible):
+    _, history = _split_greeting(st.session_state[state_key])
+    if len(history) > visible:
+        return True
+    oldest_id = next((msg["id"] for msg in history if "id" in msg), None)
+    store = get_conversation_store()
+    if oldest_id is None or store is None:
+        return False
+    return store.has_older(get_conversation_id(), state_key, oldest_id)
+
+
+def _show_older_messages(state_key, page_size):
+    """Amplía la ventana visible y trae del almacén la página anterior si hace falta."""
+    visible_key = f"{state_key}_visible"
+    visible = st.session_state.get(visible_key, page_size) + page_size
+    st.session_state[visible_key] = visible
+
+    messages = st.session_state[state_key]
+    greeting, history = _split_greeting(messages)
+    oldest_id = next((msg["id"] for msg in history if "id" in msg), None)
+    store = get_conversation_store()
+    if len(history) >= visible or oldest_id is None or store is None:
+        return
+    older = store.fetch(get_conversation_id(), state_key, visible - len(history), before_id=oldest_id)
+    st.session_state[state_key] = ([greeting] if greeting else []) + older + history
+
+
+def render_message(msg, split_thoughts=False):
+    """
+    Muestra un mensaje del historial.
+
+    Args:
+        msg (dict): Mensaje con role y content
+        split_thoughts (bool): Mostrar lo que sigue a "---" como cadena de pensamiento contraída
+    """
+    with st.chat_message(msg["role"]):
+        # Verificar si el mensaje contiene una cadena de pensamiento
+        if split_thoughts and msg["role"] == "assistant" and "---" in msg["content"]:
+            # Separar la respuesta de la cadena de pensamiento
+            parts = msg["content"].split("---", 1)
+            # Mostrar solo la respuesta principal
+            st.write(parts[0].strip())
+
+            # Mostrar la cadena de pensamiento en un expansor contraído
+            with st.expander("Cadena de pensamiento", expanded=False):
+                st.markdown(parts[1].strip())
+        else:
+            # Mostrar el mensaje completo si no tiene cadena de pensamiento
+            st.write(msg["content"])
+
+
+def _message_markdown(msg, split_thoughts=False):
+    content = msg["content"]
+    if split_thoughts and msg["role"] == "assistant" and "---" in content:
+        content = content.split("---", 1)[0].strip()
+    label = _ROLE_LABELS.get(msg["role"], f"**{msg['role']}**")
+    return f"{label}\n\n{content}\n\n"
+
+
+def _message_key(msg):
+    # Los mensajes guardados tienen id; los demás se identifican por el propio objeto
+    return msg.get("id") or id(msg)
+
+
+def collapsed_history_markdown(state_key, messages, split_thoughts=False):
+    """
+    Devuelve el markdown de un bloque de mensajes antiguos, reutilizando el de reruns anteriores.
+
+    El bloque se guarda en `st.session_state` y, cuando la ventana avanza, solo se
+    añade el markdown de los mensajes nuevos en lugar de regenerarlo entero.
+
+    Args:
+        state_key (str): Clave de `st.session_state` con los mensajes
+        messages (list): Mensajes a agrupar, en orden cronológico
+        split_thoughts (bool): Omitir las cadenas de pensamiento
+
+    Returns:
+        str: Markdown del bloque
+    """
+    cache_key = f"{state_key}_collapsed"
+    cached = st.session_state.get(cache_key)
+    count = len(messages)
+    reusable = (
+        cached is not None
+        and cached["first"] == _message_key(messages[0])
+        and cached["count"] <= count
+        and cached["last"] == _message_key(messages[cached["count"] - 1])
+    )
+    if reusable:
+        parts = [cached["markdown"]]
+        parts.extend(_message_markdown(msg, split_thoughts) for msg in messages[cached["count"]:])
+    else:
+        parts = [_message_markdown(msg, split_thoughts) for msg in messages]
+
+    markdown = "".join(parts)
+    st.session_state[cache_key] = {
+        "first": _message_key(messages[0]),
+        "last": _message_key(messages[-1]),
+        "count": count,
+        "markdown": markdown,
+    }
+    return markdown
+
+
+def render_chat_messages(state_key, page_size=HISTORY_PAGE_SIZE, skip_greeting=False, split_thoughts=False,
+                         live_messages=LIVE_MESSAGES):
+    """
+    Muestra los últimos mensajes de la conversación, cargando los anteriores bajo demanda.
+
+    Cada rerun solo dibuja la ventana visible, por lo que su coste no depende de la
+    longitud total del historial. Dentro de la ventana, solo los `live_messages`
+    más recientes se dibujan como burbujas de chat; los anteriores se agrupan en
+    un único bloque markdown contraído que se construye de forma incremental.
+
+    Args:
+        state_key (str): Clave de `st.session_state` con los mensajes
+        page_size (int): Mensajes por página del historial
+        skip_greeting (bool): Ocultar el saludo cuando ya hay conversación
+        split_thoughts (bool): Separar las cadenas de pensamiento de las respuestas
+        live_messages (int): Mensajes recientes dibujados individualmente (0 = todos)
+    """
+    init_chat_messages(state_key)
+    visible = st.session_state.get(f"{state_key}_visible", page_size)
+
+    if _has_older_messages(state_key, visible):
+        st.button(
+            "⬆️ Cargar mensajes anteriores",
+            key=f"{state_key}_load_older",
+            on_click=_show_older_messages,
+            args=(state_key, page_size),
+        )
+
+    greeting, history = _split_greeting(st.session_state[state_key])
+    if greeting and not (skip_greeting and history):
+        render_message(greeting)
+
+    window = history[-visible:]
+    if live_messages and len(window) > live_messages:
+        collapsed, window = window[:-live_messages], window[-live_messages:]
+        with st.expander(f"📜 Conversación anterior ({len(collapsed)} mensajes)", expanded=False):
+            st.markdown(collapsed_history_markdown(state_key, collapsed, split_thoughts))
+    for msg in window:
+        render_message(msg, split_thoughts=split_thoughts)
+
+
 # decorator
 # Decorador para habilitar el historial de chat
 def enable_chat_history(func):
@@ -32,53 +293,22 @@ def enable_chat_history(func):
             st.session_state["current_page"] = current_page
         if st.session_state["current_page"] != current_page:
             try:
-                st.cache_resource.clear()
+                # Solo se descartan los recursos de esta sesión, no los de otros usuarios
+                get_session_resources().release_session()
                 del st.session_state["current_page"]
-                del st.session_state["messages"]
+                clear_chat_messages("messages")
             except:
                 pass
 
-        # Inicializar mensajes si no existen
-        if "messages" not in st.session_state:
-            st.session_state["messages"] = [
-                {
-                    "role": "assistant",
-                    "content": "Hola, soy un asistente virtual. ¿En qué puedo ayudarte hoy?",
-                }
-            ]
+        # Inicializar mensajes (saludo y últimos mensajes guardados) si no existen
+        init_chat_messages("messages")
 
         # Ejecutar la función decorada PRIMERO (para mostrar encabezados y manejar la lógica de la página)
         result = func(*args, **kwargs)
 
-        # DESPUÉS mostrar todos los mensajes del historial, excepto el saludo inicial
+        # DESPUÉS mostrar los mensajes del historial, excepto el saludo inicial si ya hay conversación
         # Esto asegura que el título aparezca antes que los mensajes
-
-        # Mostrar el saludo inicial solo si no hay otros mensajes
-        if len(st.session_state["messages"]) == 1 and st.session_state["messages"][0]["role"] == "assistant" and "Hola, soy un asistente virtual" in st.session_state["messages"][0]["content"]:
-            with st.chat_message("assistant"):
-                st.write(st.session_state["messages"][0]["content"])
-        else:
-            # Filtrar el mensaje de saludo si hay más mensajes
-            filtered_messages = [msg for msg in st.session_state["messages"]
-                               if not (msg["role"] == "assistant" and "Hola, soy un asistente virtual" in msg["content"])
-                               or len(st.session_state["messages"]) == 1]
-
-            # Mostrar los mensajes filtrados
-            for msg in filtered_messages:
-                with st.chat_message(msg["role"]):
-                    # Verificar si el mensaje contiene una cadena de pensamiento
-                    if msg["role"] == "assistant" and "---" in msg["content"]:
-                        # Separar la respuesta de la cadena de pensamiento
-                        parts = msg["content"].split("---", 1)
-                        # Mostrar solo la respuesta principal
-                        st.write(parts[0].strip())
-
-                        # Mostrar la cadena de pensamiento en un expansor contraído
-                        with st.expander("Cadena de pensamiento", expanded=False):
-                            st.markdown(parts[1].strip())
-                    else:
-                        # Mostrar el mensaje completo si no tiene cadena de pensamiento
-                        st.write(msg["content"])
+        render_chat_messages("messages", skip_greeting=True, split_thoughts=True)
 
         return result
 
@@ -101,7 +331,7 @@ def display_msg(msg, author):
     """
     # Solo añadir el mensaje al historial
     # No mostrarlo directamente, ya que el decorador enable_chat_history se encarga de mostrar todos los mensajes
-    st.session_state.messages.append({"role": author, "content": msg})
+    append_chat_message("messages", author, msg)
 
 
 def sync_st_session():
@@ -0,0 +1,132 @@
+"""
+Contexto de conversación incremental con prefijo estable para los prompts.
+
+En lugar de reconstruir el historial a partir de todos los mensajes en cada
+turno, `ConversationContext` procesa solo los mensajes nuevos, guarda el número
+de tokens de cada uno y mantiene el texto del historial ya formateado. Cuando el
+historial supera el presupuesto se descartan de golpe los mensajes más antiguos
+(con margen), de forma que el prefijo del prompt se mantiene idéntico durante
+varios turnos y los proveedores con caché de prompts pueden reutilizarlo.
+"""
+
+from typing import Any, Dict, List
+
+from .token_utils import count_tokens
+
+DEFAULT_MAX_CONTEXT_TOKENS = 3000
+# Fracción del presupuesto que se conserva tras descartar mensajes antiguos
+RETAIN_RATIO = 0.6
+# Separador entre la respuesta y la cadena de pensamiento en los mensajes guardados
+THOUGHT_SEPARATOR = "---"
+
+
+def _message_key(msg: Dict[str, Any]):
+    return msg.get("id") or id(msg)
+
+
+class ConversationContext:
+    """
+    Historial de conversación listo para insertarse en prompts, mantenido de forma incremental.
+
+    Args:
+        max_tokens (int): Tokens máximos del historial
+        user_label (str): Etiqueta de los mensajes del usuario
+        assistant_label (str): Etiqueta de los mensajes del asistente
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_MAX_CONTEXT_TOKENS,
+                 user_label: str = "Usuario", assistant_label: str = "Asistente"):
+        self.max_tokens = max_tokens
+        self.user_label = user_label
+        self.assistant_label = assistant_label
+        self._keys: List[Any] = []
+        # Entradas como (rol, contenido principal, línea formateada, tokens)
+        self._entries: List[tuple] = []
+        self._start = 0
+        self._window_tokens = 0
+        self._text = ""
+        self._text_end = 0
+
+    def sync(self, messages: List[Dict[str, Any]]) -> None:
+        """
+        Incorpora los mensajes nuevos de la conversación.
+
+        Solo se procesan los mensajes posteriores a los ya vistos. Si el historial
+        cambió por delante (p. ej. se cargaron mensajes antiguos), se reconstruye.
+
+        Args:
+            messages (list): Mensajes en orden cronológico (el saludo se ignora)
+        """
+        messages = [msg for msg in messages if not msg.get("greeting")]
+        seen = len(self._keys)
+        if seen and (
+            len(messages) < seen
+            or _message_key(messages[0]) != self._keys[0]
+            or _message_key(messages[seen - 1]) != self._keys[-1]
+        ):
+            self.reset()
+            seen = 0
+
+        for msg in messages[seen:]:
+            self._append(msg)
+        self._trim()
+
+    def _append(self, msg: Dict[str, Any]) -> None:
+        content = msg["content"]
+        # Solo el contenido principal, no la cadena de pensamiento
+        if THOUGHT_SEPARATOR in content:
+            content = content.split(THOUGHT_SEPARATOR, 1)[0].strip()
+        label = self.user_label if msg["role"] == "user" else self.assistant_label
+        line = f"{label}: {content}"
+        tokens = count_tokens(line)
+        self._keys.append(_message_key(msg))
+        self._entries.append((msg["role"], content, line, tokens))
+        self._window_tokens += tokens
+
+    def _trim(self) -> None:
+        """Descarta mensajes antiguos en bloque para que el prefijo cambie pocas veces."""
+        if self._window_tokens <= self.max_tokens:
+            return
+        target = self.max_tokens * RETAIN_RATIO
+        # Conservar siempre el último mensaje
+        while self._window_tokens > target and self._start < len(self._entries) - 1:
+            self._window_tokens -= self._entries[self._start][3]
+            self._start += 1
+        self._text = ""
+        self._text_end = self._start
+
+    def reset(self) -> None:
+        """Vacía el contexto."""
+        self._keys.clear()
+        self._entries.clear()
+        self._start = 0
+        self._window_tokens = 0
+        self._text = ""
+        self._text_end = 0
+
+    @property
+    def token_count(self) -> int:
+        """Tokens del historial incluido en los prompts."""
+        return self._window_tokens
+
+    def as_text(self) -> str:
+        """
+        Devuelve el historial formateado como texto ("Usuario: ...", "Asistente: ...").
+
+        El texto se amplía con las líneas nuevas en lugar de regenerarse, y su
+        prefijo no cambia hasta que se descartan mensajes antiguos.
+        """
+        if self._text_end < self._start:
+            self._text, self._text_end = "", self._start
+        new_lines = [entry[2] for entry in self._entries[self._text_end:]]
+        if new_lines:
+            self._text = "\n".join(([self._text] if self._text else []) + new_lines)
+            self._text_end = len(self._entries)
+        return self._text
+
+    def as_messages(self) -> List[Dict[str, str]]:
+        """Devuelve el historial como mensajes {"type": "human"|"ai", "content": ...}."""
+        return [
+            {"type": "human" if role == "user" else "ai", "content": content}
+            for role, content, _, _ in self._entries[self._start:]
+        ]
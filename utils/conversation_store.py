@@ -0,0 +1,135 @@
+"""
+Almacén persistente de conversaciones respaldado por SQLite.
+
+Los mensajes solo se añaden (nunca se reescriben) y se indexan por
+(conversación, página, id), de modo que recuperar los últimos N mensajes o la
+página anterior a un mensaje cuesta O(N) independientemente de la longitud
+total del historial.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .storage_utils import connect_sqlite, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    page TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation
+    ON chat_messages (conversation_id, page, id);
+"""
+
+
+class ConversationStore:
+    """
+    Historial de chat persistente por conversación y página.
+
+    Args:
+        db_path (str, optional): Ruta del archivo SQLite; por defecto, dentro de la caché local
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.path.join(get_cache_dir("conversations"), "conversations.db")
+        self._conn = connect_sqlite(self.db_path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def append(self, conversation_id: str, page: str, role: str, content: str) -> int:
+        """
+        Añade un mensaje al final de la conversación.
+
+        Returns:
+            int: Identificador del mensaje
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO chat_messages (conversation_id, page, role, content, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, page, role, content, time.time()),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def fetch(self, conversation_id: str, page: str, limit: int,
+              before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Devuelve hasta `limit` mensajes en orden cronológico.
+
+        Args:
+            conversation_id (str): Conversación
+            page (str): Página del chat
+            limit (int): Número máximo de mensajes
+            before_id (int, optional): Devolver solo mensajes anteriores a este id
+
+        Returns:
+            list: Mensajes como diccionarios con id, role y content
+        """
+        query = "SELECT id, role, content FROM chat_messages WHERE conversation_id = ? AND page = ?"
+        params: list = [conversation_id, page]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [{"id": row["id"], "role": row["role"], "content": row["content"]} for row in reversed(rows)]
+
+    def has_older(self, conversation_id: str, page: str, before_id: int) -> bool:
+        """Indica si existen mensajes anteriores a `before_id`."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM chat_messages WHERE conversation_id = ? AND page = ? AND id < ? LIMIT 1",
+                (conversation_id, page, before_id),
+            ).fetchone()
+        return row is not None
+
+    def delete_conversation(self, conversation_id: str, page: Optional[str] = None) -> None:
+        """Elimina una conversación completa (o solo la de una página)."""
+        with self._lock:
+            if page is None:
+                self._conn.execute("DELETE FROM chat_messages WHERE conversation_id = ?", (conversation_id,))
+            else:
+                self._conn.execute(
+                    "DELETE FROM chat_messages WHERE conversation_id = ? AND page = ?",
+                    (conversation_id, page),
+                )
+            self._conn.commit()
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> Optional[ConversationStore]:
+    """
+    Devuelve el almacén de conversaciones compartido por el proceso.
+
+    Returns:
+        ConversationStore o None si no se pudo abrir la base de datos
+        (el chat sigue funcionando solo con `st.session_state`)
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    _store = ConversationStore()
+                except Exception as e:
+                    logger.warning(f"No se pudo abrir el almacén de conversaciones: {str(e)}")
+                    return None
+    return _store
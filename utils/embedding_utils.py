@@ -0,0 +1,46 @@
+"""
+Acceso compartido a los modelos de embeddings usados por OmniChat.
+
+Cargar un modelo de sentence-transformers tarda varios segundos, así que las
+instancias se mantienen a nivel de proceso y se comparten entre sesiones.
+"""
+
+import logging
+import threading
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# Modelo multilingüe que ya usa el chat con documentos
+DEFAULT_EMBEDDINGS_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+_embeddings: Dict[str, Any] = {}
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings(model_name: str = DEFAULT_EMBEDDINGS_MODEL):
+    """
+    Devuelve una instancia compartida de `HuggingFaceEmbeddings` para el modelo indicado.
+
+    Args:
+        model_name (str): Nombre del modelo de sentence-transformers
+
+    Returns:
+        HuggingFaceEmbeddings: Modelo de embeddings listo para usar
+    """
+    embeddings = _embeddings.get(model_name)
+    if embeddings is not None:
+        return embeddings
+
+    with _embeddings_lock:
+        embeddings = _embeddings.get(model_name)
+        if embeddings is None:
+            try:
+                from langchain_huggingface import HuggingFaceEmbeddings
+            except ImportError:
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+
+            logger.info(f"Cargando modelo de embeddings {model_name}")
+            embeddings = HuggingFaceEmbeddings(model_name=model_name)
+            _embeddings[model_name] = embeddings
+    return embeddings
@@ -0,0 +1,372 @@
+"""
+Utilidades de imágenes para el chat multimodal.
+
+Redimensionar y codificar en base64 una foto de varios megapíxeles cuesta
+cientos de milisegundos, y Streamlit lo repetiría en cada rerun y en cada
+pregunta sobre la misma imagen. `ProcessedImageCache` guarda el resultado
+(bytes redimensionados y base64) por hash del contenido y tamaño objetivo, con
+desalojo LRU limitado en memoria.
+
+`prepare_image` evita decodificar la imagen a resolución completa: los JPEG se
+decodifican en modo borrador (1/2, 1/4 u 1/8 de la resolución) y el resto del
+escalado se hace con `thumbnail` y `reducing_gap`, que reduce primero por
+factores enteros antes del remuestreo LANCZOS final. El formato y la calidad
+se eligen por imagen según un tamaño objetivo.
+
+`tile_image` divide las imágenes grandes (documentos, capturas) en fragmentos
+con solapamiento para que el modelo lea el texto pequeño, descarta los
+fragmentos en blanco con una comprobación de varianza en NumPy y limita el
+número de fragmentos a un presupuesto de tokens.
+"""
+
+import base64
+import hashlib
+import logging
+import math
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = (1024, 1024)
+# Tamaño objetivo de la imagen codificada; por encima se baja la calidad JPEG
+DEFAULT_TARGET_BYTES = 400 * 1024
+JPEG_QUALITY_STEPS = (90, 82, 74, 65)
+# Las imágenes con pocos colores (capturas, diagramas) se envían en PNG si caben en el objetivo
+PNG_MAX_COLORS = 256
+# Modos que PNG guarda tal cual; el resto se convierte a RGB antes de codificar
+PNG_MODES = ("1", "L", "LA", "P", "RGB", "RGBA")
+# Margen de la reducción rápida respecto al tamaño final (mayor = más calidad, más lento)
+REDUCING_GAP = 2.0
+
+# Mosaico: lado de cada fragmento, solapamiento entre fragmentos vecinos y presupuesto de tokens
+DEFAULT_TILE_SIZE = 1024
+DEFAULT_TILE_OVERLAP = 0.1
+DEFAULT_IMAGE_TOKEN_BUDGET = 8000
+# Píxeles por token de imagen (estimación habitual en los modelos multimodales)
+PIXELS_PER_TOKEN = 750
+# Varianza de gris por debajo de la cual un fragmento se considera en blanco
+BLANK_TILE_VARIANCE = 20.0
+
+# Memoria máxima de la caché de imágenes procesadas (bytes + base64)
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+IMAGE_CACHE_MAX_ENTRIES = 64
+
+
+def image_digest(data: bytes) -> str:
+    """Devuelve el hash SHA-256 del contenido de la imagen."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ProcessedImage:
+    """
+    Imagen lista para enviarse a un modelo multimodal.
+
+    Args:
+        data (bytes): Imagen procesada
+        base64 (str): `data` codificada en base64
+        mime_type (str): Tipo MIME de `data`
+    """
+
+    def __init__(self, data: bytes, base64: str, mime_type: str = "image/jpeg"):
+        self.data = data
+        self.base64 = base64
+        self.mime_type = mime_type
+
+    @property
+    def size(self) -> int:
+        """Memoria aproximada ocupada por la imagen procesada."""
+        return len(self.data) + len(self.base64)
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+
+def open_reduced(data: Union[bytes, BinaryIO], max_size: Tuple[int, int] = DEFAULT_MAX_SIZE) -> Image.Image:
+    """
+    Abre una imagen ya reducida para caber en `max_size`, sin decodificarla completa si es JPEG.
+
+    Args:
+        data (bytes or file): Contenido del archivo de imagen o el archivo abierto
+        max_size (tuple): Ancho y alto máximos
+
+    Returns:
+        PIL.Image.Image: Imagen cargada y reducida
+    """
+    image = Image.open(data if hasattr(data, "read") else BytesIO(data))
+    if image.format == "JPEG":
+        # El decodificador JPEG escala por 1/2, 1/4 u 1/8 sin pasar por la resolución completa;
+        # se pide el tamaño final para que la reducción no quede por debajo de él
+        scale = min(max_size[0] / image.width, max_size[1] / image.height, 1.0)
+        image.draft("RGB", (max(int(image.width * scale), 1), max(int(image.height * scale), 1)))
+    # thumbnail aplica reduce() por factores enteros y termina con LANCZOS
+    image.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+    return image
+
+
+def _encode(image: Image.Image, image_format: str, **params) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **params)
+    return buffer.getvalue()
+
+
+def encode_for_model(image: Image.Image, target_bytes: int = DEFAULT_TARGET_BYTES) -> Tuple[bytes, str]:
+    """
+    Codifica la imagen eligiendo formato y calidad según el tamaño objetivo.
+
+    Las imágenes con transparencia o pocos colores se prueban en PNG (sin
+    pérdidas, nítido para texto); el resto, o si el PNG es demasiado grande,
+    se codifica en JPEG bajando la calidad hasta caber en `target_bytes`.
+
+    Returns:
+        tuple: (bytes codificados, tipo MIME)
+    """
+    if image.mode not in PNG_MODES:
+        # CMYK, YCbCr, I;16... no se pueden guardar (o no de forma fiable) en PNG
+        image = image.convert("RGB")
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    few_colors = image.mode in ("1", "P") or image.getcolors(PNG_MAX_COLORS) is not None
+    if has_alpha or few_colors:
+        png = _encode(image, "PNG", compress_level=6)
+        if len(png) <= target_bytes:
+            return png, "image/png"
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    jpeg = b""
+    for quality in JPEG_QUALITY_STEPS:
+        jpeg = _encode(image, "JPEG", quality=quality)
+        if len(jpeg) <= target_bytes:
+            break
+    return jpeg, "image/jpeg"
+
+
+def prepare_image(data: bytes, max_size: Tuple[int, int] = DEFAULT_MAX_SIZE,
+                  target_bytes: int = DEFAULT_TARGET_BYTES) -> ProcessedImage:
+    """
+    Reduce y codifica una imagen para enviarla a un modelo multimodal.
+
+    Args:
+        data (bytes): Contenido del archivo de imagen
+        max_size (tuple): Ancho y alto máximos
+        target_bytes (int): Tamaño objetivo de la imagen codificada
+
+    Returns:
+        ProcessedImage: Imagen codificada, su base64 y su tipo MIME
+    """
+    image = open_reduced(data, max_size)
+    encoded, mime_type = encode_for_model(image, target_bytes)
+    return ProcessedImage(encoded, base64.b64encode(encoded).decode("utf-8"), mime_type)
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Estimación de los tokens que ocupa una imagen en un prompt multimodal."""
+    return math.ceil(width * height / PIXELS_PER_TOKEN)
+
+
+class ImageTile(ProcessedImage):
+    """
+    Fragmento de una imagen (o vista general) listo para el modelo.
+
+    Args:
+        box (tuple): Región (izquierda, arriba, derecha, abajo) en la imagen de trabajo
+        label (str): Descripción de la posición del fragmento
+    """
+
+    def __init__(self, data: bytes, base64: str, mime_type: str, box: Tuple[int, int, int, int], label: str):
+        super().__init__(data, base64, mime_type)
+        self.box = box
+        self.label = label
+
+
+class TiledImage:
+    """Vista general y fragmentos de una imagen, en el orden en que se envían al modelo."""
+
+    def __init__(self, tiles: List[ImageTile], skipped: int = 0, estimated_tokens: int = 0):
+        self.tiles = tiles
+        self.skipped = skipped
+        self.estimated_tokens = estimated_tokens
+
+    @property
+    def size(self) -> int:
+        return sum(tile.size for tile in self.tiles)
+
+
+def _tile_starts(length: int, tile: int, step: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    # El último fragmento se alinea con el borde para no dejar franjas sueltas
+    starts.append(length - tile)
+    return starts
+
+
+def _grid_size(width: int, height: int, tile: int, step: int) -> int:
+    return len(_tile_starts(width, tile, step)) * len(_tile_starts(height, tile, step))
+
+
+def is_blank_tile(image: Image.Image, threshold: float = BLANK_TILE_VARIANCE) -> bool:
+    """Indica si un fragmento es casi uniforme (márgenes, fondos) a partir de su varianza de gris."""
+    import numpy as np
+
+    gray = image.convert("L")
+    # Una versión reducida basta para estimar la varianza y es mucho más barata
+    if min(gray.size) >= 64:
+        gray = gray.reduce(4)
+    return float(np.asarray(gray, dtype=np.float32).var()) < threshold
+
+
+def _encode_tile(image: Image.Image, box: Tuple[int, int, int, int], label: str, target_bytes: int) -> ImageTile:
+    encoded, mime_type = encode_for_model(image, target_bytes)
+    return ImageTile(encoded, base64.b64encode(encoded).decode("utf-8"), mime_type, box, label)
+
+
+def tile_image(data: bytes, tile_size: int = DEFAULT_TILE_SIZE, overlap: float = DEFAULT_TILE_OVERLAP,
+               token_budget: int = DEFAULT_IMAGE_TOKEN_BUDGET, include_overview: bool = True,
+               target_bytes: int = DEFAULT_TARGET_BYTES) -> TiledImage:
+    """
+    Divide una imagen grande en fragmentos solapados dentro de un presupuesto de tokens.
+
+    La imagen se reduce lo justo para que la vista general y los fragmentos
+    quepan en `token_budget`; los fragmentos en blanco se descartan. Las
+    imágenes que caben en un solo fragmento se devuelven sin dividir.
+
+    Args:
+        data (bytes): Contenido del archivo de imagen
+        tile_size (int): Lado de cada fragmento en píxeles
+        overlap (float): Fracción de solapamiento entre fragmentos vecinos
+        token_budget (int): Tokens máximos estimados para todas las imágenes
+        include_overview (bool): Enviar antes una vista general reducida
+        target_bytes (int): Tamaño objetivo de cada imagen codificada
+
+    Returns:
+        TiledImage: Imágenes a enviar y número de fragmentos descartados
+    """
+    step = max(int(tile_size * (1 - overlap)), 1)
+    tile_tokens = estimate_image_tokens(tile_size, tile_size)
+
+    with Image.open(BytesIO(data)) as probe:
+        width, height = probe.size
+    if width <= tile_size and height <= tile_size:
+        single = prepare_image(data, (tile_size, tile_size), target_bytes)
+        tile = ImageTile(single.data, single.base64, single.mime_type, (0, 0, width, height), "imagen completa")
+        return TiledImage([tile], estimated_tokens=estimate_image_tokens(width, height))
+
+    # Reducir la imagen de trabajo hasta que la cuadrícula quepa en el presupuesto
+    overview_tokens = tile_tokens if include_overview else 0
+    max_tiles = max((token_budget - overview_tokens) // tile_tokens, 1)
+    scale = 1.0
+    while scale > 0.05 and _grid_size(int(width * scale), int(height * scale), tile_size, step) > max_tiles:
+        scale *= 0.9
+    work_size = (max(int(width * scale), 1), max(int(height * scale), 1))
+    image = open_reduced(data, work_size)
+
+    tiles: List[ImageTile] = []
+    estimated_tokens = 0
+    if include_overview:
+        overview = image.copy()
+        overview.thumbnail((tile_size, tile_size), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+        tiles.append(_encode_tile(overview, (0, 0) + image.size, "vista general", target_bytes))
+        estimated_tokens += estimate_image_tokens(*overview.size)
+
+    rows = _tile_starts(image.height, tile_size, step)
+    columns = _tile_starts(image.width, tile_size, step)
+    skipped = 0
+    for row, top in enumerate(rows, start=1):
+        for column, left in enumerate(columns, start=1):
+            box = (left, top, min(left + tile_size, image.width), min(top + tile_size, image.height))
+            crop = image.crop(box)
+            if is_blank_tile(crop):
+                skipped += 1
+                continue
+            label = f"fragmento fila {row}/{len(rows)}, columna {column}/{len(columns)}"
+            tiles.append(_encode_tile(crop, box, label, target_bytes))
+            estimated_tokens += estimate_image_tokens(*crop.size)
+
+    logger.info(f"Imagen {width}x{height} dividida en {len(tiles)} imágenes ({skipped} fragmentos en blanco)")
+    return TiledImage(tiles, skipped=skipped, estimated_tokens=estimated_tokens)
+
+
+class ProcessedImageCache:
+    """
+    Caché LRU en memoria de imágenes procesadas, limitada en bytes y entradas.
+
+    Guarda `ProcessedImage` o `TiledImage` (cualquier objeto con `size`).
+
+    Args:
+        max_bytes (int): Memoria máxima ocupada por las imágenes guardadas
+        max_entries (int): Número máximo de imágenes
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_MAX_BYTES, max_entries: int = IMAGE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, ProcessedImage]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(data: bytes, *options) -> Tuple:
+        """Clave de la imagen: hash del contenido y opciones de procesado (p. ej. tamaño objetivo)."""
+        return (image_digest(data),) + tuple(options)
+
+    def get(self, key: Tuple) -> Optional[ProcessedImage]:
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return image
+
+    def set(self, key: Tuple, image: ProcessedImage) -> None:
+        if image.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = image
+            self._bytes += image.size
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def get_or_create(self, key: Tuple, factory: Callable[[], ProcessedImage]) -> ProcessedImage:
+        """Devuelve la imagen guardada o la crea con `factory` y la guarda."""
+        image = self.get(key)
+        if image is None:
+            image = factory()
+            self.set(key, image)
+        return image
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve entradas, bytes ocupados, aciertos y fallos."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+_image_cache = ProcessedImageCache()
+
+
+def get_processed_image_cache() -> ProcessedImageCache:
+    """Devuelve la caché de imágenes procesadas compartida por el proceso."""
+    return _image_cache
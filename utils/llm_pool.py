@@ -0,0 +1,318 @@
+"""
+Pool de clientes LLM reutilizables entre reruns y sesiones de Streamlit.
+
+Cada rerun de una página llamaba a `configure_llm`, que construía un `ChatOpenAI`
+nuevo con su propio pool de conexiones HTTP. Este módulo mantiene los clientes
+vivos a nivel de proceso, indexados por (proveedor, base_url, hash de la API key,
+modelo, parámetros), y comparte un único transporte httpx con keep-alive por
+cada host, de modo que las conexiones TLS calientes se reutilizan.
+
+Los transportes no se cierran al descartar clientes: objetos construidos con un
+cliente del pool (memorias, resúmenes en segundo plano) pueden seguir usándolos.
+Son pocos (uno por host), sus conexiones inactivas caducan solas y se cierran
+al terminar el proceso.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import httpx
+except ImportError:
+    # Sin httpx cada cliente usará su propio pool de conexiones
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Proveedores conocidos
+OPENAI_PROVIDER = "openai"
+OPENROUTER_PROVIDER = "openrouter"
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "https://github.com/bladealex9848/OmniChat",
+    "X-Title": "OmniChat",
+}
+
+# Tiempo (segundos) tras el cual se descarta un cliente que no se ha usado
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+# Límites del transporte compartido por host
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE = 20
+DEFAULT_KEEPALIVE_EXPIRY = 120.0
+
+
+def hash_api_key(api_key: Optional[str]) -> str:
+    """
+    Devuelve un hash corto de la API key para usarlo como parte de la clave del pool
+    sin guardar la clave en claro.
+    """
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def make_client_key(
+    provider: str,
+    base_url: Optional[str],
+    api_key: Optional[str],
+    model: Optional[str],
+    params: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, str, str, str, str]:
+    """
+    Construye la clave del pool a partir de los datos que identifican un cliente.
+
+    Returns:
+        tuple: (proveedor, base_url, hash de la API key, modelo, parámetros serializados)
+    """
+    serialized_params = json.dumps(params or {}, sort_keys=True, default=str)
+    return (provider, base_url or "", hash_api_key(api_key), model or "", serialized_params)
+
+
+class _PoolEntry:
+    """Cliente almacenado en el pool junto con su último uso."""
+
+    __slots__ = ("client", "host", "last_used")
+
+    def __init__(self, client: Any, host: str):
+        self.client = client
+        self.host = host
+        self.last_used = time.monotonic()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+
+class LLMClientPool:
+    """
+    Pool de clientes LLM compartido por todas las sesiones del servidor.
+
+    Los clientes se crean mediante una función fábrica que recibe el transporte
+    httpx compartido del host correspondiente. Los clientes y transportes que no
+    se usan durante `idle_timeout` segundos se descartan.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._lock = threading.RLock()
+        self._entries: Dict[Tuple[str, ...], _PoolEntry] = {}
+        self._http_clients: Dict[str, Any] = {}
+
+    def _host_for(self, base_url: Optional[str]) -> str:
+        """Normaliza la base_url al host que comparte el transporte."""
+        if not base_url:
+            return "https://api.openai.com"
+        if httpx is not None:
+            try:
+                url = httpx.URL(base_url)
+                return f"{url.scheme}://{url.host}"
+            except Exception:
+                pass
+        return base_url.rstrip("/")
+
+    def _get_http_client(self, host: str):
+        """Obtiene (o crea) el cliente httpx con keep-alive para un host."""
+        if httpx is None:
+            return None
+
+        http_client = self._http_clients.get(host)
+        if http_client is None or http_client.is_closed:
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(600.0, connect=10.0),
+            )
+            self._http_clients[host] = http_client
+            logger.info(f"Transporte HTTP compartido creado para {host}")
+        return http_client
+
+    def _evict_idle(self):
+        """Descarta clientes inactivos (los transportes compartidos siguen abiertos)."""
+        now = time.monotonic()
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if now - entry.last_used > self.idle_timeout
+        ]
+        for key in expired:
+            del self._entries[key]
+
+        if expired:
+            logger.info(f"Se descartaron {len(expired)} cliente(s) LLM inactivos")
+
+    def get_or_create(
+        self,
+        provider: str,
+        base_url: Optional[str],
+        api_key: Optional[str],
+        model: Optional[str],
+        params: Optional[Dict[str, Any]],
+        factory: Callable[[Any], Any],
+    ) -> Any:
+        """
+        Devuelve el cliente asociado a la clave o lo crea con `factory`.
+
+        Args:
+            provider (str): Nombre del proveedor (openai, openrouter, ...)
+            base_url (str, optional): URL base de la API
+            api_key (str, optional): Clave API (solo se guarda su hash)
+            model (str, optional): Identificador del modelo
+            params (dict, optional): Parámetros que diferencian al cliente
+            factory (callable): Función que recibe el cliente httpx compartido
+                                (o None) y devuelve el cliente LLM
+
+        Returns:
+            Any: Cliente reutilizable
+        """
+        key = make_client_key(provider, base_url, api_key, model, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.touch()
+                return entry.client
+
+            self._evict_idle()
+            host = self._host_for(base_url)
+            client = factory(self._get_http_client(host))
+            self._entries[key] = _PoolEntry(client, host)
+            logger.info(f"Cliente LLM creado para {provider}/{model}")
+            return client
+
+    def clear(self):
+        """Descarta todos los clientes (los transportes compartidos siguen abiertos)."""
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        """Cierra los transportes compartidos (al terminar el proceso)."""
+        with self._lock:
+            for http_client in self._http_clients.values():
+                try:
+                    http_client.close()
+                except Exception:
+                    pass
+            self._http_clients.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve el número de clientes y transportes vivos."""
+        with self._lock:
+            return {
+                "clients": len(self._entries),
+                "transports": len(self._http_clients),
+            }
+
+
+_client_pool: Optional[LLMClientPool] = None
+_client_pool_lock = threading.Lock()
+
+
+def get_client_pool() -> LLMClientPool:
+    """Devuelve el pool de clientes del proceso (compartido entre sesiones)."""
+    global _client_pool
+    if _client_pool is None:
+        with _client_pool_lock:
+            if _client_pool is None:
+                _client_pool = LLMClientPool()
+                atexit.register(_client_pool.close)
+    return _client_pool
+
+
+def get_chat_model(
+    chat_model_cls,
+    provider: str,
+    model: str,
+    api_key: str,
+    base_url: Optional[str] = None,
+    default_headers: Optional[Dict[str, str]] = None,
+    **params,
+):
+    """
+    Devuelve un modelo de chat de LangChain (p. ej. `ChatOpenAI`) desde el pool.
+
+    Args:
+        chat_model_cls: Clase del modelo de chat a instanciar
+        provider (str): Nombre del proveedor
+        model (str): Identificador del modelo
+        api_key (str): Clave API
+        base_url (str, optional): URL base de la API
+        default_headers (dict, optional): Cabeceras fijas del proveedor
+        **params: Parámetros adicionales del modelo (temperature, streaming, ...)
+
+    Returns:
+        Instancia reutilizable de `chat_model_cls`
+    """
+
+    def factory(http_client):
+        kwargs = dict(params)
+        kwargs["model"] = model
+        kwargs["api_key"] = api_key
+        if base_url:
+            kwargs["base_url"] = base_url
+        if default_headers:
+            kwargs["default_headers"] = default_headers
+        if http_client is not None:
+            kwargs["http_client"] = http_client
+        return chat_model_cls(**kwargs)
+
+    key_params = dict(params)
+    key_params["default_headers"] = default_headers or {}
+    key_params["model_cls"] = getattr(chat_model_cls, "__name__", str(chat_model_cls))
+    return get_client_pool().get_or_create(
+        provider, base_url, api_key, model, key_params, factory
+    )
+
+
+def get_openai_client(
+    api_key: str,
+    base_url: Optional[str] = None,
+    default_headers: Optional[Dict[str, str]] = None,
+    provider: str = OPENAI_PROVIDER,
+):
+    """
+    Devuelve un cliente `openai.OpenAI` reutilizable desde el pool.
+
+    Args:
+        api_key (str): Clave API
+        base_url (str, optional): URL base de la API (p. ej. OpenRouter)
+        default_headers (dict, optional): Cabeceras fijas del proveedor
+        provider (str): Nombre del proveedor
+
+    Returns:
+        openai.OpenAI: Cliente reutilizable
+    """
+    import openai
+
+    def factory(http_client):
+        kwargs = {"api_key": api_key}
+        if base_url:
+            kwargs["base_url"] = base_url
+        if default_headers:
+            kwargs["default_headers"] = default_headers
+        if http_client is not None:
+            kwargs["http_client"] = http_client
+        return openai.OpenAI(**kwargs)
+
+    return get_client_pool().get_or_create(
+        provider,
+        base_url,
+        api_key,
+        None,
+        {"client": "openai.OpenAI", "default_headers": default_headers or {}},
+        factory,
+    )
@@ -5,10 +5,26 @@ Utilidades para la configuración y manejo de modelos de lenguaje (LLMs).
 import os
 import json
 import openai
+import time
 import requests
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+from .llm_pool import (
+    OPENAI_PROVIDER,
+    OPENROUTER_PROVIDER,
+    OPENROUTER_BASE_URL,
+    OPENROUTER_HEADERS,
+    get_chat_model,
+    get_openai_client,
+)
+from .response_cache import get_response_cache
+from .model_router import AUTO_ROUTE_MODEL_ID, build_routed_openrouter_llm, get_model_router
+
+# Catálogo de modelos gratuitos de OpenRouter (se consulta como máximo cada pocos minutos)
+OPENROUTER_MODELS_TTL = 5 * 60
+_openrouter_models_cache = {"models": None, "expires_at": 0.0}
+
 try:
     import streamlit as st
     from langchain_openai import ChatOpenAI
@@ -62,7 +78,7 @@ except ImportError:
     st = StMock()
 
     class ChatOpenAI:
-        def __init__(self, model_name=None, model=None, temperature=0, streaming=True, api_key=None, base_url=None, default_headers=None):
+        def __init__(self, model_name=None, model=None, temperature=0, streaming=True, api_key=None, base_url=None, default_headers=None, http_client=None, cache=None):
             self.model_name = model_name
             self.model = model
             self.temperature = temperature
@@ -70,6 +86,8 @@ except ImportError:
             self.api_key = api_key
             self.base_url = base_url
             self.default_headers = default_headers
+            self.http_client = http_client
+            self.cache = cache
 
 
 def choose_custom_openai_key(key_suffix=""):
@@ -97,7 +115,7 @@ def choose_custom_openai_key(key_suffix=""):
 
     model = "gpt-4o-mini"
     try:
-        client = openai.OpenAI(api_key=openai_api_key)
+        client = get_openai_client(api_key=openai_api_key)
         available_models = [
             {"id": i.id, "created": datetime.fromtimestamp(i.created)}
             for i in client.models.list()
@@ -119,13 +137,17 @@ def choose_custom_openai_key(key_suffix=""):
     return model, openai_api_key
 
 
-def configure_llm(key_suffix=""):
+def configure_llm(key_suffix="", response_cache=True, semantic_cache=False):
     """
     Configura y devuelve un modelo de lenguaje (LLM) basado en la selección del usuario.
 
     Args:
         key_suffix (str): Sufijo para añadir a las claves de los elementos para evitar duplicados
                           cuando se llama a esta función múltiples veces en la misma página.
+        response_cache (bool): Si se reutilizan respuestas ya generadas para los mismos mensajes.
+                               Las páginas con datos cambiantes deben desactivarlo.
+        semantic_cache (bool): Si además se reutilizan respuestas a preguntas semánticamente
+                               equivalentes dentro del mismo contexto de conversación.
 
     Returns:
         ChatOpenAI: Instancia configurada del modelo de lenguaje
@@ -133,6 +155,12 @@ def configure_llm(key_suffix=""):
     available_llms = ["gpt-4.1-nano", "openrouter", "usa tu clave de api de openai"]
     llm_opt = st.sidebar.radio(label="LLM", options=available_llms, key=f"SELECTED_LLM{key_suffix}")
 
+    # Parámetros comunes del modelo, incluida la caché de respuestas si está activada
+    llm_params = {"temperature": 0, "streaming": True}
+    cache = get_response_cache(semantic=semantic_cache) if response_cache else None
+    if cache is not None:
+        llm_params["cache"] = cache
+
     if llm_opt == "gpt-4.1-nano":
         # Usar el modelo predeterminado con la clave API de OpenAI de secrets.toml
         if not hasattr(st, "secrets") or "OPENAI_API_KEY" not in st.secrets:
@@ -142,33 +170,45 @@ def configure_llm(key_suffix=""):
             )
             st.stop()
 
-        llm = ChatOpenAI(
-            model_name=llm_opt,
-            temperature=0,
-            streaming=True,
+        llm = get_chat_model(
+            ChatOpenAI,
+            provider=OPENAI_PROVIDER,
+            model=llm_opt,
             api_key=st.secrets["OPENAI_API_KEY"],
+            **llm_params,
         )
     elif llm_opt == "openrouter":
         # Configurar cliente de OpenRouter
         api_key, model_id = configure_openrouter_client()
 
-        # Crear cliente de OpenAI pero con la base_url de OpenRouter
-        llm = ChatOpenAI(
-            model=model_id,
-            temperature=0,
-            streaming=True,
-            api_key=api_key,
-            base_url="https://openrouter.ai/api/v1",
-            default_headers={
-                "HTTP-Referer": "https://github.com/bladealex9848/OmniChat",
-                "X-Title": "OmniChat",
-            },
-        )
+        if model_id == AUTO_ROUTE_MODEL_ID:
+            # Enrutamiento automático: cada solicitud va al modelo sano más rápido
+            llm = build_routed_openrouter_llm(
+                ChatOpenAI,
+                api_key=api_key,
+                candidates=get_openrouter_free_models(),
+                **llm_params,
+            )
+        else:
+            # Crear (o reutilizar) el cliente de OpenAI pero con la base_url de OpenRouter
+            llm = get_chat_model(
+                ChatOpenAI,
+                provider=OPENROUTER_PROVIDER,
+                model=model_id,
+                api_key=api_key,
+                base_url=OPENROUTER_BASE_URL,
+                default_headers=OPENROUTER_HEADERS,
+                **llm_params,
+            )
     else:
         # Usar clave API personalizada de OpenAI
         model, openai_api_key = choose_custom_openai_key()
-        llm = ChatOpenAI(
-            model_name=model, temperature=0, streaming=True, api_key=openai_api_key
+        llm = get_chat_model(
+            ChatOpenAI,
+            provider=OPENAI_PROVIDER,
+            model=model,
+            api_key=openai_api_key,
+            **llm_params,
         )
     return llm
 
@@ -178,6 +218,26 @@ def get_openrouter_free_models() -> List[Dict[str, Any]]:
     Obtiene la lista de modelos multimodales GRATUITOS disponibles en OpenRouter
     o modelos que tengan "free" en su nombre o descripción.
 
+    El resultado se reutiliza durante OPENROUTER_MODELS_TTL segundos para no
+    consultar la API en cada rerun.
+
+    Returns:
+        List[Dict[str, Any]]: Lista de modelos gratuitos con sus detalles
+    """
+    now = time.monotonic()
+    if _openrouter_models_cache["models"] is not None and now < _openrouter_models_cache["expires_at"]:
+        return _openrouter_models_cache["models"]
+
+    models = _fetch_openrouter_free_models()
+    _openrouter_models_cache["models"] = models
+    _openrouter_models_cache["expires_at"] = now + OPENROUTER_MODELS_TTL
+    return models
+
+
+def _fetch_openrouter_free_models() -> List[Dict[str, Any]]:
+    """
+    Consulta la API de OpenRouter para obtener los modelos gratuitos.
+
     Returns:
         List[Dict[str, Any]]: Lista de modelos gratuitos con sus detalles
     """
@@ -389,7 +449,8 @@ def configure_openrouter_client(multimodal_only=False, key_suffix=""):
             )
 
     # Crear opciones para el selector (solo modelos gratuitos)
-    model_options = {}
+    # La primera opción enruta automáticamente al modelo más rápido disponible
+    model_options = {"🚀 Automático (modelo más rápido disponible)": AUTO_ROUTE_MODEL_ID}
     for model in available_models:
         # Añadir indicador de multimodal y gratuito al nombre para mejor claridad
         name = model["name"]
@@ -421,6 +482,22 @@ def configure_openrouter_client(multimodal_only=False, key_suffix=""):
         st.warning(f"Error al seleccionar modelo: {str(e)}. Usando modelo por defecto.")
         model_id = available_models[0]["id"]
 
+    # En modo automático, mostrar la latencia observada de cada modelo
+    if model_id == AUTO_ROUTE_MODEL_ID:
+        with st.sidebar.expander("Latencia de los modelos"):
+            stats = get_model_router().snapshot()
+            if not stats:
+                st.write("Aún no hay mediciones. Se medirán con las primeras solicitudes.")
+            for stats_model_id, model_stats in stats.items():
+                ttft = model_stats["ttft"]
+                tps = model_stats["tokens_per_second"]
+                status = "⏸️ en pausa" if model_stats["cooldown_remaining"] > 0 else "✅"
+                st.write(
+                    f"**{stats_model_id}** {status} — "
+                    f"TTFT: {f'{ttft:.2f}s' if ttft is not None else 'N/D'}, "
+                    f"tokens/s: {f'{tps:.1f}' if tps is not None else 'N/D'}"
+                )
+
     # Mostrar información sobre el modelo seleccionado
     selected_model = next((m for m in available_models if m["id"] == model_id), None)
     if selected_model:
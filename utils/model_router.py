@@ -0,0 +1,372 @@
+"""
+Enrutador de modelos gratuitos de OpenRouter según su latencia observada.
+
+Registra, para cada modelo, el tiempo hasta el primer token (TTFT), los tokens por
+segundo y los fallos recientes. En modo automático cada solicitud se envía al modelo
+sano más rápido que admite el tamaño del contexto y, si hay imágenes, entradas
+multimodales. Si el modelo elegido falla antes de emitir tokens, la solicitud pasa
+al siguiente candidato sin intervención del usuario.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from .llm_pool import OPENROUTER_BASE_URL, OPENROUTER_HEADERS, OPENROUTER_PROVIDER, get_chat_model
+
+try:
+    from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+except ImportError:
+    # Para pruebas sin LangChain
+    BaseChatModel = object
+    generate_from_stream = None
+    ChatGeneration = ChatGenerationChunk = ChatResult = None
+
+logger = logging.getLogger(__name__)
+
+# Identificador del modo automático en el selector de modelos
+AUTO_ROUTE_MODEL_ID = "omnichat/auto-router"
+
+# Peso de la observación más reciente en las medias móviles exponenciales
+EWMA_ALPHA = 0.3
+# Valores a priori para modelos sin mediciones (favorecen explorarlos una vez)
+PRIOR_TTFT_SECONDS = 1.5
+PRIOR_TOKENS_PER_SECOND = 40.0
+# Longitud de respuesta típica usada para estimar la latencia total
+EXPECTED_OUTPUT_TOKENS = 400
+# Enfriamiento tras un fallo (se duplica con fallos consecutivos)
+BASE_COOLDOWN_SECONDS = 30.0
+MAX_COOLDOWN_SECONDS = 10 * 60.0
+# Un primer token más lento que esto cuenta como fallo parcial
+SLOW_TTFT_SECONDS = 25.0
+# Máximo de modelos que se prueban en una misma solicitud
+MAX_ATTEMPTS = 3
+# Caracteres por token usados para estimar el tamaño del prompt
+CHARS_PER_TOKEN = 3.5
+
+
+class ModelLatencyStats:
+    """Estadísticas de latencia y salud de un modelo."""
+
+    def __init__(self):
+        self.ttft: Optional[float] = None
+        self.tokens_per_second: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    @staticmethod
+    def _ewma(previous: Optional[float], value: float) -> float:
+        if previous is None:
+            return value
+        return EWMA_ALPHA * value + (1 - EWMA_ALPHA) * previous
+
+    def record_success(self, ttft: float, tokens: int, duration: float):
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.ttft = self._ewma(self.ttft, ttft)
+        generation_time = duration - ttft
+        if tokens > 1 and generation_time > 0:
+            self.tokens_per_second = self._ewma(self.tokens_per_second, tokens / generation_time)
+
+    def record_failure(self, now: float):
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        cooldown = min(
+            BASE_COOLDOWN_SECONDS * (2 ** (self.consecutive_failures - 1)),
+            MAX_COOLDOWN_SECONDS,
+        )
+        self.cooldown_until = now + cooldown
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def expected_latency(self) -> float:
+        """Latencia estimada (segundos) para una respuesta de longitud típica."""
+        ttft = self.ttft if self.ttft is not None else PRIOR_TTFT_SECONDS
+        tps = self.tokens_per_second or PRIOR_TOKENS_PER_SECOND
+        return ttft + EXPECTED_OUTPUT_TOKENS / tps
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "ttft": self.ttft,
+            "tokens_per_second": self.tokens_per_second,
+            "requests": self.requests,
+            "failures": self.failures,
+            "cooldown_remaining": max(0.0, self.cooldown_until - time.monotonic()),
+        }
+
+
+class OpenRouterLatencyRouter:
+    """Registro compartido (por proceso) de la latencia de cada modelo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, ModelLatencyStats] = {}
+
+    def _get(self, model_id: str) -> ModelLatencyStats:
+        stats = self._stats.get(model_id)
+        if stats is None:
+            stats = ModelLatencyStats()
+            self._stats[model_id] = stats
+        return stats
+
+    def record_success(self, model_id: str, ttft: float, tokens: int, duration: float):
+        with self._lock:
+            stats = self._get(model_id)
+            stats.record_success(ttft, tokens, duration)
+            if ttft > SLOW_TTFT_SECONDS:
+                # Respuesta obtenida, pero el modelo está saturado: apartarlo un tiempo
+                stats.record_failure(time.monotonic())
+        logger.info(
+            f"Modelo {model_id}: TTFT {ttft:.2f}s, {tokens} tokens en {duration:.2f}s"
+        )
+
+    def record_failure(self, model_id: str, error: Optional[BaseException] = None):
+        with self._lock:
+            self._get(model_id).record_failure(time.monotonic())
+        logger.warning(f"Modelo {model_id} marcado como no disponible temporalmente: {error}")
+
+    def rank(
+        self,
+        models: List[Dict[str, Any]],
+        min_context: int = 0,
+        multimodal: bool = False,
+    ) -> List[str]:
+        """
+        Ordena los modelos candidatos del más rápido al más lento.
+
+        Args:
+            models (list): Modelos de `get_openrouter_free_models`
+            min_context (int): Tokens de contexto necesarios
+            multimodal (bool): Si la solicitud incluye imágenes
+
+        Returns:
+            list: IDs de los modelos aptos; los que están en enfriamiento van al final
+        """
+        now = time.monotonic()
+        eligible = [
+            model
+            for model in models
+            if (not multimodal or model.get("multimodal", False))
+            and (model.get("context_length") or 0) >= min_context
+        ]
+        if not eligible:
+            # Mejor intentar con algún modelo que fallar sin intentarlo
+            eligible = [m for m in models if not multimodal or m.get("multimodal", False)] or list(models)
+
+        with self._lock:
+            scored = []
+            for model in eligible:
+                stats = self._get(model["id"])
+                scored.append(
+                    (not stats.is_healthy(now), stats.expected_latency(), model["id"])
+                )
+        scored.sort()
+        return [model_id for _, _, model_id in scored]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Devuelve una copia de las estadísticas para mostrarlas en la interfaz."""
+        with self._lock:
+            return {model_id: stats.as_dict() for model_id, stats in self._stats.items()}
+
+    def track_openai_stream(self, model_id: str, stream: Iterator[Any], started_at: float) -> Iterator[Any]:
+        """
+        Envuelve un stream de `openai.OpenAI().chat.completions.create(stream=True)`
+        para registrar su TTFT y su velocidad.
+
+        Los errores durante la iteración (conexión cortada o chunk de error del
+        proveedor) se registran como fallo del modelo y se propagan al llamador.
+        """
+        first_token_at = None
+        tokens = 0
+        try:
+            for chunk in stream:
+                # OpenRouter informa de los errores del proveedor en un chunk con "error"
+                error = getattr(chunk, "error", None)
+                if error:
+                    message = error.get("message", error) if isinstance(error, dict) else error
+                    raise RuntimeError(f"Error del proveedor: {message}")
+                if getattr(chunk, "choices", None) and chunk.choices[0].delta.content:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    tokens += 1
+                yield chunk
+        except Exception as e:
+            self.record_failure(model_id, e)
+            raise
+        finished_at = time.monotonic()
+        if first_token_at is None:
+            self.record_failure(model_id, "respuesta vacía")
+        else:
+            self.record_success(
+                model_id, first_token_at - started_at, tokens, finished_at - started_at
+            )
+
+
+_router: Optional[OpenRouterLatencyRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> OpenRouterLatencyRouter:
+    """Devuelve el enrutador del proceso (las mediciones se comparten entre sesiones)."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = OpenRouterLatencyRouter()
+    return _router
+
+
+def _message_is_multimodal(message) -> bool:
+    content = getattr(message, "content", "")
+    if isinstance(content, list):
+        return any(
+            isinstance(part, dict) and part.get("type") in ("image_url", "image")
+            for part in content
+        )
+    return False
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """Estimación rápida del tamaño del prompt en tokens."""
+    total_chars = 0
+    for message in messages:
+        content = getattr(message, "content", "")
+        if isinstance(content, list):
+            total_chars += sum(len(str(part.get("text", ""))) for part in content if isinstance(part, dict))
+        else:
+            total_chars += len(str(content))
+    return int(total_chars / CHARS_PER_TOKEN)
+
+
+class RoutedOpenRouterChat(BaseChatModel):
+    """
+    Modelo de chat que elige en cada solicitud el modelo gratuito de OpenRouter más
+    rápido y sano, y cambia al siguiente si falla antes de emitir tokens.
+
+    Los clientes subyacentes se obtienen del pool de `llm_pool`, por lo que los
+    transportes HTTP se comparten con el resto de la aplicación.
+    """
+
+    chat_model_cls: Any
+    api_key: str
+    candidates: List[Dict[str, Any]]
+    temperature: float = 0
+    streaming: bool = True
+    max_output_tokens: int = 1024
+
+    @property
+    def _llm_type(self) -> str:
+        return "openrouter-auto-router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "router": AUTO_ROUTE_MODEL_ID,
+            "candidates": sorted(model["id"] for model in self.candidates),
+            "temperature": self.temperature,
+        }
+
+    def _delegate(self, model_id: str):
+        return get_chat_model(
+            self.chat_model_cls,
+            provider=OPENROUTER_PROVIDER,
+            model=model_id,
+            api_key=self.api_key,
+            base_url=OPENROUTER_BASE_URL,
+            default_headers=OPENROUTER_HEADERS,
+            temperature=self.temperature,
+            streaming=self.streaming,
+        )
+
+    def _ranked_models(self, messages) -> List[str]:
+        min_context = estimate_prompt_tokens(messages) + self.max_output_tokens
+        multimodal = any(_message_is_multimodal(message) for message in messages)
+        return get_model_router().rank(self.candidates, min_context, multimodal)[:MAX_ATTEMPTS]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[Any]:
+        router = get_model_router()
+        last_error: Optional[BaseException] = None
+
+        for model_id in self._ranked_models(messages):
+            started_at = time.monotonic()
+            first_token_at = None
+            tokens = 0
+            try:
+                for chunk in self._delegate(model_id)._stream(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                ):
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    tokens += 1
+                    yield chunk
+            except Exception as e:
+                router.record_failure(model_id, e)
+                if first_token_at is not None:
+                    # Ya se mostraron tokens al usuario: no se puede reintentar en silencio
+                    raise
+                last_error = e
+                continue
+
+            if first_token_at is None:
+                router.record_failure(model_id, "respuesta vacía")
+                last_error = RuntimeError(f"El modelo {model_id} devolvió una respuesta vacía")
+                continue
+
+            router.record_success(
+                model_id, first_token_at - started_at, tokens, time.monotonic() - started_at
+            )
+            return
+
+        raise last_error or RuntimeError("No hay modelos de OpenRouter disponibles")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            return generate_from_stream(
+                self._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            )
+
+        router = get_model_router()
+        last_error: Optional[BaseException] = None
+        for model_id in self._ranked_models(messages):
+            started_at = time.monotonic()
+            try:
+                result = self._delegate(model_id)._generate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+            except Exception as e:
+                router.record_failure(model_id, e)
+                last_error = e
+                continue
+            duration = time.monotonic() - started_at
+            text = result.generations[0].text if result.generations else ""
+            router.record_success(model_id, duration, int(len(text) / CHARS_PER_TOKEN), duration)
+            return result
+
+        raise last_error or RuntimeError("No hay modelos de OpenRouter disponibles")
+
+
+def build_routed_openrouter_llm(chat_model_cls, api_key: str, candidates: List[Dict[str, Any]], **params):
+    """
+    Crea el modelo de chat en modo de enrutamiento automático.
+
+    Args:
+        chat_model_cls: Clase del modelo de chat subyacente (ChatOpenAI)
+        api_key (str): Clave API de OpenRouter
+        candidates (list): Modelos gratuitos candidatos
+        **params: Parámetros comunes (temperature, streaming, cache)
+
+    Returns:
+        RoutedOpenRouterChat: Modelo de chat con enrutamiento por latencia
+    """
+    return RoutedOpenRouterChat(
+        chat_model_cls=chat_model_cls,
+        api_key=api_key,
+        candidates=candidates,
+        **params,
+    )
@@ -0,0 +1,202 @@
+"""
+Caché en disco de resultados OCR compartida por todas las páginas que hacen OCR.
+
+Un mismo archivo puede procesarse desde `mistral_ocr_app.py`, desde la página
+de OCR con Mistral AI o desde el respaldo OCR del chat con documentos. Los
+resultados se guardan en SQLite con la clave (SHA-256 del archivo, rango de
+páginas, modelo, opciones de preprocesamiento) y el markdown de cada página,
+de modo que volver a subir un documento no repite la llamada a la API.
+El tamaño total está limitado y se desalojan las entradas menos usadas.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .storage_utils import connect_sqlite, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+
+PageRange = Optional[Tuple[int, int]]
+
+
+def file_digest(data: bytes) -> str:
+    """Devuelve el SHA-256 hexadecimal del contenido de un archivo."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class OCRResultCache:
+    """
+    Caché de resultados OCR (markdown por página) con TTL y desalojo LRU sobre SQLite.
+
+    Args:
+        db_path (str, optional): Ruta del archivo SQLite
+        max_bytes (int): Tamaño máximo del markdown almacenado
+        max_entries (int): Número máximo de documentos o rangos almacenados
+        ttl_seconds (float): Vida máxima de una entrada
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.db_path = db_path or os.path.join(get_cache_dir(), "ocr_results.sqlite")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(self.db_path)
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS ocr_entries (
+                    key TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    page_range TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    page_count INTEGER NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS ocr_pages (
+                    key TEXT NOT NULL REFERENCES ocr_entries(key) ON DELETE CASCADE,
+                    page_index INTEGER NOT NULL,
+                    markdown TEXT NOT NULL,
+                    PRIMARY KEY (key, page_index)
+                );
+                CREATE INDEX IF NOT EXISTS idx_ocr_entries_digest ON ocr_entries (digest);
+                CREATE INDEX IF NOT EXISTS idx_ocr_entries_access ON ocr_entries (last_access);
+                """
+            )
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(digest: str, model: str, page_range: PageRange = None,
+                 options: Optional[Dict[str, Any]] = None) -> str:
+        """Clave de una entrada: documento, rango de páginas, modelo y opciones."""
+        parts = [digest, _range_label(page_range), model, _options_label(options)]
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, digest: str, model: str, page_range: PageRange = None,
+            options: Optional[Dict[str, Any]] = None) -> Optional[List[str]]:
+        """
+        Devuelve el markdown de cada página o None si no está en caché.
+
+        Args:
+            digest (str): SHA-256 del archivo completo (`file_digest`)
+            model (str): Modelo OCR
+            page_range (tuple, optional): Páginas [inicio, fin) en base 0; None para el documento completo
+            options (dict, optional): Opciones de preprocesamiento que afectan al resultado
+        """
+        key = self.make_key(digest, model, page_range, options)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at FROM ocr_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds and now - row["created_at"] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM ocr_entries WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            pages = self._conn.execute(
+                "SELECT markdown FROM ocr_pages WHERE key = ? ORDER BY page_index", (key,)
+            ).fetchall()
+            self._conn.execute("UPDATE ocr_entries SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        logger.info(f"Acierto en la caché OCR ({digest[:12]}, páginas {_range_label(page_range)})")
+        return [page["markdown"] for page in pages]
+
+    def set(self, digest: str, model: str, pages: List[str], page_range: PageRange = None,
+            options: Optional[Dict[str, Any]] = None) -> None:
+        """Guarda el markdown de cada página y aplica los límites de tamaño."""
+        key = self.make_key(digest, model, page_range, options)
+        size_bytes = sum(len(page.encode("utf-8")) for page in pages)
+        if size_bytes > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM ocr_entries WHERE key = ?", (key,))
+            self._conn.execute(
+                """
+                INSERT INTO ocr_entries
+                    (key, digest, page_range, model, options, page_count, size_bytes, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, digest, _range_label(page_range), model, _options_label(options),
+                 len(pages), size_bytes, now, now),
+            )
+            self._conn.executemany(
+                "INSERT INTO ocr_pages (key, page_index, markdown) VALUES (?, ?, ?)",
+                [(key, index, page) for index, page in enumerate(pages)],
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Elimina entradas caducadas y, si se superan los límites, las menos usadas."""
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM ocr_entries WHERE created_at < ?", (now - self.ttl_seconds,))
+        count, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM ocr_entries"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size_bytes FROM ocr_entries ORDER BY last_access ASC").fetchall()
+        expired = []
+        for row in rows:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            expired.append((row["key"],))
+            count -= 1
+            total_bytes -= row["size_bytes"]
+        self._conn.executemany("DELETE FROM ocr_entries WHERE key = ?", expired)
+
+    def clear(self) -> None:
+        """Vacía la caché."""
+        with self._lock:
+            self._conn.execute("DELETE FROM ocr_entries")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve el número de entradas, páginas y bytes almacenados."""
+        with self._lock:
+            count, pages, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(page_count), 0), COALESCE(SUM(size_bytes), 0) FROM ocr_entries"
+            ).fetchone()
+        return {"entries": count, "pages": pages, "bytes": total_bytes}
+
+
+def _range_label(page_range: PageRange) -> str:
+    return "all" if page_range is None else f"{page_range[0]}-{page_range[1]}"
+
+
+def _options_label(options: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(options or {}, sort_keys=True, ensure_ascii=False)
+
+
+_ocr_cache: Optional[OCRResultCache] = None
+_ocr_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OCRResultCache:
+    """Devuelve la caché de resultados OCR compartida por el proceso."""
+    global _ocr_cache
+    if _ocr_cache is None:
+        with _ocr_cache_lock:
+            if _ocr_cache is None:
+                _ocr_cache = OCRResultCache()
+    return _ocr_cache
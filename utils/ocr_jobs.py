@@ -0,0 +1,357 @@
+"""
+Cola persistente de trabajos OCR por lotes con puntos de control en SQLite.
+
+Un lote de `mistral_ocr_app.py` ya no vive en el hilo del script de Streamlit:
+los archivos se guardan en el almacén de vistas previas, el trabajo se
+registra en SQLite y un hilo en segundo plano lo procesa. Cada archivo
+terminado y cada rango de páginas de un PDF quedan guardados como punto de
+control, así que si la sesión se reinicia, el navegador se desconecta o el
+servidor se detiene, el lote se reanuda exactamente donde se quedó. La
+interfaz solo consulta periódicamente el estado del trabajo.
+
+La API key nunca se escribe en disco: tras reiniciar el servidor, el trabajo
+queda interrumpido hasta que se reanuda con la clave de la sesión.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from .ocr_cache import OCRResultCache, PageRange, _range_label, get_ocr_cache
+from .ocr_utils import DEFAULT_CONCURRENCY, DONE, FAILED, PENDING, RUNNING, OCRBatchExecutor
+from .preview_store import PreviewHandle, get_preview_store
+from .storage_utils import connect_sqlite, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Estados de un trabajo
+JOB_QUEUED = "pendiente"
+JOB_RUNNING = "procesando"
+JOB_DONE = "completado"
+JOB_CANCELLED = "cancelado"
+# Estado derivado: figura en curso en SQLite pero ningún hilo de este proceso lo ejecuta
+JOB_INTERRUPTED = "interrumpido"
+
+# Días que se conservan los trabajos terminados
+JOB_RETENTION_DAYS = 7
+
+
+class OCRJobStore:
+    """
+    Persistencia de trabajos OCR, sus archivos y sus puntos de control en SQLite.
+
+    Args:
+        db_path (str, optional): Ruta del archivo SQLite
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.path.join(get_cache_dir(), "ocr_jobs.sqlite")
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(self.db_path)
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS ocr_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS ocr_job_files (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    file_id TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    mime_type TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    success INTEGER NOT NULL DEFAULT 0,
+                    result_text TEXT,
+                    ranges TEXT,
+                    elapsed REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (job_id, position)
+                );
+                CREATE TABLE IF NOT EXISTS ocr_job_checkpoints (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    page_range TEXT NOT NULL,
+                    pages TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, position, page_range)
+                );
+                """
+            )
+            self._conn.commit()
+
+    def create_job(self, files: List[PreviewHandle], options: Optional[Dict[str, Any]] = None) -> str:
+        """Registra un trabajo con sus archivos (ya guardados en el almacén de vistas previas)."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            self._conn.execute(
+                "INSERT INTO ocr_jobs (id, status, options, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, json.dumps(options or {}), now, now),
+            )
+            self._conn.executemany(
+                """
+                INSERT INTO ocr_job_files (job_id, position, file_id, file_name, mime_type, size, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (job_id, position, handle.id, handle.file_name, handle.mime_type, handle.size, PENDING)
+                    for position, handle in enumerate(files)
+                ],
+            )
+            self._conn.commit()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Devuelve el trabajo con sus archivos en orden, o None si no existe."""
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM ocr_jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            files = self._conn.execute(
+                "SELECT * FROM ocr_job_files WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+        result = dict(job)
+        result["options"] = json.loads(job["options"])
+        result["files"] = []
+        for row in files:
+            item = dict(row)
+            item["success"] = bool(row["success"])
+            item["ranges"] = json.loads(row["ranges"]) if row["ranges"] else []
+            item["handle"] = PreviewHandle(row["file_id"], row["file_name"], row["mime_type"], row["size"])
+            result["files"].append(item)
+        return result
+
+    def set_job_status(self, job_id: str, status: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ocr_jobs SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def update_file(self, job_id: str, position: int, status: str, success: bool = False,
+                    result_text: Optional[str] = None, ranges: Optional[List[Dict[str, Any]]] = None,
+                    elapsed: float = 0.0) -> None:
+        """Guarda el estado de un archivo (punto de control cuando termina)."""
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE ocr_job_files SET status = ?, success = ?, result_text = ?, ranges = ?, elapsed = ?
+                WHERE job_id = ? AND position = ?
+                """,
+                (status, int(success), result_text, json.dumps(ranges or []), elapsed, job_id, position),
+            )
+            self._conn.execute("UPDATE ocr_jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+            self._conn.commit()
+
+    def get_checkpoint(self, job_id: str, position: int, page_range: str) -> Optional[List[str]]:
+        """Markdown de las páginas de un rango ya procesado, o None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pages FROM ocr_job_checkpoints WHERE job_id = ? AND position = ? AND page_range = ?",
+                (job_id, position, page_range),
+            ).fetchone()
+        return json.loads(row["pages"]) if row else None
+
+    def save_checkpoint(self, job_id: str, position: int, page_range: str, pages: List[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO ocr_job_checkpoints (job_id, position, page_range, pages, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (job_id, position, page_range, json.dumps(pages, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+    def pending_file_ids(self) -> List[str]:
+        """Archivos que algún trabajo aún debe leer (pendientes, en curso o con error reintentable)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT file_id FROM ocr_job_files WHERE status != ?", (DONE,)
+            ).fetchall()
+        return [row["file_id"] for row in rows]
+
+    def _prune(self, now: float) -> None:
+        """Elimina los trabajos (y sus datos) sin actividad durante `JOB_RETENTION_DAYS`."""
+        limit = now - JOB_RETENTION_DAYS * 24 * 60 * 60
+        expired = [row["id"] for row in self._conn.execute("SELECT id FROM ocr_jobs WHERE updated_at < ?", (limit,))]
+        for job_id in expired:
+            for table in ("ocr_job_checkpoints", "ocr_job_files"):
+                self._conn.execute(f"DELETE FROM {table} WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM ocr_jobs WHERE id = ?", (job_id,))
+
+
+class JobCheckpointCache:
+    """
+    Caché OCR de un archivo de un trabajo: puntos de control del trabajo + caché compartida.
+
+    Tiene la interfaz de `OCRResultCache` (`get`/`set`) para pasarse a
+    `ocr_pdf_by_ranges`; cada rango terminado se guarda como punto de control
+    y, al reanudar, se recupera aunque la caché compartida lo haya desalojado.
+    """
+
+    def __init__(self, store: OCRJobStore, job_id: str, position: int,
+                 shared_cache: Optional[OCRResultCache] = None):
+        self.store = store
+        self.job_id = job_id
+        self.position = position
+        self.shared_cache = shared_cache
+
+    def get(self, digest: str, model: str, page_range: PageRange = None,
+            options: Optional[Dict[str, Any]] = None) -> Optional[List[str]]:
+        pages = self.store.get_checkpoint(self.job_id, self.position, _range_label(page_range))
+        if pages is None and self.shared_cache is not None:
+            pages = self.shared_cache.get(digest, model, page_range, options)
+        return pages
+
+    def set(self, digest: str, model: str, pages: List[str], page_range: PageRange = None,
+            options: Optional[Dict[str, Any]] = None) -> None:
+        self.store.save_checkpoint(self.job_id, self.position, _range_label(page_range), pages)
+        if self.shared_cache is not None:
+            self.shared_cache.set(digest, model, pages, page_range, options)
+
+
+# Procesa un archivo de un trabajo: recibe su referencia y la caché con puntos de control
+# y devuelve un dict con "success", "result_text" y opcionalmente "ocr_ranges"
+FileProcessor = Callable[[PreviewHandle, JobCheckpointCache], Dict[str, Any]]
+
+
+class OCRJobQueue:
+    """
+    Ejecuta en segundo plano los trabajos de un `OCRJobStore`.
+
+    Cada trabajo activo tiene un hilo propio que procesa sus archivos pendientes
+    con `OCRBatchExecutor`; los archivos terminados no se vuelven a procesar.
+
+    Args:
+        store (OCRJobStore): Persistencia de los trabajos
+    """
+
+    def __init__(self, store: OCRJobStore):
+        self.store = store
+        self._threads: Dict[str, threading.Thread] = {}
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def create_job(self, files: List[PreviewHandle], options: Optional[Dict[str, Any]] = None) -> str:
+        return self.store.create_job(files, options)
+
+    def is_active(self, job_id: str) -> bool:
+        with self._lock:
+            thread = self._threads.get(job_id)
+            return thread is not None and thread.is_alive()
+
+    def start(self, job_id: str, process_file: FileProcessor, max_workers: int = DEFAULT_CONCURRENCY) -> bool:
+        """
+        Inicia (o reanuda) un trabajo en un hilo en segundo plano.
+
+        Returns:
+            bool: False si el trabajo no existe o ya está en curso
+        """
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return False
+            if self.store.get_job(job_id) is None:
+                return False
+            cancel_event = threading.Event()
+            thread = threading.Thread(
+                target=self._run, args=(job_id, process_file, max_workers, cancel_event),
+                name=f"ocr-job-{job_id[:8]}", daemon=True,
+            )
+            self._threads[job_id] = thread
+            self._cancel_events[job_id] = cancel_event
+        self.store.set_job_status(job_id, JOB_RUNNING)
+        thread.start()
+        return True
+
+    def cancel(self, job_id: str) -> None:
+        """Detiene el trabajo tras los archivos en curso; los terminados se conservan."""
+        with self._lock:
+            cancel_event = self._cancel_events.get(job_id)
+        if cancel_event is not None:
+            cancel_event.set()
+        if not self.is_active(job_id):
+            self.store.set_job_status(job_id, JOB_CANCELLED)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Devuelve el trabajo con su estado efectivo (incluido `JOB_INTERRUPTED`)."""
+        job = self.store.get_job(job_id)
+        if job is None:
+            return None
+        if job["status"] in (JOB_QUEUED, JOB_RUNNING) and not self.is_active(job_id):
+            job["status"] = JOB_INTERRUPTED
+        job["completed"] = sum(1 for item in job["files"] if item["status"] in (DONE, FAILED))
+        return job
+
+    def _run(self, job_id: str, process_file: FileProcessor, max_workers: int,
+             cancel_event: threading.Event) -> None:
+        job = self.store.get_job(job_id)
+        # Al reanudar se vuelven a intentar los archivos fallidos; los completados se conservan
+        pending = [item for item in job["files"] if item["status"] != DONE]
+        shared_cache = get_ocr_cache()
+
+        def process(item: Dict[str, Any]) -> bool:
+            if cancel_event.is_set():
+                return False
+            position = item["position"]
+            self.store.update_file(job_id, position, RUNNING)
+            checkpoint = JobCheckpointCache(self.store, job_id, position, shared_cache)
+            started = time.monotonic()
+            try:
+                result = process_file(item["handle"], checkpoint)
+            except Exception as e:
+                logger.error(f"Error en el archivo {item['file_name']} del trabajo OCR {job_id}: {str(e)}")
+                result = {"success": False, "result_text": f"Error inesperado: {str(e)}"}
+            self.store.update_file(
+                job_id, position, DONE if result.get("success") else FAILED,
+                success=bool(result.get("success")), result_text=result.get("result_text"),
+                ranges=result.get("ocr_ranges"), elapsed=time.monotonic() - started,
+            )
+            return True
+
+        try:
+            OCRBatchExecutor(max_workers=max_workers).run(pending, process)
+        except Exception as e:
+            logger.error(f"Error en el trabajo OCR {job_id}: {str(e)}")
+        finally:
+            if cancel_event.is_set():
+                # Los archivos que no llegaron a empezar vuelven a quedar pendientes
+                for item in self.store.get_job(job_id)["files"]:
+                    if item["status"] == RUNNING:
+                        self.store.update_file(job_id, item["position"], PENDING)
+                self.store.set_job_status(job_id, JOB_CANCELLED)
+            else:
+                self.store.set_job_status(job_id, JOB_DONE)
+            with self._lock:
+                self._threads.pop(job_id, None)
+                self._cancel_events.pop(job_id, None)
+
+
+_job_queue: Optional[OCRJobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_ocr_job_queue() -> OCRJobQueue:
+    """Devuelve la cola de trabajos OCR compartida por el proceso."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = OCRJobQueue(OCRJobStore())
+                # Las entradas de los trabajos no terminados no se eliminan del almacén
+                get_preview_store().add_pin_provider(_job_queue.store.pending_file_ids)
+    return _job_queue
@@ -0,0 +1,669 @@
+"""
+Cliente de la API OCR de Mistral para procesar lotes de documentos.
+
+Las llamadas a `https://api.mistral.ai/v1/ocr` pasan casi todo el tiempo
+esperando al servidor, así que un lote se procesa con varias solicitudes
+simultáneas. Este módulo ofrece:
+
+- `post_ocr`: solicitud con sesión HTTP compartida (keep-alive), limitación de
+  solicitudes por API key y reintentos con espera exponencial y jitter ante
+  429, 5xx, timeouts y errores de conexión.
+- `ocr_document`: envía los archivos grandes a la API de archivos con una subida
+  multipart en streaming y los referencia por URL firmada; los pequeños van
+  como data URI en un cuerpo JSON construido sin copias intermedias.
+- `OCRBatchExecutor`: ejecuta las tareas de un lote con un número acotado de
+  hilos, devuelve los resultados en el orden de entrada e informa del estado de
+  cada archivo al hilo que lo llama (el script de Streamlit).
+- `ocr_pdf_by_ranges`: divide los PDF grandes en rangos de páginas con PyMuPDF,
+  los procesa en paralelo, reintenta solo los rangos fallidos y une las páginas
+  en orden. Los rangos ya procesados se leen de la caché OCR (`ocr_cache.py`).
+"""
+
+import binascii
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, BinaryIO, ByteString, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+from .ocr_cache import OCRResultCache, file_digest
+
+logger = logging.getLogger(__name__)
+
+MISTRAL_OCR_URL = "https://api.mistral.ai/v1/ocr"
+MISTRAL_FILES_URL = "https://api.mistral.ai/v1/files"
+DEFAULT_OCR_MODEL = "mistral-ocr-latest"
+
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 8
+# Solicitudes por segundo permitidas por API key (ráfaga de hasta RATE_LIMIT_BURST)
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+RATE_LIMIT_BURST = 4
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# A partir de este tamaño los documentos se suben a la API de archivos en lugar de ir en base64
+UPLOAD_MIN_BYTES = 8 * 1024 * 1024
+# Bloques (múltiplos de 3 bytes) para codificar en base64 y bloques de lectura de las subidas
+_BASE64_CHUNK_SIZE = 3 * 1024 * 1024
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Páginas por subdocumento al dividir un PDF; los PDF con menos páginas se envían enteros
+DEFAULT_PAGES_PER_RANGE = 16
+# Rondas de reintento de los rangos fallidos (además de los reintentos de cada solicitud)
+MAX_RANGE_ROUNDS = 2
+
+# Estados de cada elemento de un lote
+PENDING = "pendiente"
+RUNNING = "procesando"
+DONE = "completado"
+FAILED = "error"
+CACHED = "caché"
+
+
+class OCRRequestError(Exception):
+    """Error de la API OCR tras agotar los reintentos (o no reintentable)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 ranges: Optional[List[Dict[str, Any]]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        # Duración y estado de cada rango de páginas (solo en `ocr_pdf_by_ranges`)
+        self.ranges = ranges or []
+
+
+class RateLimiter:
+    """
+    Limitador de solicitudes por clave (token bucket), compartido entre hilos.
+
+    Args:
+        rate (float): Solicitudes por segundo por clave
+        burst (int): Solicitudes que pueden hacerse seguidas
+    """
+
+    def __init__(self, rate: float = DEFAULT_REQUESTS_PER_SECOND, burst: int = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        # clave -> (tokens disponibles, último instante de recarga)
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> None:
+        """Bloquea hasta que la clave tiene una solicitud disponible."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, updated_at = self._buckets.get(key, (float(self.burst), now))
+                tokens = min(float(self.burst), tokens + (now - updated_at) * self.rate)
+                if tokens >= 1:
+                    self._buckets[key] = [tokens - 1, now]
+                    return
+                self._buckets[key] = [tokens, now]
+                wait_time = (1 - tokens) / self.rate
+            time.sleep(wait_time)
+
+
+_rate_limiter = RateLimiter()
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Devuelve el limitador de solicitudes OCR compartido por el proceso."""
+    return _rate_limiter
+
+
+def get_http_session() -> requests.Session:
+    """Devuelve una sesión HTTP compartida con conexiones keep-alive para la API OCR."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENCY * 2)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _key_id(api_key: str) -> str:
+    # El limitador no guarda la API key en claro
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    Espera antes del reintento `attempt` (0, 1, ...): exponencial con jitter completo.
+
+    Si el servidor indica `Retry-After`, se respeta como mínimo.
+    """
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), RETRY_MAX_DELAY))
+        except ValueError:
+            pass
+    return delay
+
+
+def _request_with_retries(api_key: str, method: str, url: str, make_kwargs: Callable[[], Dict[str, Any]],
+                          timeout: float, max_retries: int = MAX_RETRIES,
+                          rate_limiter: Optional[RateLimiter] = None) -> requests.Response:
+    """
+    Solicitud a la API de Mistral con limitación por API key y reintentos.
+
+    `make_kwargs` se llama en cada intento para que los cuerpos en streaming
+    se vuelvan a leer desde el principio.
+    """
+    limiter = rate_limiter or get_rate_limiter()
+    last_error = ""
+    status_code = None
+    for attempt in range(max_retries + 1):
+        limiter.acquire(_key_id(api_key))
+        retry_after = None
+        kwargs = make_kwargs()
+        headers = {"Authorization": f"Bearer {api_key}"}
+        headers.update(kwargs.pop("headers", {}))
+        try:
+            response = get_http_session().request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except requests.exceptions.Timeout:
+            last_error = "Timeout al procesar el documento. La operación tomó demasiado tiempo."
+            status_code = None
+        except requests.exceptions.ConnectionError:
+            last_error = "Error de conexión con la API OCR. Comprueba tu conexión a internet."
+            status_code = None
+        else:
+            if response.status_code == 200:
+                return response
+            status_code = response.status_code
+            last_error = f"Error en API OCR (código {status_code}): {response.text}"
+            if status_code not in RETRYABLE_STATUS_CODES:
+                raise OCRRequestError(last_error, status_code)
+            retry_after = response.headers.get("Retry-After")
+
+        if attempt < max_retries:
+            delay = retry_delay(attempt, retry_after)
+            logger.warning(f"{last_error[:200]} - reintento {attempt + 1}/{max_retries} en {delay:.1f} s")
+            time.sleep(delay)
+
+    raise OCRRequestError(last_error, status_code)
+
+
+def post_ocr(api_key: str, document: Optional[Dict[str, Any]] = None, model: str = DEFAULT_OCR_MODEL,
+             timeout: float = 120, max_retries: int = MAX_RETRIES,
+             rate_limiter: Optional[RateLimiter] = None, body: Optional[ByteString] = None) -> Dict[str, Any]:
+    """
+    Envía un documento a la API OCR de Mistral con limitación y reintentos.
+
+    Args:
+        api_key (str): API key de Mistral
+        document (dict, optional): Documento en el formato de la API ({"type": "document_url", ...})
+        model (str): Modelo OCR
+        timeout (float): Segundos máximos por solicitud
+        max_retries (int): Reintentos ante 429, 5xx, timeouts o errores de conexión
+        rate_limiter (RateLimiter, optional): Limitador; por defecto, el compartido
+        body (bytes-like, optional): Cuerpo JSON ya construido (`build_ocr_body`), en lugar de `document`
+
+    Returns:
+        dict: Respuesta JSON de la API
+
+    Raises:
+        OCRRequestError: Si la API devuelve un error no reintentable o se agotan los reintentos
+    """
+    if body is None:
+        body = json.dumps({"model": model, "document": document}).encode("utf-8")
+    # Se envía la vista de memoria: requests no copia el cuerpo
+    payload = memoryview(body)
+
+    response = _request_with_retries(
+        api_key, "POST", MISTRAL_OCR_URL,
+        lambda: {"data": payload, "headers": {"Content-Type": "application/json"}},
+        timeout, max_retries, rate_limiter,
+    )
+    return response.json()
+
+
+def build_ocr_body(data: ByteString, mime_type: str, model: str = DEFAULT_OCR_MODEL) -> bytearray:
+    """
+    Construye el cuerpo JSON de una solicitud OCR con el documento como data URI.
+
+    El base64 se escribe por bloques en un único `bytearray` reservado de
+    antemano, sin las copias intermedias de `b64encode` + `decode` + f-string
+    + `json.dumps` + `encode` (cada una del tamaño del archivo más un 33 %).
+
+    Args:
+        data (bytes-like): Contenido del archivo
+        mime_type (str): Tipo MIME ("application/pdf" o "image/...")
+        model (str): Modelo OCR
+
+    Returns:
+        bytearray: Cuerpo listo para `post_ocr(body=...)`
+    """
+    document_type = "image_url" if mime_type.startswith("image/") else "document_url"
+    prefix = (f'{{"model": {json.dumps(model)}, "document": {{"type": "{document_type}", '
+              f'"{document_type}": "data:{mime_type};base64,').encode("utf-8")
+    suffix = b'"}}'
+    view = memoryview(data)
+    encoded_size = 4 * ((len(view) + 2) // 3)
+
+    body = bytearray(len(prefix) + encoded_size + len(suffix))
+    body[:len(prefix)] = prefix
+    position = len(prefix)
+    for start in range(0, len(view), _BASE64_CHUNK_SIZE):
+        encoded = binascii.b2a_base64(view[start:start + _BASE64_CHUNK_SIZE], newline=False)
+        body[position:position + len(encoded)] = encoded
+        position += len(encoded)
+    body[position:] = suffix
+    return body
+
+
+class MultipartFileStream:
+    """
+    Cuerpo multipart/form-data que se lee por bloques desde el archivo de origen.
+
+    requests lo envía en streaming con `Content-Length` conocido, sin cargar en
+    memoria el cuerpo completo (a diferencia de `files=`).
+
+    Args:
+        source (bytes-like or file): Contenido o archivo abierto en modo binario
+        file_name (str): Nombre del archivo
+        fields (dict): Campos de texto del formulario
+        mime_type (str): Tipo MIME del archivo
+    """
+
+    def __init__(self, source: Union[ByteString, BinaryIO], file_name: str, fields: Dict[str, str],
+                 mime_type: str = "application/octet-stream"):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        head = "".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; '
+                 f'filename="{file_name}"\r\nContent-Type: {mime_type}\r\n\r\n')
+        self._head = head.encode("utf-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+
+        if hasattr(source, "read"):
+            self._file = source
+            start = source.tell()
+            source.seek(0, os.SEEK_END)
+            self._file_size = source.tell() - start
+            source.seek(start)
+            self._file_start = start
+        else:
+            self._file = None
+            self._view = memoryview(source)
+            self._file_size = len(self._view)
+        self.rewind()
+
+    def rewind(self) -> "MultipartFileStream":
+        """Vuelve al principio del cuerpo (para reintentar la subida)."""
+        self._part = 0
+        self._offset = 0
+        if self._file is not None:
+            self._file.seek(self._file_start)
+        return self
+
+    def __len__(self) -> int:
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(_UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self)
+        chunks = []
+        while size > 0 and self._part < 3:
+            if self._part == 1:
+                if self._file is not None:
+                    chunk = self._file.read(min(size, self._file_size - self._offset))
+                else:
+                    chunk = self._view[self._offset:self._offset + size].tobytes()
+            else:
+                part = self._head if self._part == 0 else self._tail
+                chunk = part[self._offset:self._offset + size]
+            if not chunk:
+                self._part += 1
+                self._offset = 0
+                continue
+            chunks.append(chunk)
+            self._offset += len(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+
+def upload_file(api_key: str, source: Union[ByteString, BinaryIO], file_name: str,
+                mime_type: str = "application/pdf", purpose: str = "ocr", timeout: float = 300) -> str:
+    """
+    Sube un archivo a la API de archivos de Mistral en streaming y devuelve su id.
+
+    Raises:
+        OCRRequestError: Si la subida falla tras los reintentos
+    """
+    stream = MultipartFileStream(source, file_name, {"purpose": purpose}, mime_type)
+    response = _request_with_retries(
+        api_key, "POST", MISTRAL_FILES_URL,
+        lambda: {"data": stream.rewind(), "headers": {"Content-Type": stream.content_type}},
+        timeout,
+    )
+    return response.json()["id"]
+
+
+def get_signed_url(api_key: str, file_id: str, expiry_hours: int = 1) -> str:
+    """Devuelve una URL firmada y temporal para que la API OCR lea un archivo subido."""
+    response = _request_with_retries(
+        api_key, "GET", f"{MISTRAL_FILES_URL}/{file_id}/url",
+        lambda: {"params": {"expiry": expiry_hours}}, timeout=30,
+    )
+    return response.json()["url"]
+
+
+def delete_file(api_key: str, file_id: str) -> None:
+    """Elimina un archivo subido (los errores solo se registran)."""
+    try:
+        _request_with_retries(api_key, "DELETE", f"{MISTRAL_FILES_URL}/{file_id}", dict, timeout=30, max_retries=1)
+    except OCRRequestError as e:
+        logger.warning(f"No se pudo eliminar el archivo {file_id} de Mistral: {str(e)}")
+
+
+def ocr_document(api_key: str, data: ByteString, mime_type: str, file_name: str = "documento",
+                 model: str = DEFAULT_OCR_MODEL, timeout: float = 120,
+                 upload_min_bytes: int = UPLOAD_MIN_BYTES) -> Dict[str, Any]:
+    """
+    Procesa un documento o una imagen con la API OCR eligiendo cómo enviarlo.
+
+    Los archivos de `upload_min_bytes` o más se suben en streaming a la API de
+    archivos y la solicitud OCR solo lleva su URL firmada; los pequeños van como
+    data URI en un cuerpo construido sin copias intermedias (una solicitud
+    menos).
+
+    Returns:
+        dict: Respuesta JSON de la API OCR
+
+    Raises:
+        OCRRequestError: Si la subida o el OCR fallan tras los reintentos
+    """
+    if len(data) < upload_min_bytes:
+        return post_ocr(api_key, model=model, timeout=timeout, body=build_ocr_body(data, mime_type, model))
+
+    file_id = upload_file(api_key, data, file_name, mime_type)
+    try:
+        url = get_signed_url(api_key, file_id)
+        document_type = "image_url" if mime_type.startswith("image/") else "document_url"
+        return post_ocr(api_key, {"type": document_type, document_type: url}, model=model, timeout=timeout)
+    finally:
+        delete_file(api_key, file_id)
+
+
+class OCRBatchExecutor:
+    """
+    Ejecuta las tareas de un lote en paralelo y devuelve los resultados en orden.
+
+    El estado de cada elemento (pendiente, procesando, completado, error) y su
+    duración se publican a través de `on_update`, que se llama siempre desde el
+    hilo que ejecuta `run` (apto para actualizar widgets de Streamlit).
+
+    Args:
+        max_workers (int): Tareas simultáneas
+        poll_interval (float): Segundos entre actualizaciones mientras no termina ninguna tarea
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_CONCURRENCY, poll_interval: float = 0.5):
+        self.max_workers = max(1, min(max_workers, MAX_CONCURRENCY))
+        self.poll_interval = poll_interval
+
+    def run(self, items: Sequence[Any], task: Callable[[Any], Any],
+            on_update: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+            is_failure: Optional[Callable[[Any], bool]] = None) -> List[Any]:
+        """
+        Procesa `items` con `task` y devuelve los resultados en el orden de entrada.
+
+        Args:
+            items (sequence): Elementos del lote
+            task (callable): Función que procesa un elemento (se ejecuta en un hilo)
+            on_update (callable, optional): Recibe la lista de estados
+                [{"status", "elapsed", "error"}] cada vez que algo cambia
+            is_failure (callable, optional): Indica si un resultado cuenta como error
+
+        Returns:
+            list: Resultados (o la excepción lanzada por la tarea) en orden
+        """
+        states = [{"status": PENDING, "elapsed": 0.0, "error": None} for _ in items]
+        started_at: Dict[int, float] = {}
+        results: List[Any] = [None] * len(items)
+
+        def run_item(index: int):
+            started_at[index] = time.monotonic()
+            states[index]["status"] = RUNNING
+            return task(items[index])
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ocr-batch") as pool:
+            futures = {pool.submit(run_item, index): index for index in range(len(items))}
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(pending, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = futures[future]
+                    state = states[index]
+                    state["elapsed"] = time.monotonic() - started_at.get(index, time.monotonic())
+                    try:
+                        results[index] = future.result()
+                        failed = bool(is_failure and is_failure(results[index]))
+                    except Exception as e:
+                        logger.error(f"Error en la tarea {index} del lote: {str(e)}")
+                        results[index] = e
+                        state["error"] = str(e)
+                        failed = True
+                    state["status"] = FAILED if failed else DONE
+                now = time.monotonic()
+                for index, start in list(started_at.items()):
+                    if states[index]["status"] == RUNNING:
+                        states[index]["elapsed"] = now - start
+                if on_update:
+                    on_update([dict(state) for state in states])
+        return results
+
+
+class PDFPageRange:
+    """
+    Subdocumento de un PDF: páginas [start, end) y sus bytes.
+
+    Args:
+        start (int): Primera página (base 0)
+        end (int): Página siguiente a la última
+        data (bytes): PDF con solo esas páginas
+    """
+
+    def __init__(self, start: int, end: int, data: bytes):
+        self.start = start
+        self.end = end
+        self.data = data
+        self.status = PENDING
+        self.attempts = 0
+        self.elapsed = 0.0
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.pages: List[Dict[str, Any]] = []
+
+    @property
+    def retryable(self) -> bool:
+        """Indica si el último error admite otra ronda (timeout, conexión, 429 o 5xx)."""
+        return self.status_code is None or self.status_code in RETRYABLE_STATUS_CODES
+
+    @property
+    def label(self) -> str:
+        """Rango legible con páginas en base 1 (p. ej. "1-16")."""
+        if self.end <= self.start:
+            return "todas"
+        return f"{self.start + 1}-{self.end}"
+
+    def timing(self) -> Dict[str, Any]:
+        """Resumen del procesamiento del rango."""
+        return {
+            "pages": self.label,
+            "status": self.status,
+            "attempts": self.attempts,
+            "elapsed": round(self.elapsed, 2),
+            "error": self.error,
+        }
+
+
+def pdf_page_count(pdf_data: bytes) -> Optional[int]:
+    """Devuelve el número de páginas del PDF o None si PyMuPDF no está disponible o falla."""
+    if pymupdf is None:
+        return None
+    try:
+        with pymupdf.open(stream=pdf_data, filetype="pdf") as doc:
+            return doc.page_count
+    except Exception as e:
+        logger.warning(f"No se pudo abrir el PDF con PyMuPDF: {str(e)}")
+        return None
+
+
+def page_range_bounds(page_count: int, pages_per_range: int = DEFAULT_PAGES_PER_RANGE) -> List[Tuple[int, int]]:
+    """Devuelve los rangos [inicio, fin) en que se divide un documento de `page_count` páginas."""
+    return [(start, min(start + pages_per_range, page_count)) for start in range(0, page_count, pages_per_range)]
+
+
+def _extract_pages(doc, start: int, end: int) -> bytes:
+    with pymupdf.open() as part:
+        part.insert_pdf(doc, from_page=start, to_page=end - 1)
+        return part.tobytes(garbage=3, deflate=True)
+
+
+def ocr_pdf_by_ranges(api_key: str, pdf_data: bytes, model: str = DEFAULT_OCR_MODEL,
+                      pages_per_range: int = DEFAULT_PAGES_PER_RANGE,
+                      max_workers: int = DEFAULT_CONCURRENCY, timeout: float = 120,
+                      max_rounds: int = MAX_RANGE_ROUNDS, cache: Optional[OCRResultCache] = None,
+                      options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Procesa un PDF con la API OCR dividiéndolo en rangos de páginas en paralelo.
+
+    Cada rango es una solicitud independiente (con sus propios reintentos); si
+    alguno falla, solo se vuelven a enviar los rangos fallidos, hasta
+    `max_rounds` rondas. Las páginas se devuelven en el orden del documento con
+    su índice absoluto. Con `cache`, los rangos ya procesados se leen de la
+    caché OCR (sin extraerlos ni enviarlos) y los nuevos se guardan en ella.
+
+    Args:
+        api_key (str): API key de Mistral
+        pdf_data (bytes): Contenido del PDF
+        model (str): Modelo OCR
+        pages_per_range (int): Páginas por subdocumento
+        max_workers (int): Rangos simultáneos
+        timeout (float): Segundos máximos por solicitud
+        max_rounds (int): Rondas de reintento de los rangos fallidos
+        cache (OCRResultCache, optional): Caché de resultados OCR
+        options (dict, optional): Opciones de preprocesamiento que forman parte de la clave de caché
+
+    Returns:
+        dict: Respuesta con el formato de la API (`pages`, `model`) más `ranges`,
+        la duración, los intentos y el estado de cada rango, y `cached` si todo
+        el documento salió de la caché
+
+    Raises:
+        OCRRequestError: Si algún rango sigue fallando tras las rondas de reintento
+    """
+    digest = file_digest(pdf_data) if cache is not None else None
+    page_count = pdf_page_count(pdf_data)
+    if not page_count or page_count <= pages_per_range:
+        bounds = [(0, page_count or 0)]
+    else:
+        bounds = page_range_bounds(page_count, pages_per_range)
+    whole_document = len(bounds) == 1
+
+    def cache_range(start: int, end: int):
+        # Un documento sin dividir se guarda como documento completo
+        return None if whole_document else (start, end)
+
+    ranges = []
+    for start, end in bounds:
+        page_range = PDFPageRange(start, end, b"")
+        cached_pages = cache.get(digest, model, cache_range(start, end), options) if cache is not None else None
+        if cached_pages is not None:
+            page_range.pages = [{"index": index, "markdown": markdown} for index, markdown in enumerate(cached_pages)]
+            page_range.status = CACHED
+        ranges.append(page_range)
+
+    # Solo se extraen (y envían) los rangos que no estaban en caché
+    pending = [page_range for page_range in ranges if page_range.status != CACHED]
+    if whole_document:
+        for page_range in pending:
+            page_range.data = pdf_data
+    elif pending:
+        with pymupdf.open(stream=pdf_data, filetype="pdf") as doc:
+            for page_range in pending:
+                page_range.data = _extract_pages(doc, page_range.start, page_range.end)
+    executor = OCRBatchExecutor(max_workers=max_workers)
+
+    def process_range(page_range: PDFPageRange) -> PDFPageRange:
+        page_range.attempts += 1
+        started = time.monotonic()
+        try:
+            response = ocr_document(api_key, page_range.data, "application/pdf",
+                                    f"paginas_{page_range.label}.pdf", model=model, timeout=timeout)
+        except OCRRequestError as e:
+            page_range.status = FAILED
+            page_range.error = str(e)
+            page_range.status_code = e.status_code
+        else:
+            page_range.pages = response.get("pages", [])
+            page_range.status = DONE
+            page_range.error = None
+            if cache is not None:
+                cache.set(digest, model, [page.get("markdown", "") for page in page_range.pages],
+                          cache_range(page_range.start, page_range.end), options)
+        finally:
+            page_range.elapsed += time.monotonic() - started
+        return page_range
+
+    for round_index in range(max_rounds + 1):
+        if not pending:
+            break
+        if round_index:
+            logger.warning(f"Reintentando {len(pending)} rango(s) de páginas: "
+                           f"{', '.join(page_range.label for page_range in pending)}")
+        executor.run(pending, process_range)
+        pending = [page_range for page_range in ranges if page_range.status == FAILED]
+        # Los errores no reintentables (p. ej. 400 o 401) no mejoran en otra ronda
+        if not pending or not all(page_range.retryable for page_range in pending):
+            break
+
+    timings = [page_range.timing() for page_range in ranges]
+    for timing in timings:
+        logger.info(f"OCR páginas {timing['pages']}: {timing['status']} en {timing['elapsed']} s "
+                    f"({timing['attempts']} intento(s))")
+    if pending:
+        failed = ", ".join(page_range.label for page_range in pending)
+        raise OCRRequestError(f"No se pudieron procesar las páginas {failed}: {pending[0].error}",
+                              pending[0].status_code, timings)
+
+    pages = []
+    for page_range in ranges:
+        for local_index, page in enumerate(page_range.pages):
+            page = dict(page)
+            page["index"] = page_range.start + page.get("index", local_index)
+            pages.append(page)
+    cached = all(page_range.status == CACHED for page_range in ranges)
+    return {"pages": pages, "model": model, "ranges": timings, "cached": cached}
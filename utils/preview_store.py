@@ -0,0 +1,279 @@
+"""
+Almacén en disco de los archivos subidos para sus vistas previas.
+
+Guardar en `st.session_state` el data URI en base64 de cada PDF o imagen
+procesada multiplica la memoria de cada sesión por el tamaño de los archivos.
+`PreviewStore` guarda cada archivo una sola vez en disco (por su SHA-256) y la
+sesión solo conserva un `PreviewHandle` con el identificador, el nombre y el
+tipo. Las miniaturas y las primeras páginas de los PDF se generan bajo demanda
+y también se guardan en disco. Los archivos caducan y el tamaño total está
+limitado, salvo los que otros módulos fijan (por ejemplo, las entradas de los
+trabajos OCR pendientes de `utils/ocr_jobs.py`).
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .image_utils import open_reduced
+from .storage_utils import get_cache_dir
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+THUMBNAIL_SIZE = (800, 800)
+# Páginas de un PDF que pueden mostrarse en la vista previa
+MAX_PREVIEW_PAGES = 5
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class PreviewHandle:
+    """
+    Referencia ligera a un archivo del almacén de vistas previas.
+
+    Args:
+        file_id (str): SHA-256 del contenido
+        file_name (str): Nombre original del archivo
+        mime_type (str): Tipo MIME
+        size (int): Tamaño en bytes
+    """
+
+    def __init__(self, file_id: str, file_name: str, mime_type: str, size: int):
+        self.id = file_id
+        self.file_name = file_name
+        self.mime_type = mime_type or "application/octet-stream"
+        self.size = size
+
+    @property
+    def is_pdf(self) -> bool:
+        return self.mime_type == "application/pdf"
+
+    def __repr__(self) -> str:
+        return f"PreviewHandle({self.file_name!r}, {self.mime_type}, {self.size} bytes)"
+
+
+class PreviewStore:
+    """
+    Archivos originales y miniaturas en disco con caducidad y límite de tamaño.
+
+    Args:
+        root_dir (str, optional): Directorio del almacén
+        max_bytes (int): Tamaño máximo de los archivos almacenados
+        ttl_seconds (float): Tiempo desde la última subida tras el que se eliminan los archivos
+    """
+
+    def __init__(self, root_dir: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.root_dir = root_dir or get_cache_dir("previews")
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._pin_providers: List[Callable[[], Iterable[str]]] = []
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root_dir, name)
+
+    def put(self, source: Union[bytes, BinaryIO], file_name: str, mime_type: str) -> PreviewHandle:
+        """
+        Guarda un archivo y devuelve su referencia.
+
+        Los archivos subidos (`BytesIO`) se leen a través de `getbuffer()`, sin
+        copiar su contenido; los demás objetos de archivo se copian por bloques.
+
+        Args:
+            source (bytes or file): Contenido o archivo subido
+            file_name (str): Nombre original
+            mime_type (str): Tipo MIME
+        """
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, suffix=".tmp")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                for chunk in _iter_chunks(source):
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+                    size += len(chunk)
+            file_id = digest.hexdigest()
+            path = self._path(file_id)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                os.utime(path)
+            else:
+                os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._prune()
+        return PreviewHandle(file_id, file_name, mime_type, size)
+
+    def add_pin_provider(self, provider: Callable[[], Iterable[str]]) -> None:
+        """
+        Registra una función que devuelve los ids de archivos que no deben eliminarse.
+
+        Los archivos fijados no caducan ni se desalojan por tamaño mientras la
+        función los siga devolviendo.
+        """
+        with self._lock:
+            self._pin_providers.append(provider)
+
+    def _pinned_ids(self) -> Set[str]:
+        pinned: Set[str] = set()
+        for provider in self._pin_providers:
+            try:
+                pinned.update(provider())
+            except Exception as e:
+                logger.warning(f"No se pudieron obtener los archivos fijados: {str(e)}")
+        return pinned
+
+    def exists(self, handle: PreviewHandle) -> bool:
+        return os.path.exists(self._path(handle.id))
+
+    def open(self, handle: PreviewHandle) -> BinaryIO:
+        """Abre el archivo original en modo binario."""
+        return open(self._path(handle.id), "rb")
+
+    def page_count(self, handle: PreviewHandle) -> int:
+        """Número de páginas de un PDF (1 para imágenes, 0 si no se puede abrir)."""
+        if not handle.is_pdf:
+            return 1
+        if pymupdf is None:
+            return 0
+        try:
+            with pymupdf.open(self._path(handle.id)) as doc:
+                return doc.page_count
+        except Exception as e:
+            logger.warning(f"No se pudo abrir el PDF {handle.file_name}: {str(e)}")
+            return 0
+
+    def thumbnail(self, handle: PreviewHandle, max_size: Tuple[int, int] = THUMBNAIL_SIZE) -> Optional[bytes]:
+        """Miniatura de una imagen o de la primera página de un PDF (None si no es posible)."""
+        if handle.is_pdf:
+            return self.page_image(handle, 0, max_size)
+        return self._cached_render(f"{handle.id}.thumb{max_size[0]}x{max_size[1]}",
+                                   lambda: self._render_image(handle, max_size))
+
+    def page_image(self, handle: PreviewHandle, page_index: int,
+                   max_size: Tuple[int, int] = THUMBNAIL_SIZE) -> Optional[bytes]:
+        """Imagen PNG de una página de un PDF (None si no es posible)."""
+        if pymupdf is None or page_index >= MAX_PREVIEW_PAGES:
+            return None
+        return self._cached_render(f"{handle.id}.p{page_index}.{max_size[0]}x{max_size[1]}",
+                                   lambda: self._render_pdf_page(handle, page_index, max_size))
+
+    def page_images(self, handle: PreviewHandle, count: int = MAX_PREVIEW_PAGES) -> List[bytes]:
+        """Imágenes de las primeras `count` páginas de un PDF."""
+        images = []
+        for page_index in range(min(count, self.page_count(handle), MAX_PREVIEW_PAGES)):
+            image = self.page_image(handle, page_index)
+            if image is not None:
+                images.append(image)
+        return images
+
+    def _cached_render(self, name: str, render) -> Optional[bytes]:
+        path = self._path(name)
+        try:
+            with open(path, "rb") as cached:
+                return cached.read()
+        except FileNotFoundError:
+            pass
+        try:
+            data = render()
+        except Exception as e:
+            logger.warning(f"No se pudo generar la vista previa {name}: {str(e)}")
+            return None
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+        return data
+
+    def _render_image(self, handle: PreviewHandle, max_size: Tuple[int, int]) -> bytes:
+        with self.open(handle) as source:
+            image = open_reduced(source, max_size)
+        buffer = BytesIO()
+        if image.mode in ("RGBA", "LA", "P"):
+            image.save(buffer, format="PNG")
+        else:
+            image.convert("RGB").save(buffer, format="JPEG", quality=85)
+        return buffer.getvalue()
+
+    def _render_pdf_page(self, handle: PreviewHandle, page_index: int, max_size: Tuple[int, int]) -> bytes:
+        with pymupdf.open(self._path(handle.id)) as doc:
+            page = doc[page_index]
+            zoom = min(max_size[0] / page.rect.width, max_size[1] / page.rect.height)
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom))
+            return pixmap.tobytes("png")
+
+    def _prune(self) -> None:
+        """Elimina los archivos caducados y, si se supera el límite, los más antiguos (salvo los fijados)."""
+        with self._lock:
+            now = time.time()
+            pinned = self._pinned_ids()
+            entries = []
+            for entry in os.scandir(self.root_dir):
+                if not entry.is_file() or entry.name.endswith(".tmp") or entry.name in pinned:
+                    continue
+                stat = entry.stat()
+                if self.ttl_seconds and now - stat.st_mtime > self.ttl_seconds:
+                    os.remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                os.remove(path)
+                total_bytes -= size
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve el número de archivos y bytes almacenados."""
+        files = [entry for entry in os.scandir(self.root_dir) if entry.is_file()]
+        return {"files": len(files), "bytes": sum(entry.stat().st_size for entry in files)}
+
+
+def _iter_chunks(source: Union[bytes, BinaryIO]):
+    """Recorre el contenido por bloques sin copiarlo cuando es posible."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield memoryview(source)
+        return
+    if hasattr(source, "getbuffer"):
+        with source.getbuffer() as view:
+            yield view
+        return
+    position = source.tell() if hasattr(source, "tell") else None
+    while True:
+        chunk = source.read(_COPY_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+    if position is not None:
+        source.seek(position)
+
+
+_preview_store: Optional[PreviewStore] = None
+_preview_store_lock = threading.Lock()
+
+
+def get_preview_store() -> PreviewStore:
+    """Devuelve el almacén de vistas previas compartido por el proceso."""
+    global _preview_store
+    if _preview_store is None:
+        with _preview_store_lock:
+            if _preview_store is None:
+                _preview_store = PreviewStore()
+    return _preview_store
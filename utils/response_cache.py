@@ -0,0 +1,364 @@
+"""
+Caché de respuestas LLM (coincidencia exacta y semántica) respaldada por SQLite.
+
+Se conecta a los `ChatOpenAI` de `configure_llm` mediante el parámetro `cache`
+de LangChain. La búsqueda exacta usa (modelo y parámetros, mensajes normalizados);
+la búsqueda semántica, opcional, compara el embedding de la última pregunta del
+usuario con las preguntas ya respondidas en el mismo contexto de conversación.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from .storage_utils import connect_sqlite, get_cache_dir
+
+try:
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps, loads
+except ImportError:
+    # Para pruebas sin LangChain
+    BaseCache = object
+    dumps = loads = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+# Máximo de candidatos comparados en una búsqueda semántica
+SEMANTIC_SCAN_LIMIT = 2000
+
+# Marcador de turno de usuario en los prompts de ConversationChain
+_HUMAN_TURN_RE = re.compile(r"\n\s*human:", re.IGNORECASE)
+_AI_SUFFIX_RE = re.compile(r"\n\s*ai:\s*$", re.IGNORECASE)
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza espacios, mayúsculas y forma Unicode de un texto."""
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split()).casefold()
+
+
+def _messages_from_prompt(prompt: str) -> Sequence[Tuple[str, str]]:
+    """
+    Extrae (rol, contenido) del prompt serializado que LangChain pasa a la caché.
+
+    Para modelos de chat el prompt es la serialización JSON de la lista de mensajes;
+    para LLMs de texto es el texto plano.
+    """
+    try:
+        data = json.loads(prompt)
+    except (TypeError, ValueError):
+        return [("human", prompt)]
+
+    if not isinstance(data, list):
+        return [("human", prompt)]
+
+    messages = []
+    for item in data:
+        if isinstance(item, dict):
+            kwargs = item.get("kwargs", item)
+            role = kwargs.get("type") or (item.get("id") or ["human"])[-1]
+            content = kwargs.get("content", "")
+        else:
+            role, content = "human", item
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True, ensure_ascii=False)
+        messages.append((str(role).lower(), content))
+    return messages
+
+
+def split_prompt(prompt: str) -> Tuple[str, str]:
+    """
+    Separa un prompt en (contexto normalizado, pregunta normalizada).
+
+    La pregunta es el último turno del usuario; el contexto es todo lo anterior
+    (mensajes previos, plantilla e historial). Dos prompts solo se consideran
+    equivalentes semánticamente si comparten exactamente el mismo contexto.
+    """
+    messages = _messages_from_prompt(prompt)
+    normalized = [(role, normalize_text(content)) for role, content in messages]
+
+    question_idx = None
+    for idx in range(len(normalized) - 1, -1, -1):
+        if normalized[idx][0] in ("human", "humanmessage", "user"):
+            question_idx = idx
+            break
+    if question_idx is None:
+        question_idx = len(normalized) - 1
+
+    context_parts = [f"{role}: {content}" for role, content in normalized[:question_idx]]
+    question = messages[question_idx][1] if messages else ""
+
+    # Los prompts de ConversationChain incluyen el historial dentro del mismo mensaje
+    turns = list(_HUMAN_TURN_RE.finditer(question))
+    if turns:
+        last_turn = turns[-1]
+        context_parts.append(normalize_text(question[: last_turn.start()]))
+        question = question[last_turn.end():]
+    question = _AI_SUFFIX_RE.sub("", question)
+
+    return "\n".join(context_parts), normalize_text(question)
+
+
+def _hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class SQLiteResponseCache(BaseCache):
+    """
+    Caché de respuestas LLM con TTL y desalojo LRU sobre SQLite.
+
+    Args:
+        db_path (str, optional): Ruta del archivo SQLite
+        ttl_seconds (float): Vida máxima de una respuesta en caché
+        max_entries (int): Número máximo de respuestas (se desalojan las menos usadas)
+        semantic (bool): Activa la búsqueda semántica además de la exacta
+        similarity_threshold (float): Similitud coseno mínima para un acierto semántico
+        embeddings_model (str, optional): Modelo de embeddings para la búsqueda semántica
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        semantic: bool = False,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        embeddings_model: Optional[str] = None,
+    ):
+        self.db_path = db_path or os.path.join(get_cache_dir(), "llm_responses.sqlite")
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self.embeddings_model = embeddings_model
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(self.db_path)
+        self._init_schema()
+
+    def __repr__(self) -> str:
+        # Representación estable: forma parte de la clave del pool de clientes
+        return (
+            f"SQLiteResponseCache(db_path={self.db_path!r}, semantic={self.semantic}, "
+            f"threshold={self.similarity_threshold})"
+        )
+
+    def _init_schema(self):
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    llm_hash TEXT NOT NULL,
+                    context_hash TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    embedding BLOB,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_llm_responses_context
+                    ON llm_responses (llm_hash, context_hash);
+                CREATE INDEX IF NOT EXISTS idx_llm_responses_access
+                    ON llm_responses (last_access);
+                """
+            )
+            self._conn.commit()
+
+    # ---------------------------------------------------------------- helpers
+
+    def _embed(self, text: str):
+        """Calcula el embedding normalizado de un texto (o None si no es posible)."""
+        try:
+            import numpy as np
+            from .embedding_utils import DEFAULT_EMBEDDINGS_MODEL, get_embeddings
+
+            model = get_embeddings(self.embeddings_model or DEFAULT_EMBEDDINGS_MODEL)
+            vector = np.asarray(model.embed_query(text), dtype=np.float32)
+            norm = float(np.linalg.norm(vector))
+            return vector / norm if norm else vector
+        except Exception as e:
+            logger.warning(f"No se pudo calcular el embedding para la caché semántica: {str(e)}")
+            return None
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - created_at > self.ttl_seconds
+
+    def _load_payload(self, payload: str):
+        try:
+            return loads(payload)
+        except Exception as e:
+            logger.warning(f"Entrada de caché ilegible, se ignora: {str(e)}")
+            return None
+
+    # ------------------------------------------------------------ BaseCache
+
+    def lookup(self, prompt: str, llm_string: str):
+        """Busca una respuesta exacta y, si está activada, una semánticamente similar."""
+        now = time.time()
+        llm_hash = _hash(llm_string)
+        context, question = split_prompt(prompt)
+        context_hash = _hash(context)
+        key = _hash(llm_hash, context_hash, question)
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                if self._is_expired(row["created_at"], now):
+                    self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                else:
+                    self._conn.execute(
+                        "UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key)
+                    )
+                    self._conn.commit()
+                    logger.info("Acierto exacto en la caché de respuestas")
+                    return self._load_payload(row["payload"])
+
+        if not self.semantic or not question:
+            return None
+
+        return self._semantic_lookup(llm_hash, context_hash, question, now)
+
+    def _semantic_lookup(self, llm_hash: str, context_hash: str, question: str, now: float):
+        import numpy as np
+
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT key, payload, embedding, created_at FROM llm_responses
+                WHERE llm_hash = ? AND context_hash = ? AND embedding IS NOT NULL
+                ORDER BY last_access DESC LIMIT ?
+                """,
+                (llm_hash, context_hash, SEMANTIC_SCAN_LIMIT),
+            ).fetchall()
+
+        rows = [row for row in rows if not self._is_expired(row["created_at"], now)]
+        if not rows:
+            return None
+
+        query_vector = self._embed(question)
+        if query_vector is None:
+            return None
+
+        matrix = np.stack([np.frombuffer(row["embedding"], dtype=np.float32) for row in rows])
+        scores = matrix @ query_vector
+        best = int(np.argmax(scores))
+        if float(scores[best]) < self.similarity_threshold:
+            return None
+
+        best_row = rows[best]
+        with self._lock:
+            self._conn.execute(
+                "UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, best_row["key"])
+            )
+            self._conn.commit()
+        logger.info(f"Acierto semántico en la caché de respuestas (similitud {float(scores[best]):.3f})")
+        return self._load_payload(best_row["payload"])
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        """Guarda una respuesta y aplica el desalojo por TTL y LRU."""
+        now = time.time()
+        llm_hash = _hash(llm_string)
+        context, question = split_prompt(prompt)
+        context_hash = _hash(context)
+        key = _hash(llm_hash, context_hash, question)
+
+        try:
+            payload = dumps(return_val)
+        except Exception as e:
+            logger.warning(f"No se pudo serializar la respuesta para la caché: {str(e)}")
+            return
+
+        embedding = None
+        if self.semantic and question:
+            vector = self._embed(question)
+            if vector is not None:
+                embedding = vector.tobytes()
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_responses
+                    (key, llm_hash, context_hash, question, payload, embedding, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, llm_hash, context_hash, question, payload, embedding, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Elimina entradas caducadas y, si se supera el límite, las menos usadas."""
+        if self.ttl_seconds:
+            self._conn.execute(
+                "DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                """
+                DELETE FROM llm_responses WHERE key IN (
+                    SELECT key FROM llm_responses ORDER BY last_access ASC LIMIT ?
+                )
+                """,
+                (overflow,),
+            )
+
+    def clear(self, **kwargs: Any):
+        """Vacía la caché."""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve el número de respuestas almacenadas."""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+        return {"entries": count}
+
+
+_response_caches: Dict[bool, SQLiteResponseCache] = {}
+_response_caches_lock = threading.Lock()
+
+
+def get_response_cache(semantic: bool = False) -> Optional[SQLiteResponseCache]:
+    """
+    Devuelve la caché de respuestas compartida del proceso.
+
+    Las variantes exacta y semántica comparten el mismo archivo SQLite; la
+    semántica además calcula y consulta embeddings.
+
+    Args:
+        semantic (bool): Si se desea la variante con búsqueda semántica
+
+    Returns:
+        SQLiteResponseCache: Caché lista para pasarse a `ChatOpenAI(cache=...)`,
+        o None si LangChain no está disponible
+    """
+    if loads is None:
+        return None
+
+    cache = _response_caches.get(semantic)
+    if cache is None:
+        with _response_caches_lock:
+            cache = _response_caches.get(semantic)
+            if cache is None:
+                cache = SQLiteResponseCache(semantic=semantic)
+                _response_caches[semantic] = cache
+    return cache
@@ -0,0 +1,303 @@
+"""
+Resumen compacto del esquema de una base de datos para el agente SQL.
+
+`SQLDatabase.get_table_info` describe cada tabla con su CREATE TABLE completo y
+filas de ejemplo; con esquemas anchos eso ocupa miles de tokens en cada paso
+del agente. `SchemaDigest` refleja el esquema una sola vez, guarda una línea
+compacta por tabla ("Tabla(col tipo PK, col tipo→Otra, ...)") y un índice de
+nombres de columnas, y para cada pregunta selecciona solo las tablas relevantes
+mediante búsqueda léxica (nombres de tablas y columnas) y, opcionalmente, por
+similitud de embeddings.
+"""
+
+import logging
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import inspect as sa_inspect
+
+from .token_utils import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TABLES = 8
+# Tablas a partir de las que conviene complementar la búsqueda léxica con embeddings
+EMBEDDING_MIN_TABLES = 50
+# Columnas por tabla incluidas en el resumen (las tablas muy anchas se recortan)
+MAX_COLUMNS_PER_TABLE = 40
+# Peso de una coincidencia en el nombre de la tabla frente a una en sus columnas
+TABLE_NAME_WEIGHT = 3.0
+# Peso de la similitud de embeddings al combinarla con la puntuación léxica
+EMBEDDING_WEIGHT = 1.0
+# Tokens máximos del listado de nombres cuando no hay tablas relevantes
+MAX_TABLE_LIST_TOKENS = 600
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Partes de un identificador en camelCase, PascalCase o snake_case
+_IDENTIFIER_PART_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-zà-ÿ]+|\d+")
+
+_STOPWORDS = {
+    # Español
+    "de", "la", "el", "los", "las", "del", "en", "un", "una", "por", "con", "para", "que", "cual",
+    "cuales", "cuantos", "cuantas", "cuántos", "cuántas", "cuál", "cuáles", "qué", "es", "son", "al",
+    "lo", "se", "su", "sus", "y", "o", "mas", "más", "muestra", "dame", "lista", "todos", "todas",
+    "cada", "hay", "tiene", "tienen", "entre", "sobre", "como", "cómo",
+    # Inglés
+    "the", "of", "and", "or", "in", "on", "for", "to", "by", "with", "what", "which", "how", "many",
+    "is", "are", "show", "list", "all", "each", "from", "top", "me", "give",
+}
+
+# Equivalencias español -> inglés para preguntas en español sobre esquemas en inglés
+_SYNONYMS = {
+    "cliente": ["customer", "client"], "canción": ["track", "song"], "cancion": ["track", "song"],
+    "pista": ["track"], "venta": ["invoice", "sale", "order"], "vendida": ["invoice", "sale"],
+    "vendido": ["invoice", "sale"], "factura": ["invoice"], "pedido": ["order"],
+    "producto": ["product", "item"], "empleado": ["employee"], "artista": ["artist"],
+    "album": ["album"], "álbum": ["album"], "género": ["genre"], "genero": ["genre"],
+    "país": ["country"], "pais": ["country"], "ciudad": ["city"], "usuario": ["user"],
+    "precio": ["price"], "fecha": ["date"], "nombre": ["name"], "proveedor": ["supplier", "vendor"],
+    "categoría": ["category"], "categoria": ["category"], "pago": ["payment"],
+}
+
+
+def _stem(word: str) -> str:
+    """Singular aproximado para que "customers"/"clientes" coincidan con "Customer"/"cliente"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("es") and word[-3] in "sxzrnld":
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def split_identifier(name: str) -> List[str]:
+    """
+    Divide un identificador en palabras normalizadas.
+
+    Ejemplo: "InvoiceLine" -> ["invoice", "line"], "media_types" -> ["media", "type"]
+    """
+    words = []
+    for chunk in re.split(r"[^0-9A-Za-zÀ-ÿ]+", name):
+        for part in _IDENTIFIER_PART_RE.findall(chunk):
+            part = part.lower()
+            if part and part not in _STOPWORDS:
+                words.append(_stem(part))
+    return words
+
+
+def _question_terms(question: str) -> Set[str]:
+    terms = set()
+    for word in _WORD_RE.findall(question):
+        for term in split_identifier(word):
+            if len(term) > 1:
+                terms.add(term)
+                terms.update(_SYNONYMS.get(term, ()))
+    return terms
+
+
+def _compact_type(column_type: Any) -> str:
+    try:
+        return str(column_type).lower()
+    except Exception:
+        return "?"
+
+
+class SchemaDigest:
+    """
+    Resúmenes compactos por tabla con índice léxico de tablas y columnas.
+
+    Args:
+        tables (dict): Tabla -> lista de columnas {"name", "type", "pk", "fk"}
+    """
+
+    def __init__(self, tables: Dict[str, List[Dict[str, Any]]]):
+        self.tables = tables
+        self.lines: Dict[str, str] = {}
+        self.neighbors: Dict[str, Set[str]] = defaultdict(set)
+        # Índice de nombres de columnas: nombre en minúsculas -> tablas que la contienen
+        self.column_index: Dict[str, List[str]] = defaultdict(list)
+        # Índice léxico: término -> {tabla: peso}
+        self._index: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._lower_names = {table.lower(): table for table in tables}
+        self._embedding_matrix = None
+        self._embedding_lock = threading.Lock()
+
+        for table, columns in tables.items():
+            self.lines[table] = self._summarize(table, columns)
+            for term in split_identifier(table):
+                self._index[term][table] = TABLE_NAME_WEIGHT
+            for column in columns:
+                self.column_index[column["name"].lower()].append(table)
+                for term in split_identifier(column["name"]):
+                    self._index[term].setdefault(table, 1.0)
+                if column.get("fk"):
+                    self.neighbors[table].add(column["fk"])
+                    self.neighbors[column["fk"]].add(table)
+
+        total = max(len(tables), 1)
+        self._idf = {term: math.log(1 + total / len(postings)) for term, postings in self._index.items()}
+
+    @classmethod
+    def from_engine(cls, engine, table_names: Iterable[str], schema: Optional[str] = None) -> "SchemaDigest":
+        """
+        Construye el resumen reflejando columnas, claves primarias y foráneas.
+
+        Args:
+            engine: Engine de SQLAlchemy
+            table_names (iterable): Tablas a incluir
+            schema (str, optional): Esquema de la base de datos
+        """
+        inspector = sa_inspect(engine)
+        tables = {}
+        for table in table_names:
+            try:
+                columns = inspector.get_columns(table, schema=schema)
+                primary_key = set(inspector.get_pk_constraint(table, schema=schema).get("constrained_columns") or [])
+                foreign_keys = {}
+                for fk in inspector.get_foreign_keys(table, schema=schema):
+                    for column in fk.get("constrained_columns") or []:
+                        foreign_keys[column] = fk.get("referred_table")
+            except Exception as e:
+                logger.warning(f"No se pudo reflejar la tabla {table}: {str(e)}")
+                continue
+            tables[table] = [
+                {
+                    "name": column["name"],
+                    "type": _compact_type(column.get("type")),
+                    "pk": column["name"] in primary_key,
+                    "fk": foreign_keys.get(column["name"]),
+                }
+                for column in columns
+            ]
+        return cls(tables)
+
+    @staticmethod
+    def _summarize(table: str, columns: List[Dict[str, Any]]) -> str:
+        parts = []
+        for column in columns[:MAX_COLUMNS_PER_TABLE]:
+            part = f"{column['name']} {column['type']}"
+            if column.get("pk"):
+                part += " PK"
+            if column.get("fk"):
+                part += f"→{column['fk']}"
+            parts.append(part)
+        if len(columns) > MAX_COLUMNS_PER_TABLE:
+            parts.append(f"... {len(columns) - MAX_COLUMNS_PER_TABLE} columnas más")
+        return f"{table}({', '.join(parts)})"
+
+    def tables_with_column(self, column_name: str) -> List[str]:
+        """Devuelve las tablas que tienen una columna con ese nombre (sin distinguir mayúsculas)."""
+        return list(self.column_index.get(column_name.lower(), []))
+
+    def lexical_scores(self, question: str) -> Dict[str, float]:
+        """Puntúa las tablas por coincidencia de términos de la pregunta (ponderados por IDF)."""
+        scores: Dict[str, float] = defaultdict(float)
+        for term in _question_terms(question):
+            postings = self._index.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for table, weight in postings.items():
+                scores[table] += weight * idf
+
+        # Tablas o columnas citadas literalmente en la pregunta
+        lowered = question.lower()
+        for word in set(_WORD_RE.findall(lowered)):
+            for table in self.column_index.get(word, ()):
+                scores[table] += 1.0
+            if word in self._lower_names:
+                scores[self._lower_names[word]] += 2 * TABLE_NAME_WEIGHT
+        return scores
+
+    def embedding_scores(self, question: str, embeddings) -> Dict[str, float]:
+        """
+        Puntúa las tablas por similitud coseno entre la pregunta y su resumen.
+
+        Los embeddings de los resúmenes se calculan una sola vez por esquema.
+        """
+        import numpy as np
+
+        names = list(self.lines)
+        if self._embedding_matrix is None:
+            with self._embedding_lock:
+                if self._embedding_matrix is None:
+                    vectors = np.asarray(embeddings.embed_documents([self.lines[name] for name in names]),
+                                         dtype=np.float32)
+                    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+                    self._embedding_matrix = vectors
+        query = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+        query /= np.linalg.norm(query) + 1e-9
+        similarities = self._embedding_matrix @ query
+        return dict(zip(names, similarities.tolist()))
+
+    def search(self, question: str, k: int = DEFAULT_MAX_TABLES, embeddings=None) -> List[str]:
+        """
+        Devuelve las tablas más relevantes para la pregunta.
+
+        Args:
+            question (str): Pregunta del usuario
+            k (int): Número máximo de tablas
+            embeddings (optional): Modelo de embeddings para complementar la búsqueda léxica
+
+        Returns:
+            list: Tablas ordenadas por relevancia, completadas con las tablas
+            relacionadas por claves foráneas (vacía si nada coincide)
+        """
+        scores = self.lexical_scores(question)
+        if embeddings is not None and self.tables:
+            try:
+                top_lexical = max(scores.values(), default=0.0) or 1.0
+                for table, similarity in self.embedding_scores(question, embeddings).items():
+                    # Normalizar la parte léxica para que ambas escalas sean comparables
+                    scores[table] = scores.get(table, 0.0) / top_lexical + EMBEDDING_WEIGHT * max(similarity, 0.0)
+            except Exception as e:
+                logger.warning(f"Búsqueda por embeddings no disponible: {str(e)}")
+
+        ranked = [table for table, score in sorted(scores.items(), key=lambda item: -item[1]) if score > 0]
+        selected = ranked[:k]
+
+        # Las tablas unidas por claves foráneas suelen hacer falta para los JOIN
+        for table in list(selected[:3]):
+            for neighbor in sorted(self.neighbors.get(table, ())):
+                if len(selected) >= k:
+                    break
+                if neighbor in self.tables and neighbor not in selected:
+                    selected.append(neighbor)
+        return selected
+
+    def render(self, table_names: Iterable[str]) -> str:
+        """Devuelve los resúmenes de las tablas indicadas, una por línea."""
+        return "\n".join(self.lines[table] for table in table_names if table in self.lines)
+
+    def digest_for(self, question: str, k: int = DEFAULT_MAX_TABLES, embeddings=None) -> str:
+        """
+        Texto compacto del esquema relevante para la pregunta, listo para el prompt.
+
+        Si el esquema es pequeño se incluyen todas las tablas; si ninguna tabla
+        coincide, se devuelve la lista de nombres (recortada) para que el agente elija.
+        """
+        if len(self.tables) <= k:
+            return self.render(self.tables)
+
+        tables = self.search(question, k=k, embeddings=embeddings)
+        if not tables:
+            names = truncate_to_tokens(", ".join(self.tables), MAX_TABLE_LIST_TOKENS)
+            return f"Tablas disponibles: {names}"
+
+        remaining = len(self.tables) - len(tables)
+        return (
+            f"{self.render(tables)}\n"
+            f"({remaining} tablas más no incluidas; usa sql_db_list_tables si ninguna de estas sirve)"
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve el número de tablas y los tokens del resumen completo."""
+        return {
+            "tables": len(self.tables),
+            "columns": sum(len(columns) for columns in self.tables.values()),
+            "digest_tokens": count_tokens("\n".join(self.lines.values())),
+        }
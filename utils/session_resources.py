@@ -0,0 +1,179 @@
+"""
+Recursos por sesión de Streamlit (cadenas, memorias, índices) con límites y caducidad.
+
+`st.cache_resource` comparte un único objeto entre todos los usuarios del
+servidor, lo que mezcla memorias de conversación de sesiones distintas. Este
+gestor guarda los recursos mutables por sesión, con un máximo de recursos por
+sesión y de sesiones vivas, y descarta los de sesiones inactivas. Las partes
+inmutables y costosas (clientes LLM, modelos de embeddings) se siguen
+compartiendo a nivel de proceso mediante `llm_pool` y `embedding_utils`.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:
+    try:
+        from streamlit.runtime.scriptrunner_utils.script_run_context import get_script_run_ctx
+    except ImportError:
+        # Para pruebas sin streamlit
+        def get_script_run_ctx():
+            return None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 500
+DEFAULT_MAX_RESOURCES_PER_SESSION = 8
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+# Intervalo mínimo entre barridos de sesiones inactivas
+EVICTION_INTERVAL = 60
+
+# Sesión usada cuando el código se ejecuta fuera de un script de Streamlit
+DEFAULT_SESSION_ID = "default"
+
+
+def get_current_session_id() -> str:
+    """Devuelve el identificador de la sesión de Streamlit en curso."""
+    ctx = get_script_run_ctx()
+    return getattr(ctx, "session_id", None) or DEFAULT_SESSION_ID
+
+
+class _SessionEntry:
+    def __init__(self):
+        # nombre -> (clave, recurso)
+        self.resources: "OrderedDict[str, tuple]" = OrderedDict()
+        self.last_access = time.monotonic()
+
+
+class SessionResourceManager:
+    """
+    Almacén de recursos aislado por sesión, acotado y con descarte por inactividad.
+
+    Args:
+        max_sessions (int): Sesiones con recursos que se mantienen a la vez (LRU)
+        max_resources_per_session (int): Recursos por sesión antes de descartar el más antiguo
+        idle_timeout (int): Segundos sin uso tras los que se descartan los recursos de una sesión
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 max_resources_per_session: int = DEFAULT_MAX_RESOURCES_PER_SESSION,
+                 idle_timeout: int = DEFAULT_IDLE_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.max_resources_per_session = max_resources_per_session
+        self.idle_timeout = idle_timeout
+        self._sessions: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._last_eviction = time.monotonic()
+
+    def get_or_create(self, name: str, factory: Callable[[], Any], key: Hashable = None,
+                      session_id: Optional[str] = None) -> Any:
+        """
+        Devuelve el recurso `name` de la sesión, creándolo con `factory` si no existe.
+
+        Args:
+            name (str): Nombre del recurso dentro de la sesión
+            factory (callable): Función sin argumentos que crea el recurso
+            key: Huella de las entradas del recurso; si cambia, el recurso se vuelve a crear
+            session_id (str, optional): Sesión; por defecto, la sesión de Streamlit en curso
+
+        Returns:
+            El recurso de la sesión
+        """
+        session_id = session_id or get_current_session_id()
+        self._maybe_evict_idle()
+
+        with self._lock:
+            entry = self._touch_session(session_id)
+            stored = entry.resources.get(name)
+            if stored is not None and stored[0] == key:
+                entry.resources.move_to_end(name)
+                return stored[1]
+
+        # Crear fuera del bloqueo: algunos recursos (índices vectoriales) tardan segundos
+        resource = factory()
+
+        with self._lock:
+            entry = self._touch_session(session_id)
+            entry.resources[name] = (key, resource)
+            entry.resources.move_to_end(name)
+            while len(entry.resources) > self.max_resources_per_session:
+                evicted, _ = entry.resources.popitem(last=False)
+                logger.debug(f"Recurso '{evicted}' descartado de la sesión {session_id}")
+        return resource
+
+    def get(self, name: str, session_id: Optional[str] = None) -> Any:
+        """Devuelve el recurso `name` de la sesión o None si no existe."""
+        session_id = session_id or get_current_session_id()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or name not in entry.resources:
+                return None
+            entry.last_access = time.monotonic()
+            return entry.resources[name][1]
+
+    def release(self, name: str, session_id: Optional[str] = None) -> None:
+        """Descarta un recurso de la sesión."""
+        session_id = session_id or get_current_session_id()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry.resources.pop(name, None)
+
+    def release_session(self, session_id: Optional[str] = None) -> None:
+        """Descarta todos los recursos de una sesión sin afectar a las demás."""
+        session_id = session_id or get_current_session_id()
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _touch_session(self, session_id: str) -> _SessionEntry:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            entry = _SessionEntry()
+            self._sessions[session_id] = entry
+            while len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                logger.info(f"Recursos de la sesión {evicted} descartados (límite de sesiones)")
+        self._sessions.move_to_end(session_id)
+        entry.last_access = time.monotonic()
+        return entry
+
+    def _maybe_evict_idle(self) -> None:
+        now = time.monotonic()
+        if now - self._last_eviction < EVICTION_INTERVAL:
+            return
+        with self._lock:
+            self._last_eviction = now
+            # Las sesiones están ordenadas de menos a más reciente
+            while self._sessions:
+                session_id, entry = next(iter(self._sessions.items()))
+                if now - entry.last_access < self.idle_timeout:
+                    break
+                self._sessions.popitem(last=False)
+                logger.info(f"Recursos de la sesión inactiva {session_id} descartados")
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve el número de sesiones y recursos almacenados."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "resources": sum(len(entry.resources) for entry in self._sessions.values()),
+            }
+
+
+_manager: Optional[SessionResourceManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_session_resources() -> SessionResourceManager:
+    """Devuelve el gestor de recursos por sesión compartido por el proceso."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = SessionResourceManager()
+    return _manager
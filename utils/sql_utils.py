@@ -0,0 +1,676 @@
+"""
+Utilidades de base de datos para el chat SQL.
+
+`SQLDatabase` refleja el esquema completo al crearse y cada `create_engine`
+abre su propio pool de conexiones, así que construirlos en cada rerun es caro
+con bases de datos grandes. Este módulo mantiene un registro de engines y de
+`SQLDatabase` por huella de conexión, con pools configurados para conexiones
+de larga duración, y guarda en caché la información de esquema hasta que se
+invalida explícitamente. Los resultados de las consultas de lectura que lanza
+el agente se memorizan con TTL y límites de tamaño.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import SQLAlchemyError
+
+from langchain_community.utilities.sql_database import SQLDatabase
+
+from .schema_digest import SchemaDigest
+
+logger = logging.getLogger(__name__)
+
+# Máximo de bases de datos abiertas a la vez (las menos usadas se cierran)
+MAX_ENGINES = 16
+# Pool para servidores (MySQL, PostgreSQL...)
+SERVER_POOL_SETTINGS = {
+    "pool_size": 5,
+    "max_overflow": 5,
+    "pool_timeout": 30,
+    # Comprobar la conexión antes de usarla y renovarla antes de que el servidor la cierre
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+
+# Caché de resultados de consultas de solo lectura
+QUERY_CACHE_TTL = 300
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# Resultados más grandes no se guardan en caché
+QUERY_CACHE_MAX_RESULT_BYTES = 512 * 1024
+
+# Ejecución protegida de las consultas generadas por el agente
+DEFAULT_MAX_ROWS = 100
+DEFAULT_MAX_RESULT_BYTES = 32 * 1024
+DEFAULT_STATEMENT_TIMEOUT = 15
+# Filas examinadas (MySQL) o coste (PostgreSQL) estimados por EXPLAIN a partir de los que se rechaza la consulta
+MAX_ESTIMATED_ROWS = 50_000_000
+MAX_ESTIMATED_COST = 10_000_000
+FETCH_BATCH_SIZE = 200
+# Dialectos que admiten "LIMIT n" al final de la consulta
+_LIMIT_DIALECTS = {"sqlite", "mysql", "mariadb", "postgresql"}
+
+# Literales de texto e identificadores entre comillas (se conservan tal cual)
+_SQL_QUOTED_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`)")
+_SQL_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_LIMIT_RE = re.compile(r"\blimit\s+\d+(\s*(,|offset)\s*\d+)?\s*$")
+_READ_ONLY_START = {"select", "with", "show", "describe", "desc", "explain"}
+# Las llamadas a función con el mismo nombre (REPLACE(...), LOAD(...)) no cuentan
+_WRITE_KEYWORDS_RE = re.compile(
+    r"\b(insert|update|delete|merge|replace|upsert|create|alter|drop|truncate|rename|grant|revoke|"
+    r"into|lock|call|exec|execute|set|copy|load|attach|detach|vacuum|pragma|handler)\b(?!\s*\()"
+    r"|\bfor\s+update\b|\bfor\s+share\b"
+)
+# Funciones cuyo resultado cambia entre ejecuciones
+_VOLATILE_RE = re.compile(
+    r"\b(now|rand|random|uuid|sysdate|current_timestamp|current_date|current_time|"
+    r"localtime|localtimestamp|last_insert_id|connection_id|sleep|benchmark)\b"
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normaliza una sentencia SQL para usarla como clave de caché.
+
+    Elimina comentarios y el punto y coma final, y unifica espacios y mayúsculas
+    fuera de los literales, que se conservan sin cambios.
+    """
+    parts = _SQL_QUOTED_RE.split(sql or "")
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            normalized.append(part)
+        else:
+            part = _SQL_COMMENT_RE.sub(" ", part)
+            normalized.append(_WHITESPACE_RE.sub(" ", part).casefold())
+    return "".join(normalized).strip().rstrip(";").strip()
+
+
+def _sql_without_literals(normalized_sql: str) -> str:
+    return _SQL_QUOTED_RE.sub("''", normalized_sql)
+
+
+def is_single_query(sql: str) -> bool:
+    """
+    Indica si la sentencia es una única consulta (SELECT, WITH, SHOW, EXPLAIN...).
+
+    Solo se mira el tipo de la sentencia, de modo que las consultas que usan
+    funciones o columnas con nombres como `replace` o `set` siguen pasando por
+    la ejecución protegida (límites, timeout, cancelación y EXPLAIN).
+    """
+    bare = _sql_without_literals(normalize_sql(sql))
+    if not bare or ";" in bare:
+        return False
+    return bare.split(" ", 1)[0].lstrip("(") in _READ_ONLY_START
+
+
+def is_read_only_sql(sql: str) -> bool:
+    """
+    Indica si una sentencia es una única consulta de lectura.
+
+    Es una comprobación conservadora para decidir si el resultado puede
+    guardarse en caché: ante la duda se considera que la sentencia puede
+    modificar datos. Los literales y los identificadores entre comillas no se
+    examinan y las llamadas a función (`REPLACE(...)`) no cuentan como escritura.
+    """
+    if not is_single_query(sql):
+        return False
+    return _WRITE_KEYWORDS_RE.search(_sql_without_literals(normalize_sql(sql))) is None
+
+
+def is_cacheable_sql(sql: str) -> bool:
+    """Indica si el resultado de una consulta puede reutilizarse (lectura y determinista)."""
+    return is_read_only_sql(sql) and _VOLATILE_RE.search(_sql_without_literals(normalize_sql(sql))) is None
+
+
+class QueryResultCache:
+    """
+    Caché LRU de resultados de consultas con TTL y límite de tamaño.
+
+    Las claves combinan la huella de la base de datos y la consulta normalizada,
+    de modo que consultas equivalentes del agente (en la misma pregunta o en
+    preguntas de seguimiento) se responden sin volver a la base de datos.
+
+    Args:
+        ttl (int): Segundos de validez de un resultado
+        max_entries (int): Máximo de resultados guardados
+        max_bytes (int): Tamaño máximo total de los resultados
+    """
+
+    def __init__(self, ttl: int = QUERY_CACHE_TTL, max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+                 max_bytes: int = QUERY_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # clave -> (instante, tamaño, resultado)
+        self._entries: "OrderedDict[Tuple, Tuple[float, int, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(fingerprint: str, sql: str, *extra: Any) -> Tuple:
+        return (fingerprint, normalize_sql(sql)) + tuple(repr(value) for value in extra)
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key: Tuple, result: str) -> None:
+        size = len(result.encode("utf-8"))
+        if size > QUERY_CACHE_MAX_RESULT_BYTES:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time(), size, result)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, fingerprint: Optional[str] = None) -> None:
+        """Descarta los resultados de una base de datos (o todos)."""
+        with self._lock:
+            for key in [key for key in self._entries if fingerprint is None or key[0] == fingerprint]:
+                self._remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+_query_cache = QueryResultCache()
+
+
+def get_query_cache() -> QueryResultCache:
+    """Devuelve la caché de resultados de consultas compartida por el proceso."""
+    return _query_cache
+
+
+class QueryGuardError(SQLAlchemyError):
+    """Consulta rechazada o interrumpida por los límites de ejecución."""
+
+
+class StatementCancelScope:
+    """
+    Sentencias SQL en curso de una ejecución, para poder cancelarlas desde otro hilo.
+
+    `CachedSQLDatabase` registra cada sentencia en el ámbito activo (ver
+    `statement_cancel_scope`) y `cancel()` interrumpe las que siguen en curso.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._cancellers: Dict[int, Callable[[], None]] = {}
+        self._next_token = 0
+        self._lock = threading.Lock()
+
+    def register(self, canceller: Optional[Callable[[], None]]) -> Optional[int]:
+        """Registra la función que cancela una sentencia; falla si el ámbito ya está cancelado."""
+        with self._lock:
+            if self.cancelled:
+                raise QueryGuardError("La consulta fue cancelada por el usuario.")
+            if canceller is None:
+                return None
+            self._next_token += 1
+            self._cancellers[self._next_token] = canceller
+            return self._next_token
+
+    def unregister(self, token: Optional[int]) -> None:
+        with self._lock:
+            self._cancellers.pop(token, None)
+
+    def cancel(self) -> None:
+        """Marca el ámbito como cancelado e interrumpe las sentencias en curso."""
+        with self._lock:
+            self.cancelled = True
+            cancellers = list(self._cancellers.values())
+        for canceller in cancellers:
+            try:
+                canceller()
+            except Exception as e:
+                logger.warning(f"No se pudo cancelar la sentencia en curso: {str(e)}")
+
+
+_cancel_scope: ContextVar[Optional[StatementCancelScope]] = ContextVar("sql_cancel_scope", default=None)
+
+
+@contextmanager
+def statement_cancel_scope(scope: StatementCancelScope):
+    """Asocia las sentencias ejecutadas dentro del bloque (en este hilo) al ámbito de cancelación."""
+    token = _cancel_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _cancel_scope.reset(token)
+
+
+def connection_fingerprint(url: str, extra: str = "") -> str:
+    """
+    Calcula la huella de una conexión sin exponer la contraseña.
+
+    Args:
+        url (str): URL de SQLAlchemy (con credenciales)
+        extra (str): Datos adicionales que distinguen la conexión
+
+    Returns:
+        str: Huella hexadecimal corta
+    """
+    rendered = make_url(url).render_as_string(hide_password=False)
+    return hashlib.sha256(f"{rendered}|{extra}".encode("utf-8")).hexdigest()[:16]
+
+
+class CachedSQLDatabase(SQLDatabase):
+    """
+    `SQLDatabase` con caché de esquema y de resultados y ejecución protegida.
+
+    La reflexión de tablas es perezosa: solo se reflejan las tablas que el agente
+    consulta, y cada combinación de tablas se describe una sola vez. Las consultas
+    de lectura se leen por lotes con cursores del lado del servidor, con límite de
+    filas, de bytes y de tiempo, y el modelo recibe una vista previa truncada.
+
+    Args:
+        fingerprint (str): Huella de la conexión
+        max_rows (int): Filas máximas devueltas al modelo
+        max_result_bytes (int): Tamaño máximo aproximado del resultado
+        statement_timeout (float): Segundos máximos por consulta (0 = sin límite)
+        explain_precheck (bool): Estimar el coste con EXPLAIN antes de ejecutar
+    """
+
+    def __init__(self, *args, fingerprint: str = "", max_rows: int = DEFAULT_MAX_ROWS,
+                 max_result_bytes: int = DEFAULT_MAX_RESULT_BYTES,
+                 statement_timeout: float = DEFAULT_STATEMENT_TIMEOUT,
+                 explain_precheck: bool = True, **kwargs):
+        kwargs.setdefault("lazy_table_reflection", True)
+        super().__init__(*args, **kwargs)
+        self.fingerprint = fingerprint
+        self.max_rows = max_rows
+        self.max_result_bytes = max_result_bytes
+        self.statement_timeout = statement_timeout
+        self.explain_precheck = explain_precheck
+        self._table_info_cache: Dict[Any, str] = {}
+        self._schema_digest: Optional[SchemaDigest] = None
+        self._cache_lock = threading.Lock()
+        # Información de truncado de la última consulta de cada hilo
+        self._guard_state = threading.local()
+
+    def get_table_info(self, table_names: Optional[List[str]] = None, get_col_comments: bool = False) -> str:
+        key = (tuple(sorted(table_names)) if table_names else None, get_col_comments)
+        with self._cache_lock:
+            cached = self._table_info_cache.get(key)
+        if cached is not None:
+            return cached
+
+        info = super().get_table_info(table_names, get_col_comments=get_col_comments)
+        with self._cache_lock:
+            self._table_info_cache[key] = info
+        return info
+
+    def get_schema_digest(self) -> SchemaDigest:
+        """Devuelve el resumen compacto del esquema, que se construye una sola vez."""
+        digest = self._schema_digest
+        if digest is None:
+            digest = SchemaDigest.from_engine(self._engine, self.get_usable_table_names(), schema=self._schema)
+            with self._cache_lock:
+                self._schema_digest = digest
+        return digest
+
+    def run(self, command, fetch="all", include_columns=False, *, parameters=None, execution_options=None):
+        # Solo se memorizan las consultas de lectura deterministas en texto
+        cacheable = isinstance(command, str) and fetch != "cursor" and is_cacheable_sql(command)
+        if not cacheable:
+            return self._run_with_preview(command, fetch, include_columns, parameters, execution_options)
+
+        cache = get_query_cache()
+        key = cache.make_key(self.fingerprint, command, fetch, include_columns, parameters)
+        result = cache.get(key)
+        if result is None:
+            result = self._run_with_preview(command, fetch, include_columns, parameters, execution_options)
+            if isinstance(result, str):
+                cache.set(key, result)
+        return result
+
+    def _run_with_preview(self, command, fetch, include_columns, parameters, execution_options):
+        """Ejecuta la consulta y, si el resultado se truncó, lo indica al modelo."""
+        self._guard_state.truncated_at = None
+        result = super().run(command, fetch, include_columns,
+                             parameters=parameters, execution_options=execution_options)
+        truncated_at = getattr(self._guard_state, "truncated_at", None)
+        if truncated_at is not None and isinstance(result, str):
+            result += (
+                f"\n\n[Vista previa: se muestran solo las primeras {truncated_at} filas; el resultado "
+                f"completo es mayor. Usa filtros (WHERE), agregaciones o un LIMIT menor para acotarlo.]"
+            )
+        return result
+
+    def _execute(self, command, fetch="all", *, parameters=None, execution_options=None):
+        # Las sentencias que no son consultas siguen el camino original. Con un
+        # esquema configurado, SQLDatabase lo fija por sesión (USE, SET search_path...)
+        # y ese cambio persistiría en la conexión del pool; solo PostgreSQL admite
+        # fijarlo para la transacción (SET LOCAL), así que los demás no se protegen
+        guarded = (
+            isinstance(command, str)
+            and fetch in ("all", "one")
+            and (self._schema is None or self.dialect == "postgresql")
+            and is_single_query(command)
+        )
+        if not guarded:
+            return super()._execute(command, fetch, parameters=parameters, execution_options=execution_options)
+
+        sql = self._with_row_limit(command)
+        options = dict(execution_options or {}, stream_results=True, max_row_buffer=FETCH_BATCH_SIZE)
+        max_rows = 1 if fetch == "one" else self.max_rows
+        rows: List[Dict[str, Any]] = []
+        size = 0
+
+        scope = _cancel_scope.get()
+        cancel_token = None
+        started = time.monotonic()
+        try:
+            with self._engine.connect() as connection:
+                if scope is not None:
+                    cancel_token = scope.register(self._statement_canceller(connection))
+                if self._schema is not None:
+                    connection.exec_driver_sql("SET LOCAL search_path TO %s", (self._schema,))
+                with self._statement_timeout(connection):
+                    if self.explain_precheck:
+                        self._check_estimated_cost(connection, sql, parameters)
+                    # stream_results usa un cursor del lado del servidor: las filas se leen por lotes
+                    result = connection.execute(text(sql), parameters or {}, execution_options=options)
+                    try:
+                        for row in (result if result.returns_rows else ()):
+                            record = row._asdict()
+                            size += len(repr(record))
+                            if len(rows) >= max_rows or (rows and size > self.max_result_bytes):
+                                if fetch == "all":
+                                    self._guard_state.truncated_at = len(rows)
+                                break
+                            rows.append(record)
+                    finally:
+                        result.close()
+                if not is_read_only_sql(command):
+                    # Consultas que escriben (WITH ... DELETE ... RETURNING): se confirman
+                    # como en SQLDatabase._execute
+                    connection.commit()
+        except QueryGuardError:
+            raise
+        except SQLAlchemyError as e:
+            if scope is not None and scope.cancelled:
+                raise QueryGuardError("La consulta fue cancelada por el usuario.") from e
+            if self.statement_timeout and time.monotonic() - started >= self.statement_timeout:
+                raise QueryGuardError(
+                    f"La consulta se canceló al superar el tiempo máximo de {self.statement_timeout} s. "
+                    f"Simplifícala o añade filtros."
+                ) from e
+            raise
+        finally:
+            if cancel_token is not None:
+                scope.unregister(cancel_token)
+        return rows
+
+    def _statement_canceller(self, connection) -> Optional[Callable[[], None]]:
+        """
+        Devuelve una función que cancela, desde otro hilo, la sentencia en curso en la conexión.
+
+        SQLite se interrumpe directamente; MySQL y PostgreSQL necesitan una
+        segunda conexión que envíe KILL QUERY / pg_cancel_backend.
+        """
+        if self.dialect == "sqlite":
+            return connection.connection.dbapi_connection.interrupt
+        if self.dialect in ("mysql", "mariadb"):
+            connection_id = int(connection.exec_driver_sql("SELECT CONNECTION_ID()").scalar())
+            return lambda: self._send_cancel(f"KILL QUERY {connection_id}")
+        if self.dialect == "postgresql":
+            backend_pid = int(connection.exec_driver_sql("SELECT pg_backend_pid()").scalar())
+            return lambda: self._send_cancel(f"SELECT pg_cancel_backend({backend_pid})")
+        return None
+
+    def _send_cancel(self, statement: str) -> None:
+        with self._engine.connect() as connection:
+            connection.exec_driver_sql(statement)
+        logger.info(f"Sentencia cancelada en {self.dialect}: {statement}")
+
+    def _with_row_limit(self, sql: str) -> str:
+        """Añade un LIMIT a las consultas SELECT que no lo tienen para no leer filas de más."""
+        if self.dialect not in _LIMIT_DIALECTS:
+            return sql
+        bare = _sql_without_literals(normalize_sql(sql))
+        if bare.split(" ", 1)[0] not in ("select", "with") or _TRAILING_LIMIT_RE.search(bare):
+            return sql
+        # El salto de línea evita que un comentario final anule el LIMIT
+        return f"{sql.rstrip().rstrip(';')}\nLIMIT {self.max_rows + 1}"
+
+    @contextmanager
+    def _statement_timeout(self, connection):
+        """Aplica el tiempo máximo de ejecución según el dialecto."""
+        if not self.statement_timeout:
+            yield
+            return
+
+        timeout_ms = int(self.statement_timeout * 1000)
+        if self.dialect == "sqlite":
+            # SQLite no tiene timeout por sentencia: interrumpir desde el progress handler
+            raw_connection = connection.connection.dbapi_connection
+            deadline = time.monotonic() + self.statement_timeout
+            raw_connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+            try:
+                yield
+            finally:
+                raw_connection.set_progress_handler(None, 0)
+            return
+
+        if self.dialect in ("mysql", "mariadb"):
+            # La variable es de sesión: se restaura al terminar para que no la hereden
+            # otras consultas que reciban esta conexión del pool
+            variable = None
+            try:
+                connection.exec_driver_sql(f"SET SESSION max_execution_time = {timeout_ms}")
+                variable = "max_execution_time"
+            except SQLAlchemyError:
+                # MariaDB usa otra variable (en segundos)
+                try:
+                    connection.exec_driver_sql(f"SET SESSION max_statement_time = {self.statement_timeout}")
+                    variable = "max_statement_time"
+                except SQLAlchemyError as e:
+                    logger.debug(f"No se pudo fijar el timeout de MySQL: {str(e)}")
+            try:
+                yield
+            finally:
+                if variable is not None:
+                    try:
+                        connection.exec_driver_sql(f"SET SESSION {variable} = DEFAULT")
+                    except SQLAlchemyError as e:
+                        # Conexión inservible (p. ej., tras KILL): se invalida para no devolverla al pool
+                        logger.debug(f"No se pudo restaurar {variable}: {str(e)}")
+                        connection.invalidate()
+            return
+
+        if self.dialect == "postgresql":
+            # SET LOCAL se descarta al terminar la transacción
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+        yield
+
+    def _check_estimated_cost(self, connection, sql: str, parameters: Optional[Dict[str, Any]]) -> None:
+        """Rechaza la consulta si EXPLAIN estima un coste desproporcionado."""
+        if self.dialect not in ("mysql", "mariadb", "postgresql"):
+            return
+        try:
+            # SAVEPOINT: en PostgreSQL un EXPLAIN fallido abortaría la transacción
+            # abierta por `SET LOCAL statement_timeout` y, con ella, la consulta
+            with connection.begin_nested():
+                if self.dialect == "postgresql":
+                    plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), parameters or {}).scalar()
+                else:
+                    plan = connection.execute(text(f"EXPLAIN {sql}"), parameters or {}).mappings().all()
+            if self.dialect == "postgresql":
+                plan = plan[0]["Plan"] if isinstance(plan, list) else plan["Plan"]
+                estimate = float(plan.get("Total Cost") or 0)
+                limit, unit = MAX_ESTIMATED_COST, "de coste estimado"
+            else:
+                estimate = 1
+                for step in plan:
+                    estimate *= max(int(step.get("rows") or 1), 1)
+                limit, unit = MAX_ESTIMATED_ROWS, "filas examinadas"
+        except SQLAlchemyError as e:
+            # Si EXPLAIN falla, la propia consulta mostrará el error
+            logger.debug(f"EXPLAIN no disponible para la consulta: {str(e)}")
+            return
+
+        if estimate > limit:
+            raise QueryGuardError(
+                f"La consulta es demasiado costosa (unas {estimate:,.0f} {unit}, máximo {limit:,}). "
+                f"Añade filtros (WHERE), usa agregaciones o consulta menos tablas."
+            )
+
+    def invalidate_schema(self) -> None:
+        """
+        Descarta el esquema reflejado, la información de tablas y los resultados en caché.
+
+        La lista de tablas se vuelve a leer, de modo que aparecen las creadas
+        después de conectar, sin cerrar el engine que comparten otras sesiones.
+        """
+        inspector = inspect(self._engine)
+        all_tables = set(inspector.get_table_names(schema=self._schema))
+        if self._view_support:
+            all_tables.update(inspector.get_view_names(schema=self._schema))
+            all_tables.update(inspector.get_materialized_view_names(schema=self._schema))
+        with self._cache_lock:
+            self._inspector = inspector
+            self._all_tables = all_tables
+            usable_tables = self.get_usable_table_names()
+            self._usable_tables = set(usable_tables) if usable_tables else all_tables
+            self._table_info_cache.clear()
+            self._schema_digest = None
+            self._metadata.clear()
+        get_query_cache().invalidate(self.fingerprint)
+
+
+class SQLDatabaseRegistry:
+    """
+    Registro de engines y `SQLDatabase` indexados por huella de conexión.
+
+    Args:
+        max_engines (int): Conexiones abiertas a la vez antes de cerrar la menos usada
+    """
+
+    def __init__(self, max_engines: int = MAX_ENGINES):
+        self.max_engines = max_engines
+        self._databases: "OrderedDict[str, CachedSQLDatabase]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_database(self, url: str, creator: Optional[Callable[[], Any]] = None,
+                     fingerprint_extra: str = "", **database_kwargs) -> CachedSQLDatabase:
+        """
+        Devuelve la base de datos de la conexión, creando el engine solo la primera vez.
+
+        Args:
+            url (str): URL de SQLAlchemy
+            creator (callable, optional): Función que abre la conexión DBAPI
+            fingerprint_extra (str): Datos adicionales para la huella (p. ej. modo de apertura)
+            **database_kwargs: Argumentos adicionales para `SQLDatabase`
+
+        Returns:
+            CachedSQLDatabase: Base de datos lista para el agente
+        """
+        fingerprint = connection_fingerprint(url, fingerprint_extra)
+        with self._lock:
+            db = self._databases.get(fingerprint)
+            if db is not None:
+                self._databases.move_to_end(fingerprint)
+                return db
+
+        engine = self._create_engine(url, creator)
+        try:
+            db = CachedSQLDatabase(engine, fingerprint=fingerprint, **database_kwargs)
+        except Exception:
+            engine.dispose()
+            raise
+
+        with self._lock:
+            existing = self._databases.get(fingerprint)
+            if existing is not None:
+                # Otra sesión la creó mientras tanto
+                engine.dispose()
+                return existing
+            self._databases[fingerprint] = db
+            while len(self._databases) > self.max_engines:
+                _, evicted = self._databases.popitem(last=False)
+                evicted._engine.dispose()
+        return db
+
+    @staticmethod
+    def _create_engine(url: str, creator: Optional[Callable[[], Any]] = None) -> Engine:
+        kwargs: Dict[str, Any] = {}
+        if creator is not None:
+            kwargs["creator"] = creator
+        if not make_url(url).get_backend_name().startswith("sqlite"):
+            kwargs.update(SERVER_POOL_SETTINGS)
+        logger.info(f"Creando engine SQL para {make_url(url).render_as_string(hide_password=True)}")
+        return create_engine(url, **kwargs)
+
+    def invalidate(self, fingerprint: Optional[str] = None, dispose: bool = False) -> None:
+        """
+        Invalida el esquema en caché de una base de datos (o de todas).
+
+        Args:
+            fingerprint (str, optional): Huella de la conexión; None para todas
+            dispose (bool): Cerrar también el engine y olvidar la conexión
+        """
+        with self._lock:
+            if fingerprint is None:
+                targets = list(self._databases.items())
+            elif fingerprint in self._databases:
+                targets = [(fingerprint, self._databases[fingerprint])]
+            else:
+                targets = []
+            for key, db in targets:
+                if dispose:
+                    self._databases.pop(key, None)
+                    db._engine.dispose()
+                    get_query_cache().invalidate(key)
+                else:
+                    db.invalidate_schema()
+
+
+_registry: Optional[SQLDatabaseRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_sql_registry() -> SQLDatabaseRegistry:
+    """Devuelve el registro de bases de datos compartido por el proceso."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SQLDatabaseRegistry()
+    return _registry
+
+
+def get_sql_database(url: str, creator: Optional[Callable[[], Any]] = None,
+                     fingerprint_extra: str = "", **database_kwargs) -> CachedSQLDatabase:
+    """Atajo para `get_sql_registry().get_database(...)`."""
+    return get_sql_registry().get_database(url, creator, fingerprint_extra, **database_kwargs)
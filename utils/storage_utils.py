@@ -0,0 +1,57 @@
+"""
+Utilidades de almacenamiento local (directorio de caché y conexiones SQLite).
+"""
+
+import os
+import sqlite3
+from typing import Optional
+
+# Directorio raíz del proyecto (un nivel por encima de utils/)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_cache_dir(*parts: str) -> str:
+    """
+    Devuelve (y crea si no existe) un directorio dentro de la caché local de OmniChat.
+
+    La ubicación puede cambiarse con la variable de entorno `OMNICHAT_CACHE_DIR`.
+
+    Args:
+        *parts (str): Subdirectorios opcionales dentro de la caché
+
+    Returns:
+        str: Ruta absoluta del directorio
+    """
+    base_dir = os.environ.get("OMNICHAT_CACHE_DIR") or os.path.join(PROJECT_ROOT, ".cache")
+    path = os.path.join(base_dir, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def connect_sqlite(db_path: str, timeout: Optional[float] = 30.0) -> sqlite3.Connection:
+    """
+    Abre una conexión SQLite apta para compartirse entre los hilos de Streamlit.
+
+    Se activa el modo WAL para que las lecturas no bloqueen a las escrituras.
+    El llamador sigue siendo responsable de serializar el acceso con un lock.
+
+    Args:
+        db_path (str): Ruta del archivo de base de datos
+        timeout (float, optional): Segundos de espera ante bloqueos
+
+    Returns:
+        sqlite3.Connection: Conexión abierta
+    """
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    except sqlite3.DatabaseError:
+        # Algunos sistemas de archivos (p. ej. montajes de red) no admiten WAL
+        pass
+    return conn
@@ -0,0 +1,195 @@
+"""
+Memoria de conversación con presupuesto de tokens para `ConversationChain`.
+
+Los turnos recientes se conservan literalmente mientras quepan en el presupuesto.
+Los turnos que salen de esa ventana se resumen de forma incremental en segundo
+plano, de modo que el usuario no espera al resumen y el historial enviado al
+modelo en cada turno queda acotado a `max_token_limit` tokens.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from .token_utils import count_tokens, truncate_to_tokens
+
+try:
+    from langchain_core.memory import BaseMemory
+except ImportError:
+    from langchain.schema import BaseMemory
+
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TOKEN_LIMIT = 2000
+DEFAULT_SUMMARY_TOKEN_LIMIT = 400
+
+SUMMARY_PROMPT = """Resume de forma progresiva la conversación entre un usuario y un asistente, \
+añadiendo al resumen actual la información de las nuevas líneas. Conserva nombres, datos, \
+preferencias y decisiones que puedan necesitarse más adelante. Responde solo con el resumen, \
+en el idioma de la conversación y en menos de {max_words} palabras.
+
+Resumen actual:
+{summary}
+
+Nuevas líneas de la conversación:
+{new_lines}
+
+Nuevo resumen:"""
+
+SUMMARY_HEADER = "Resumen de la conversación anterior:\n"
+# Separador entre el resumen y los turnos en el historial
+TURN_SEPARATOR = "\n"
+
+# Hilos compartidos por todas las memorias del proceso para resumir en segundo plano.
+# Con uno solo, el resumen lento de un usuario retrasaría el de los demás; cada
+# memoria resume de uno en uno (`_summarizing`), así que varias no se pisan.
+SUMMARY_WORKERS = 3
+_summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="memory-summary")
+
+
+def _format_turn(human: str, ai: str, human_prefix: str, ai_prefix: str) -> str:
+    return f"{human_prefix}: {human}\n{ai_prefix}: {ai}"
+
+
+def _render_history(summary: str, turns: List[str]) -> str:
+    parts = [f"{SUMMARY_HEADER}{summary}"] if summary else []
+    parts.extend(turns)
+    return TURN_SEPARATOR.join(parts)
+
+
+class TokenBudgetMemory(BaseMemory):
+    """
+    Memoria con ventana de turnos recientes y resumen incremental de los antiguos.
+
+    Attributes:
+        llm: Modelo usado para resumir (normalmente el mismo del chat)
+        max_token_limit (int): Tokens máximos del historial incluido en el prompt
+            (resumen, encabezado y separadores incluidos)
+        summary_token_limit (int): Tokens reservados para el resumen
+        memory_key (str): Variable del prompt donde se inserta el historial
+    """
+
+    llm: Any
+    max_token_limit: int = DEFAULT_MAX_TOKEN_LIMIT
+    summary_token_limit: int = DEFAULT_SUMMARY_TOKEN_LIMIT
+    memory_key: str = "history"
+    input_key: str = "input"
+    output_key: str = "response"
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    # Turnos como (texto formateado, tokens)
+    _recent: List[Tuple[str, int]] = PrivateAttr(default_factory=list)
+    _pending: List[Tuple[str, int]] = PrivateAttr(default_factory=list)
+    _summary: str = PrivateAttr(default="")
+    _summary_tokens: int = PrivateAttr(default=0)
+    _summarizing: bool = PrivateAttr(default=False)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def buffer_token_limit(self) -> int:
+        """Tokens disponibles para los turnos literales."""
+        return max(self.max_token_limit - self.summary_token_limit, 0)
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        separator_tokens = count_tokens(TURN_SEPARATOR)
+        with self._lock:
+            summary = self._summary
+            budget = self.max_token_limit
+            if summary:
+                budget -= self._summary_tokens + count_tokens(SUMMARY_HEADER) + separator_tokens
+            # Los turnos recientes tienen prioridad; los pendientes de resumir solo
+            # se incluyen, de más nuevo a más antiguo, si aún queda presupuesto
+            turns = []
+            for text, tokens in reversed(self._pending + self._recent):
+                if tokens + separator_tokens > budget:
+                    break
+                turns.append(text)
+                budget -= tokens + separator_tokens
+            turns.reverse()
+
+        history = _render_history(summary, turns)
+        # Contar por partes puede diferir en algún token del texto unido: se
+        # comprueba el total y se descartan turnos antiguos hasta que quepa
+        while turns and count_tokens(history) > self.max_token_limit:
+            turns.pop(0)
+            history = _render_history(summary, turns)
+        if count_tokens(history) > self.max_token_limit:
+            history = truncate_to_tokens(history, self.max_token_limit)
+        return {self.memory_key: history}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        human = inputs.get(self.input_key) or next(iter(inputs.values()), "")
+        ai = outputs.get(self.output_key) or next(iter(outputs.values()), "")
+        text = _format_turn(human, ai, self.human_prefix, self.ai_prefix)
+
+        with self._lock:
+            self._recent.append((text, count_tokens(text)))
+            recent_tokens = sum(tokens for _, tokens in self._recent)
+            # Mover a la cola de resumen los turnos que ya no caben en la ventana,
+            # conservando siempre el último turno
+            while recent_tokens > self.buffer_token_limit and len(self._recent) > 1:
+                evicted = self._recent.pop(0)
+                self._pending.append(evicted)
+                recent_tokens -= evicted[1]
+            should_summarize = bool(self._pending) and not self._summarizing
+            if should_summarize:
+                self._summarizing = True
+
+        if should_summarize:
+            _summary_executor.submit(self._summarize_pending)
+
+    def _summarize_pending(self) -> None:
+        """Integra en el resumen los turnos pendientes (se ejecuta en segundo plano)."""
+        try:
+            while True:
+                with self._lock:
+                    batch = list(self._pending)
+                    summary = self._summary
+                if not batch:
+                    return
+
+                prompt = SUMMARY_PROMPT.format(
+                    max_words=int(self.summary_token_limit * 0.6),
+                    summary=summary or "(vacío)",
+                    new_lines="\n".join(text for text, _ in batch),
+                )
+                result = self.llm.invoke(prompt)
+                new_summary = getattr(result, "content", result)
+                new_summary = truncate_to_tokens(str(new_summary).strip(), self.summary_token_limit)
+
+                with self._lock:
+                    # Durante el resumen pudieron llegar más turnos pendientes
+                    del self._pending[:len(batch)]
+                    self._summary = new_summary
+                    self._summary_tokens = count_tokens(new_summary)
+        except Exception as e:
+            # Los turnos siguen pendientes y se reintentan en el próximo turno
+            logger.warning(f"No se pudo resumir el historial de la conversación: {str(e)}")
+        finally:
+            with self._lock:
+                self._summarizing = False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self._pending.clear()
+            self._summary = ""
+            self._summary_tokens = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve el tamaño actual de la memoria para mostrarlo en la interfaz."""
+        with self._lock:
+            return {
+                "recent_turns": len(self._recent),
+                "pending_turns": len(self._pending),
+                "summary_tokens": self._summary_tokens,
+                "history_tokens": self._summary_tokens + sum(tokens for _, tokens in self._recent),
+            }
@@ -0,0 +1,81 @@
+"""
+Conteo local y rápido de tokens para presupuestar el tamaño de los prompts.
+
+Usa el codificador `cl100k_base` de tiktoken (dependencia de langchain_openai)
+cuando está disponible. Si no lo está, recurre a una estimación por caracteres,
+suficiente para aplicar límites aproximados. Los conteos se memorizan porque los
+mismos mensajes se cuentan en cada turno de la conversación.
+"""
+
+import logging
+import math
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Caracteres por token en la estimación de respaldo (conservadora para español)
+CHARS_PER_TOKEN = 3.5
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Carga el codificador de tiktoken una sola vez por proceso."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.info(f"tiktoken no disponible, se estimarán los tokens por caracteres: {str(e)}")
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """
+    Cuenta los tokens de un texto.
+
+    Args:
+        text (str): Texto a medir
+
+    Returns:
+        int: Número de tokens (estimado si tiktoken no está disponible)
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """
+    Recorta un texto para que no supere `max_tokens`.
+
+    Args:
+        text (str): Texto a recortar
+        max_tokens (int): Máximo de tokens permitidos
+        keep_end (bool): Conservar el final del texto en lugar del principio
+
+    Returns:
+        str: Texto recortado
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        tokens = tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+        return encoding.decode(tokens)
+
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    return text[-max_chars:] if keep_end else text[:max_chars]